@@ -124,7 +124,7 @@ async function postFeedback(req, res) {
 function getAiHealth(req, res) {
   const env = process.env;
   res.json({
-    freshness_image: !!(env.FRESHNESS_AI_URL || env.FRESHNESS_TFLITE_URL || env.FRESHNESS_FRESHVISION_URL || env.FRESHNESS_ROBOFLOW_URL),
+    freshness_image: !!(env.FRESHNESS_GATEWAY_URL || env.FRESHNESS_AI_URL || env.FRESHNESS_TFLITE_URL || env.FRESHNESS_FRESHVISION_URL || env.FRESHNESS_ROBOFLOW_URL),
     freshness_env: !!env.FRESHNESS_ENV_AI_URL,
     demand_prediction: true,
     feedback_enabled: true,
@@ -330,10 +330,11 @@ class FoodQualityVerification {
   }
 
   /**
-   * Call image-based freshness API (Bedrock, TFLite, Roboflow, FreshVision, or fruit-veg-freshness-ai when set).
+   * Call image-based freshness API (Bedrock, freshness gateway, TFLite, Roboflow, FreshVision, or fruit-veg-freshness-ai when set).
    * Returns frontend-shaped assessment: { qualityScore, freshness, status, notes, analysis }.
    */
   static async assessFreshnessForFrontend(photoPath) {
+    const gatewayUrl = (process.env.FRESHNESS_GATEWAY_URL || '').replace(/\/$/, '');
     const tfliteUrl = (process.env.FRESHNESS_TFLITE_URL || '').replace(/\/$/, '');
     const roboflowUrl = (process.env.FRESHNESS_ROBOFLOW_URL || '').replace(/\/$/, '');
     const freshvisionUrl = (process.env.FRESHNESS_FRESHVISION_URL || '').replace(/\/$/, '');
@@ -356,6 +357,31 @@ class FoodQualityVerification {
     const formHeaders = form.getHeaders();
     const postOpts = { headers: formHeaders, maxBodyLength: Infinity, timeout: 30000 };
 
+    if (gatewayUrl) {
+      try {
+        // All image models in one call; the combined verdict is fresh / mixed / rotten
+        const formGw = new FormData();
+        formGw.append('file', fs.createReadStream(photoPath), {
+          filename: photoPath.split(/[/\\]/).pop() || 'image.png',
+          contentType: 'image/png',
+        });
+        const { data } = await axios.post(`${gatewayUrl}/evaluate`, formGw, {
+          headers: formGw.getHeaders(),
+          maxBodyLength: Infinity,
+          timeout: 30000,
+        });
+        if (data.classification) {
+          const classification = data.classification.toLowerCase();
+          const qualityScore = Math.round(Number(data.freshness_index) || 50);
+          const freshness = classification === 'fresh' ? 'excellent' : classification === 'mixed' ? 'fair' : 'poor';
+          const status = classification === 'rotten' && qualityScore < 60 ? 'rejected' : 'approved';
+          return this.buildFrontendAssessment(qualityScore, freshness, status);
+        }
+      } catch (err) {
+        logger.warn('Freshness gateway failed, trying next:', err.message);
+      }
+    }
+
     if (tfliteUrl) {
       try {
         const { data } = await axios.post(`${tfliteUrl}/evaluate`, form, postOpts);
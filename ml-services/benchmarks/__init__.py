@@ -0,0 +1 @@
+"""Load and latency benchmarks for the ML services (run from ml-services/: python -m benchmarks.run)."""
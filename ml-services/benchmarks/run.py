@@ -0,0 +1,344 @@
+"""
+Load and latency benchmark for the ML services, runnable without the real model weights.
+
+Each selected service is imported in-process with randomly initialized stand-in models of the same
+architecture and input shape (see stand_ins.py), started through its lifespan, and driven over an
+in-process ASGI transport by a closed loop of concurrent clients: every client sends its next request
+as soon as the previous one is answered. Image services get synthetic phone-resolution JPEGs (distinct
+images, result cache off), the analyzer gets random sensor readings. For every service and concurrency
+level it reports throughput and p50/p95/p99 latency, and writes everything as JSON.
+
+With --baseline, results are compared with a stored run: a p95 latency above, or a throughput below,
+the baseline by more than --tolerance is a regression, and the exit status is 1.
+
+Run from ml-services/:
+    python -m benchmarks.run [--services fruit-veg,freshvision] [--concurrency 1,4,16] [--requests 64]
+        [--output results.json] [--baseline baseline.json --tolerance 0.15] [--model-dir DIR]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.stand_ins import BUILDERS, StandInUnavailable
+from ml_common.bench_preprocess import synthetic_jpeg
+from ml_common.services import ML_SERVICES_DIR, load_service_modules
+
+# Phone camera resolutions (12 MP, 8 MP, 1080p video frame size)
+RESOLUTIONS = [(4032, 3024), (3264, 2448), (1920, 1080)]
+
+
+@dataclass
+class ServiceSpec:
+    folder: str
+    stand_ins: list[str]
+    path: str = "/evaluate"
+    # "image" (multipart JPEG upload) or "environment" (JSON reading)
+    payload: str = "image"
+    # Stand-ins the service can run without (the gateway hosts whichever models could be built)
+    optional: list[str] = field(default_factory=list)
+
+
+SERVICES = {
+    "fruit-veg": ServiceSpec("fruit-veg-freshness", ["fruit_veg"]),
+    "tflite": ServiceSpec("freshness-detector-tflite", ["tflite"]),
+    "freshvision": ServiceSpec("freshvision", ["freshvision"]),
+    "food101": ServiceSpec("food-image-recognition", ["food101"]),
+    "roboflow": ServiceSpec("freshness-detection-roboflow", ["detector"]),
+    "gateway": ServiceSpec("freshness-gateway", [], optional=["fruit_veg", "tflite", "freshvision", "food101"]),
+    "gateway-cascade": ServiceSpec(
+        "freshness-gateway", [], path="/evaluate?mode=cascade", optional=["fruit_veg", "tflite", "freshvision"]
+    ),
+    "analyzer": ServiceSpec("food-freshness-analyzer", ["analyzer"], path="/evaluate-environment", payload="environment"),
+}
+
+
+def make_images(count: int, resolutions: list[tuple[int, int]]) -> list[bytes]:
+    """Distinct synthetic JPEGs cycling through the resolutions (distinct, so nothing is a cache hit)."""
+    return [synthetic_jpeg(*resolutions[i % len(resolutions)], seed=i) for i in range(count)]
+
+
+def make_readings(count: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "temperature": round(float(rng.uniform(2, 35)), 2),
+            "humidity": round(float(rng.uniform(30, 90)), 2),
+            "time_stored_hours": round(float(rng.uniform(1, 72)), 2),
+            "gas": round(float(rng.uniform(100, 500)), 2),
+        }
+        for _ in range(count)
+    ]
+
+
+def prepare_service(name: str, spec: ServiceSpec, model_dir: Path) -> tuple[dict, list[str]]:
+    """Build the service's stand-ins; returns (environment, notes). Raises StandInUnavailable."""
+    env, notes = {}, []
+    for stand_in in spec.stand_ins:
+        env.update(BUILDERS[stand_in](model_dir))
+    if spec.optional:
+        hosted = []
+        for stand_in in spec.optional:
+            try:
+                env.update(BUILDERS[stand_in](model_dir))
+                hosted.append(stand_in)
+            except StandInUnavailable as e:
+                notes.append(f"without {stand_in}: {e}")
+        if not hosted:
+            raise StandInUnavailable("no model could be built")
+        env["FRESHNESS_GATEWAY_MODELS"] = ",".join(hosted)
+    return env, notes
+
+
+def percentiles(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+    }
+
+
+async def drive(send, concurrency: int, total: int) -> dict:
+    """Closed loop: concurrency clients, total requests; send(i) returns the HTTP status."""
+    counter = itertools.count()
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+
+    async def client():
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                status = await send(i)
+            except Exception as e:  # noqa: BLE001 - counted, the run goes on
+                status = type(e).__name__
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        **percentiles(latencies),
+    }
+
+
+async def bench_service(name: str, spec: ServiceSpec, args, images: list[bytes], readings: list[dict]) -> dict:
+    app = load_service_modules(spec.folder, "main").main.app
+    # Modules the service imports lazily (e.g. the local detector backend) resolve against its folder
+    service_dir = str(ML_SERVICES_DIR / spec.folder)
+    sys.path.insert(0, service_dir)
+    try:
+        return await _bench_app(name, spec, app, args, images, readings)
+    finally:
+        sys.path.remove(service_dir)
+
+
+async def _bench_app(name: str, spec: ServiceSpec, app, args, images: list[bytes], readings: list[dict]) -> dict:
+    import httpx
+
+    async def send(client, i: int) -> int:
+        if spec.payload == "environment":
+            response = await client.post(spec.path, json=readings[i % len(readings)])
+        else:
+            files = {"file": (f"photo{i}.jpg", images[i % len(images)], "image/jpeg")}
+            response = await client.post(spec.path, files=files)
+        return response.status_code
+
+    levels = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Models load in the background from the lifespan; wait until the service reports ready
+            start = time.perf_counter()
+            while True:
+                response = await client.get("/readyz")
+                if response.status_code == 200:
+                    break
+                states = {model["state"] for model in response.json().get("models", {}).values()}
+                if "failed" in states and not states & {"idle", "loading", "warming"}:
+                    raise RuntimeError(f"not ready: {response.text[:300]}")
+                await asyncio.sleep(0.05)
+            ready_seconds = time.perf_counter() - start
+            # Checks the service answers (and fills any per-shape caches the warm-up did not reach)
+            start = time.perf_counter()
+            for i in range(max(1, args.warmup)):
+                status = await send(client, i)
+                if status != 200:
+                    response = await client.get("/health")
+                    raise RuntimeError(f"warm-up request returned {status}; /health: {response.text[:300]}")
+            warmup_seconds = time.perf_counter() - start
+            for concurrency in args.concurrency:
+                total = max(args.requests, concurrency * 2)
+                levels[str(concurrency)] = await drive(lambda i: send(client, i), concurrency, total)
+                row = levels[str(concurrency)]
+                print(
+                    f"  {name:<12} c={concurrency:<3} {row['throughput_rps']:>8} req/s  p50 {row['p50_ms']:>9} ms  "
+                    f"p95 {row['p95_ms']:>9} ms  p99 {row['p99_ms']:>9} ms  errors {sum(row['errors'].values())}",
+                    file=sys.stderr,
+                )
+    return {"ready_seconds": round(ready_seconds, 3), "warmup_seconds": round(warmup_seconds, 3), "levels": levels}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """Regressions against a stored run: p95 up, or throughput down, by more than tolerance."""
+    regressions = []
+    for service, current in results["services"].items():
+        base_levels = baseline.get("services", {}).get(service, {}).get("levels", {})
+        for level, row in current.get("levels", {}).items():
+            base = base_levels.get(level)
+            if not base:
+                continue
+            checks = [
+                ("p95_ms", row["p95_ms"], base.get("p95_ms"), lambda new, old: new > old * (1 + tolerance)),
+                ("throughput_rps", row["throughput_rps"], base.get("throughput_rps"), lambda new, old: new < old * (1 - tolerance)),
+            ]
+            for metric, new, old, regressed in checks:
+                if new is None or not old:
+                    continue
+                if regressed(new, old):
+                    regressions.append({
+                        "service": service,
+                        "concurrency": int(level),
+                        "metric": metric,
+                        "baseline": old,
+                        "current": new,
+                        "change": round(new / old - 1, 4),
+                    })
+    return regressions
+
+
+def environment_info() -> dict:
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    try:
+        info["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ML_SERVICES_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        info["commit"] = None
+    for package in ("numpy", "onnxruntime", "torch", "tensorflow", "fastapi"):
+        try:
+            info[package] = __import__(package).__version__
+        except ImportError:
+            pass
+    return info
+
+
+def parse_resolutions(value: str) -> list[tuple[int, int]]:
+    return [tuple(int(x) for x in part.lower().split("x")) for part in value.split(",") if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of the ML services with stand-in models.")
+    parser.add_argument("--services", default=",".join(SERVICES), help="Comma-separated (default: all)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Concurrent clients per level (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per level (at least 2 per client)")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed requests before the first level")
+    parser.add_argument("--images", type=int, default=8, help="Distinct synthetic JPEGs (default: %(default)s)")
+    parser.add_argument(
+        "--resolutions",
+        default=",".join(f"{w}x{h}" for w, h in RESOLUTIONS),
+        help="JPEG sizes, cycled over the images (default: %(default)s)",
+    )
+    parser.add_argument("--model-dir", help="Where stand-in models are built and reused (default: a temporary directory)")
+    parser.add_argument("--output", help="Write the results as JSON here")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed p95 / throughput change (default: %(default)s)")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    names = [name.strip() for name in args.services.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SERVICES]
+    if unknown:
+        sys.exit(f"Unknown service(s) {', '.join(unknown)}; use {', '.join(SERVICES)}")
+    model_dir = Path(args.model_dir or tempfile.mkdtemp(prefix="ml-bench-"))
+    model_dir.mkdir(parents=True, exist_ok=True)
+    # Measure the models, not the result cache; keep the benchmark's own artifacts out of the tree
+    os.environ["RESULT_CACHE_SIZE"] = "0"
+
+    images = make_images(args.images, parse_resolutions(args.resolutions)) if any(
+        SERVICES[name].payload == "image" for name in names
+    ) else []
+    readings = make_readings(max(args.requests, 256))
+
+    results = {
+        "environment": environment_info(),
+        "settings": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "images": args.images,
+            "resolutions": args.resolutions,
+        },
+        "services": {},
+        "skipped": {},
+    }
+    for name in names:
+        spec = SERVICES[name]
+        try:
+            env, notes = prepare_service(name, spec, model_dir)
+        except StandInUnavailable as e:
+            results["skipped"][name] = str(e)
+            print(f"  {name:<12} skipped: {e}", file=sys.stderr)
+            continue
+        os.environ.update(env)
+        try:
+            results["services"][name] = asyncio.run(bench_service(name, spec, args, images, readings))
+        except (ImportError, RuntimeError, FileNotFoundError) as e:
+            results["skipped"][name] = f"{type(e).__name__}: {e}"
+            print(f"  {name:<12} skipped: {e}", file=sys.stderr)
+            continue
+        if notes:
+            results["services"][name]["notes"] = notes
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        results["baseline"] = {
+            "path": args.baseline,
+            "commit": baseline.get("environment", {}).get("commit"),
+            "tolerance": args.tolerance,
+            "regressions": compare(results, baseline, args.tolerance),
+        }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+    regressions = results.get("baseline", {}).get("regressions", [])
+    for r in regressions:
+        print(
+            f"REGRESSION {r['service']} c={r['concurrency']} {r['metric']}: {r['baseline']} -> {r['current']} "
+            f"({r['change']:+.0%})",
+            file=sys.stderr,
+        )
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
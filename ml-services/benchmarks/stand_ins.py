@@ -0,0 +1,174 @@
+"""
+Randomly initialized stand-in models, so the services can be benchmarked without the real weights.
+Each has the architecture and input shape the service expects (same compute per request); the
+predictions are meaningless. Builders are seeded, so a model directory is reproducible.
+
+- fruit-veg: MobileNetV2, (N, 100, 100, 3) NHWC float -> (N, 1) sigmoid, exported to ONNX
+- food101: InceptionV3, (N, 299, 299, 3) NHWC float -> (N, 101) softmax, exported to ONNX
+- freshvision: the service's own EfficientNet-B0 builder, saved as a state dict (.pt)
+- tflite: Keras MobileNetV2, 224x224 -> 12 classes, converted to TFLite (needs tensorflow)
+- roboflow: a YOLOv8-shaped detector (640x640 input, (1, 4 + classes, 8400) output over strides 8/16/32),
+  exported to ONNX with "names" metadata; its backbone is a plain conv stack, not ultralytics' C2f blocks
+"""
+from pathlib import Path
+
+# Detector classes written into the stand-in's metadata (fresh and rotten, so both verdicts occur)
+DETECTOR_CLASSES = ["fresh_apple", "fresh_banana", "fresh_orange", "rotten_apple", "rotten_banana", "rotten_orange"]
+SEED = 0
+
+
+class StandInUnavailable(Exception):
+    """A stand-in that cannot be built here (missing framework)."""
+
+
+def _torch():
+    try:
+        import torch
+        import torchvision  # noqa: F401
+    except ImportError as e:
+        raise StandInUnavailable(f"needs torch and torchvision ({e})") from e
+    torch.manual_seed(SEED)
+    return torch
+
+
+def _export_onnx(torch, module, example, path: Path, dynamic_batch: bool = True):
+    try:
+        import onnx  # noqa: F401
+    except ImportError as e:
+        raise StandInUnavailable(f"needs onnx ({e})") from e
+    module.eval()
+    torch.onnx.export(
+        module,
+        example,
+        str(path),
+        input_names=["input"],
+        output_names=["output"],
+        dynamic_axes={"input": {0: "N"}, "output": {0: "N"}} if dynamic_batch else None,
+        opset_version=17,
+        dynamo=False,
+    )
+
+
+def _nhwc(torch, model, activation):
+    """Wrap an NCHW torchvision classifier to take the NHWC float input the Keras-trained services feed."""
+
+    class NHWC(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, x):
+            return activation(self.model(x.permute(0, 3, 1, 2)))
+
+    return NHWC()
+
+
+def build_fruit_veg(directory: Path) -> dict:
+    torch = _torch()
+    import torchvision
+
+    path = directory / "fruit-veg-mobilenetv2.onnx"
+    if not path.exists():
+        model = _nhwc(torch, torchvision.models.mobilenet_v2(weights=None, num_classes=1), torch.sigmoid)
+        _export_onnx(torch, model, torch.zeros(1, 100, 100, 3), path)
+    return {"FRESHNESS_MODEL_PATH": str(path)}
+
+
+def build_food101(directory: Path) -> dict:
+    torch = _torch()
+    import torchvision
+
+    path = directory / "food101-inceptionv3.onnx"
+    if not path.exists():
+        inception = torchvision.models.inception_v3(weights=None, aux_logits=False, init_weights=True, num_classes=101)
+        model = _nhwc(torch, inception, lambda logits: torch.softmax(logits, dim=-1))
+        _export_onnx(torch, model, torch.zeros(1, 299, 299, 3), path)
+    # No nutrition CSV: the lookup is a list index either way
+    return {"FOOD_IMAGE_RECOGNITION_MODEL_PATH": str(path), "FOOD_IMAGE_RECOGNITION_NUTRITION_CSV": ""}
+
+
+def build_freshvision(directory: Path) -> dict:
+    torch = _torch()
+    from ml_common.services import load_service_modules
+
+    path = directory / "freshvision-effnetb0.pt"
+    if not path.exists():
+        builder = load_service_modules("freshvision", "model_builder").model_builder
+        torch.save(builder.create_model_baseline_effnetb0(out_feats=6).state_dict(), path)
+    return {"FRESHVISION_MODEL_PATH": str(path), "FRESHVISION_CACHE_DIR": str(directory / "freshvision-cache")}
+
+
+def build_tflite(directory: Path) -> dict:
+    try:
+        import tensorflow as tf
+    except ImportError as e:
+        raise StandInUnavailable(f"needs tensorflow ({e})") from e
+    path = directory / "freshness-mobilenetv2.tflite"
+    if not path.exists():
+        tf.keras.utils.set_random_seed(SEED)
+        model = tf.keras.applications.MobileNetV2(input_shape=(224, 224, 3), weights=None, classes=12)
+        path.write_bytes(tf.lite.TFLiteConverter.from_keras_model(model).convert())
+    return {"TFLITE_FRESHNESS_MODEL_PATH": str(path)}
+
+
+def build_detector(directory: Path) -> dict:
+    torch = _torch()
+    from torch import nn
+
+    path = directory / "freshness-yolo-standin.onnx"
+    if not path.exists():
+        num_outputs = 4 + len(DETECTOR_CLASSES)
+
+        def block(c_in, c_out):
+            return nn.Sequential(nn.Conv2d(c_in, c_out, 3, 2, 1), nn.BatchNorm2d(c_out), nn.SiLU(),
+                                 nn.Conv2d(c_out, c_out, 3, 1, 1), nn.BatchNorm2d(c_out), nn.SiLU())
+
+        class Detector(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.stages = nn.ModuleList([block(3, 16), block(16, 32), block(32, 64), block(64, 128), block(128, 256)])
+                self.heads = nn.ModuleList([nn.Conv2d(c, num_outputs, 1) for c in (64, 128, 256)])
+                for head in self.heads:
+                    # Few candidates above the 40% confidence threshold, as with a trained model
+                    nn.init.constant_(head.bias[4:], -4.0)
+
+            def forward(self, x):
+                features = []
+                for i, stage in enumerate(self.stages):
+                    x = stage(x)
+                    if i >= 2:
+                        features.append(x)
+                outputs = []
+                for head, feature, stride in zip(self.heads, features, (8, 16, 32)):
+                    out = head(feature).flatten(2)
+                    size = feature.shape[-1]
+                    ys, xs = torch.meshgrid(torch.arange(size), torch.arange(size), indexing="ij")
+                    centres = torch.stack([xs.flatten(), ys.flatten()]).float().add(0.5).mul(stride)
+                    xy = centres + out[:, :2].tanh() * stride
+                    wh = out[:, 2:4].sigmoid() * stride * 8
+                    outputs.append(torch.cat([xy, wh, out[:, 4:].sigmoid()], dim=1))
+                return torch.cat(outputs, dim=2)
+
+        _export_onnx(torch, Detector(), torch.zeros(1, 3, 640, 640), path, dynamic_batch=False)
+        import onnx
+
+        model = onnx.load(str(path))
+        entry = model.metadata_props.add()
+        entry.key, entry.value = "names", str(dict(enumerate(DETECTOR_CLASSES)))
+        onnx.save(model, str(path))
+    return {"ROBOFLOW_BACKEND": "local", "ROBOFLOW_LOCAL_MODEL_PATH": str(path)}
+
+
+def build_analyzer(directory: Path) -> dict:
+    # The RandomForest is trained from the built-in synthetic data; only keep its artifact out of the tree
+    return {"FRESHNESS_ARTIFACT_DIR": str(directory / "analyzer-artifacts")}
+
+
+BUILDERS = {
+    "fruit_veg": build_fruit_veg,
+    "food101": build_food101,
+    "freshvision": build_freshvision,
+    "tflite": build_tflite,
+    "detector": build_detector,
+    "analyzer": build_analyzer,
+}
@@ -0,0 +1,144 @@
+"""
+Columnar batch scoring for environmental readings.
+Readings arrive as JSON columns or as an uploaded CSV / Arrow / Parquet file; uploads are read
+in chunks of CHUNK_ROWS so memory stays flat regardless of file size.
+"""
+from typing import Iterator
+
+import numpy as np
+
+from model import FRESHNESS_INDEX, LABELS, predict_freshness_batch
+
+# Column names accepted in JSON bodies and uploaded files, with the same ranges as /evaluate-environment
+COLUMNS = ["temperature", "humidity", "time_stored_hours", "gas"]
+RANGES = {
+    "temperature": (-10, 50),
+    "humidity": (0, 100),
+    "time_stored_hours": (0, 168),
+    "gas": (0, 1000),
+}
+DEFAULT_GAS = 200.0
+CLASSIFICATIONS = np.array([label.lower() for label in LABELS])
+
+UPLOAD_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+CONTENT_TYPE_FORMATS = {
+    "text/csv": "csv",
+    "application/vnd.apache.parquet": "parquet",
+    "application/vnd.apache.arrow.file": "arrow",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+
+class BatchError(ValueError):
+    """Invalid batch input; status_code is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 422):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def to_matrix(columns: dict, offset: int = 0) -> np.ndarray:
+    """
+    Validate columns (temperature, humidity, time_stored_hours, optional gas) and stack them
+    into an (n, 4) float matrix. offset is the row number of the first row, for error messages.
+    """
+    arrays = {}
+    for name in COLUMNS:
+        values = columns.get(name)
+        if values is None:
+            if name != "gas":
+                raise BatchError(f"Missing column: {name}")
+            continue
+        arrays[name] = np.asarray(values, dtype=float).reshape(-1)
+    n = len(arrays["temperature"])
+    for name, values in arrays.items():
+        if len(values) != n:
+            raise BatchError(f"Column {name} has {len(values)} values, expected {n}")
+
+    gas = arrays.get("gas")
+    if gas is None:
+        gas = np.full(n, DEFAULT_GAS)
+    else:
+        gas = np.where(np.isnan(gas), DEFAULT_GAS, gas)
+    X = np.column_stack([arrays["temperature"], arrays["humidity"], arrays["time_stored_hours"], gas])
+
+    for i, name in enumerate(COLUMNS):
+        low, high = RANGES[name]
+        bad = ~((X[:, i] >= low) & (X[:, i] <= high))  # also catches NaN
+        if bad.any():
+            row = offset + int(np.argmax(bad))
+            raise BatchError(f"{name} out of range [{low}, {high}] or missing at row {row} ({int(bad.sum())} rows)")
+    return X
+
+
+def score(scaler, model, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Score an (n, 4) matrix in one vectorized pass; returns (classification, freshness_index) arrays."""
+    pred = predict_freshness_batch(scaler, model, X)
+    return CLASSIFICATIONS[pred], FRESHNESS_INDEX[pred]
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str:
+    """Pick csv / parquet / arrow from the content type or file extension."""
+    fmt = CONTENT_TYPE_FORMATS.get((content_type or "").split(";")[0].strip().lower())
+    if fmt:
+        return fmt
+    name = (filename or "").lower()
+    for ext, fmt in UPLOAD_FORMATS.items():
+        if name.endswith(ext):
+            return fmt
+    raise BatchError("Unsupported file type; upload .csv, .parquet or .arrow", status_code=415)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise BatchError("Parquet and Arrow uploads need pyarrow installed", status_code=415)
+
+
+def _arrow_batch_columns(batch) -> dict:
+    names = set(batch.schema.names)
+    return {name: batch.column(name).to_numpy(zero_copy_only=False) for name in COLUMNS if name in names}
+
+
+def iter_chunks(fileobj, fmt: str, chunk_rows: int) -> Iterator[dict]:
+    """Yield dicts of column arrays, chunk_rows rows at a time."""
+    if fmt == "csv":
+        import pandas as pd
+
+        def usecols(name):
+            return name.strip() in COLUMNS
+
+        for df in pd.read_csv(fileobj, chunksize=chunk_rows, usecols=usecols):
+            df.columns = [c.strip() for c in df.columns]
+            yield {name: df[name].to_numpy() for name in COLUMNS if name in df.columns}
+    elif fmt == "parquet":
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(fileobj)
+        columns = [name for name in COLUMNS if name in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield _arrow_batch_columns(batch)
+    elif fmt == "arrow":
+        _require_pyarrow()
+        import pyarrow as pa
+
+        try:
+            reader = pa.ipc.open_file(fileobj)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            fileobj.seek(0)
+            batches = pa.ipc.open_stream(fileobj)
+        for batch in batches:
+            # Arrow record batches can be large; re-slice to chunk_rows
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield _arrow_batch_columns(batch.slice(start, chunk_rows))
+    else:
+        raise BatchError(f"Unsupported format: {fmt}", status_code=415)
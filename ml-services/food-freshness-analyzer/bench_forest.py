@@ -0,0 +1,112 @@
+"""
+Parity check and micro-benchmark: compiled forest (forest.py) vs sklearn.
+
+Parity: predictions must match sklearn exactly on the training data, on random rows spanning the
+API's input ranges, and on rows sitting exactly on (or one ulp above) split thresholds
+(exits with status 1 on any mismatch).
+Benchmark: single-row and 10k-row latency for both engines.
+
+Run: python bench_forest.py [--rows 200000] [--json]
+"""
+import argparse
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from forest import CompiledForest
+from model import FEATURES, _generate_synthetic_data, load_or_train
+
+# Same ranges as the /evaluate-environment request fields
+RANGES = [(-10, 50), (0, 100), (0, 168), (0, 1000)]
+
+
+def random_rows(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(low, high, n) for low, high in RANGES])
+
+
+def boundary_rows(compiled: CompiledForest, X: np.ndarray, seed: int = 1) -> np.ndarray:
+    """Copies of X with one feature moved onto a split threshold, or just above it."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for f in range(X.shape[1]):
+        thresholds = compiled.threshold[(compiled.feature == f) & np.isfinite(compiled.threshold)]
+        picked = thresholds[rng.integers(0, len(thresholds), len(X))]
+        for values in (picked, np.nextafter(picked, np.inf)):
+            Y = X.copy()
+            Y[:, f] = values
+            rows.append(Y)
+    return np.concatenate(rows)
+
+
+def time_call(fn, repeat: int) -> float:
+    """Median seconds per call over repeat calls (after one warm-up)."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def check_parity(scaler, model, compiled, X: np.ndarray) -> int:
+    expected = model.predict(scaler.transform(X))
+    return int((compiled.predict(X) != expected).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000, help="Random rows for the parity check")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    # sklearn warns that plain arrays have no feature names; irrelevant here
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    scaler, model, version = load_or_train()
+    start = time.perf_counter()
+    compiled = CompiledForest(scaler, model)
+    compile_s = time.perf_counter() - start
+
+    train_X = _generate_synthetic_data()[FEATURES].to_numpy(dtype=float)
+    X = random_rows(args.rows)
+    edge_X = boundary_rows(compiled, X[:10_000])
+    mismatches = {
+        "training_rows": check_parity(scaler, model, compiled, train_X),
+        "random_rows": check_parity(scaler, model, compiled, X),
+        "threshold_rows": check_parity(scaler, model, compiled, edge_X),
+    }
+
+    one, batch = X[:1], X[:10_000]
+    results = {
+        "model_version": version,
+        "strategy": compiled.strategy,
+        "compile_ms": round(compile_s * 1000, 2),
+        "parity_rows": {"training_rows": len(train_X), "random_rows": len(X), "threshold_rows": len(edge_X)},
+        "mismatches": mismatches,
+        "latency": {
+            "sklearn_1_row_us": round(time_call(lambda: model.predict(scaler.transform(one)), 200) * 1e6, 1),
+            "compiled_1_row_us": round(time_call(lambda: compiled.predict(one), 2000) * 1e6, 1),
+            "sklearn_10k_rows_ms": round(time_call(lambda: model.predict(scaler.transform(batch)), 10) * 1e3, 2),
+            "compiled_10k_rows_ms": round(time_call(lambda: compiled.predict(batch), 10) * 1e3, 2),
+        },
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"model {version}, strategy {compiled.strategy}, compiled in {results['compile_ms']} ms")
+        print("parity (mismatches / rows): " + ", ".join(
+            f"{name} {mismatches[name]}/{count}" for name, count in results["parity_rows"].items()
+        ))
+        for name, value in results["latency"].items():
+            print(f"  {name:<24} {value}")
+    if any(mismatches.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Build the environment freshness model and save it as a versioned artifact.
+The API loads this artifact at startup instead of training (see model.load_or_train).
+
+Run: python export_model.py [--output-dir artifacts]
+"""
+import argparse
+import json
+
+from model import ARTIFACT_DIR, save_artifact, train_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and export the freshness RandomForest artifact.")
+    parser.add_argument("--output-dir", default=str(ARTIFACT_DIR), help="Artifact directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    scaler, model = train_model()
+    manifest = save_artifact(scaler, model, args.output_dir)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Shelf-life forecast: hours left before a donation turns Stale and Spoiled under its current storage
+conditions (temperature, humidity and gas held constant while the storage time grows).
+
+For each distinct set of conditions the forest is evaluated on a grid of storage times, from 0 to the
+model's 168-hour range in steps of step_hours, and every grid cell where the class changes is narrowed
+down by bisection. The result is a profile (class at 0 h and each change time) that answers any current
+storage time. The grids of all uncached conditions in a request go through the forest in one
+vectorized pass, and each bisection step is one more pass over the open cells. Profiles are cached
+under the conditions rounded to QUANTA, so donations stored alike share one, across requests too.
+A donation's current verdict is read from the same profile at its storage time, so it never
+contradicts the hours returned with it.
+"""
+import numpy as np
+
+from ml_common.result_cache import ResultCache
+
+from batch import CLASSIFICATIONS, RANGES
+from model import FRESHNESS_INDEX, LABELS, predict_freshness_batch
+
+MAX_STORED_HOURS = RANGES["time_stored_hours"][1]
+# Rounding of the conditions a profile is computed (and cached) for: temperature (°C), humidity (%), gas
+QUANTA = {"temperature": 0.5, "humidity": 1.0, "gas": 5.0}
+# Halvings of a grid cell where the class changes (a 1-hour step is narrowed down to about a minute)
+BISECTION_STEPS = 6
+STALE, SPOILED = LABELS.index("Stale"), LABELS.index("Spoiled")
+# Rows per forest call: the compiled forest holds an (n, trees) mask array, so a request's grid goes
+# through in blocks that stay in cache instead of one array of hundreds of MB
+BLOCK_ROWS = 16_384
+
+
+class ShelfLifeForecaster:
+    """Shelf-life profiles per quantized conditions, computed in batches and kept in an LRU cache."""
+
+    def __init__(self, step_hours: float = 1.0, cache_size: int = 10_000):
+        if step_hours <= 0:
+            raise ValueError("FRESHNESS_FORECAST_STEP_HOURS must be positive")
+        self.step_hours = step_hours
+        times = np.arange(0.0, MAX_STORED_HOURS, step_hours)
+        self.times = np.append(times, MAX_STORED_HOURS)
+        # Profiles only change with the model, which is part of every key; the TTL just bounds staleness
+        self.cache = ResultCache("forecast", max_entries=cache_size, ttl_seconds=86_400.0)
+        self.computed = 0
+
+    def forecast(self, scaler, model, X: np.ndarray, version: str | None = None):
+        """
+        Forecast an (n, 4) reading matrix (temperature, humidity, time_stored_hours, gas). version (the
+        model's) keys the cache. Returns (classification, freshness_index, hours_until_stale,
+        hours_until_spoiled): the current verdicts, and the hours as float arrays, NaN when the donation
+        does not get there within the model's range. Verdicts and hours both come from the profile of
+        the rounded conditions.
+        """
+        quanta = np.array([QUANTA["temperature"], QUANTA["humidity"], QUANTA["gas"]])
+        conditions = np.round(X[:, [0, 1, 3]] / quanta) * quanta
+        unique, inverse = np.unique(conditions, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        keys = [self.cache.key(row.tobytes(), f"{version}:{self.step_hours}") for row in unique]
+        profiles = [self.cache.get(key) for key in keys]
+        missing = [i for i, profile in enumerate(profiles) if profile is None]
+
+        if missing:
+            # One pass over the time grid of every uncached condition
+            grid = np.empty((len(missing) * len(self.times), 4))
+            grid[:, [0, 1, 3]] = np.repeat(unique[missing], len(self.times), axis=0)
+            grid[:, 2] = np.tile(self.times, len(missing))
+            pred = _predict(scaler, model, grid)
+            computed = self._profiles(scaler, model, unique[missing], pred.reshape(len(missing), -1))
+            for i, profile in zip(missing, computed):
+                profiles[i] = profile
+                self.cache.put(keys[i], profile)
+            self.computed += len(missing)
+
+        hours = np.full((len(X), 2), np.nan)
+        current = np.empty(len(X), dtype=int)
+        for row, (profile, stored) in enumerate(zip((profiles[i] for i in inverse), X[:, 2])):
+            # The raw reading could fall on the other side of a split than its rounded conditions
+            now = current[row] = _class_at(profile, stored)
+            for column, level in enumerate((STALE, SPOILED)):
+                hours[row, column] = 0.0 if now >= level else _hours_until(profile, stored, level)
+        return CLASSIFICATIONS[current], FRESHNESS_INDEX[current], hours[:, 0], hours[:, 1]
+
+    def _profiles(self, scaler, model, conditions: np.ndarray, classes: np.ndarray) -> list[dict]:
+        """Profiles of conditions from their classes on the time grid, with every change bisected."""
+        rows, cells = np.nonzero(classes[:, 1:] != classes[:, :-1])
+        lo, hi = self.times[cells], self.times[cells + 1]
+        before = classes[rows, cells]
+        if len(rows):
+            probe = np.empty((len(rows), 4))
+            probe[:, [0, 1, 3]] = conditions[rows]
+            for _ in range(BISECTION_STEPS):
+                mid = (lo + hi) / 2
+                probe[:, 2] = mid
+                unchanged = _predict(scaler, model, probe) == before
+                lo = np.where(unchanged, mid, lo)
+                hi = np.where(unchanged, hi, mid)
+        after = classes[rows, cells + 1]
+        profiles = [{"start": int(row[0]), "changes": []} for row in classes]
+        # np.nonzero walks row by row, cells in time order
+        for row, hour, label in zip(rows, hi, after):
+            profiles[row]["changes"].append([round(float(hour), 4), int(label)])
+        return profiles
+
+    def stats(self) -> dict:
+        return {
+            "step_hours": self.step_hours,
+            "quanta": QUANTA,
+            "profiles_computed": self.computed,
+            "cache": self.cache.stats(),
+        }
+
+
+def _predict(scaler, model, X: np.ndarray) -> np.ndarray:
+    """predict_freshness_batch in blocks of BLOCK_ROWS."""
+    if len(X) <= BLOCK_ROWS:
+        return predict_freshness_batch(scaler, model, X)
+    return np.concatenate([
+        predict_freshness_batch(scaler, model, X[start:start + BLOCK_ROWS]) for start in range(0, len(X), BLOCK_ROWS)
+    ])
+
+
+def _class_at(profile: dict, stored: float) -> int:
+    """The profile's class at storage time stored (a change at exactly stored has already happened)."""
+    label = profile["start"]
+    for hour, after in profile["changes"]:
+        if hour > stored:
+            break
+        label = after
+    return label
+
+
+def _hours_until(profile: dict, stored: float, level: int) -> float:
+    """Hours from storage time stored until the profile's class first reaches level (NaN: not within range)."""
+    segments = [[0.0, profile["start"]], *profile["changes"]]
+    for (start, label), (end, _) in zip(segments, segments[1:] + [[np.inf, None]]):
+        if label >= level and end > stored:
+            return max(start, stored) - stored
+    return np.nan
@@ -0,0 +1,196 @@
+"""
+Compiled RandomForest inference for the environment model.
+The fitted StandardScaler is folded into the split thresholds (x_scaled <= t becomes x <= b on the raw
+feature) and all trees are packed into flat NumPy arrays, so prediction skips sklearn's per-call
+validation and dispatch while returning the same predictions.
+
+Two evaluation strategies share those arrays:
+- bitvector (default): per feature, splits are sorted by threshold; one searchsorted per feature finds
+  every split a row fails, and AND-ing precomputed per-tree leaf masks leaves the exit leaf as the lowest
+  set bit (the QuickScorer scheme). Needs at most 64 leaves per tree.
+- level-wise traversal: every tree walks one level per step for all rows at once. Used when a tree has
+  more than 64 leaves or the mask tables would be too large.
+"""
+import numpy as np
+
+MAX_LEAVES = 64
+# Upper bound on the bitvector mask tables before falling back to traversal
+MAX_MASK_TABLE_BYTES = 64 * 1024 * 1024
+_ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _raw_thresholds(threshold: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """
+    Largest raw value b with float32((b - mean) / scale) <= threshold, per split.
+    sklearn scales in float64 and then casts to float32 before comparing, so t * scale + mean is off by
+    a few ulps right at the boundary; bisect between neighbouring doubles to get it exact.
+    """
+    def goes_left(x):
+        return ((x - mean) / scale).astype(np.float32).astype(np.float64) <= threshold
+
+    guess = threshold * scale + mean
+    delta = 1e-5 * (np.abs(guess) + 1.0)
+    lo, hi = guess - delta, guess + delta
+    # Widen the bracket until lo goes left and hi goes right (normally already true)
+    for _ in range(64):
+        bad_lo, bad_hi = ~goes_left(lo), goes_left(hi)
+        if not (bad_lo.any() or bad_hi.any()):
+            break
+        delta = delta * 2
+        lo = np.where(bad_lo, lo - delta, lo)
+        hi = np.where(bad_hi, hi + delta, hi)
+    while True:
+        mid = lo + (hi - lo) / 2
+        open_ = (mid > lo) & (mid < hi)
+        if not open_.any():
+            return lo
+        left = goes_left(mid)
+        lo = np.where(open_ & left, mid, lo)
+        hi = np.where(open_ & ~left, mid, hi)
+
+
+def _leaf_order(children_left, children_right) -> list[int]:
+    """Leaves of one tree from left to right."""
+    order, stack = [], [0]
+    while stack:
+        node = stack.pop()
+        if children_left[node] == -1:
+            order.append(node)
+        else:
+            stack.append(children_right[node])
+            stack.append(children_left[node])
+    return order
+
+
+class CompiledForest:
+    def __init__(self, scaler, model):
+        """Compile a fitted RandomForestClassifier trained on scaler-transformed features (scaler may be None)."""
+        self.classes = np.asarray(model.classes_)
+        self.n_trees = len(model.estimators_)
+        self.n_features = model.n_features_in_
+        n_classes = len(self.classes)
+        mean = scaler.mean_ if scaler is not None else np.zeros(self.n_features)
+        scale = scaler.scale_ if scaler is not None else np.ones(self.n_features)
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        leaf_orders = []
+        offset = 0
+        self.max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            feature = np.where(is_leaf, 0, tree.feature).astype(np.intp)
+            threshold = _raw_thresholds(tree.threshold.astype(np.float64), mean[feature], scale[feature])
+            own = np.arange(n) + offset
+            value = tree.value[:, 0, :].astype(np.float64)
+            totals = value.sum(axis=1, keepdims=True)
+            value = np.divide(value, totals, out=np.zeros_like(value), where=totals > 0)
+
+            features.append(feature)
+            thresholds.append(np.where(is_leaf, np.inf, threshold))
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset))
+            values.append(value)
+            roots.append(offset)
+            leaf_orders.append(_leaf_order(tree.children_left, tree.children_right))
+            offset += n
+            self.max_depth = max(self.max_depth, tree.max_depth)
+
+        # Flat node arrays: leaves have threshold +inf and point to themselves
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        self.children = np.column_stack([np.concatenate(lefts), np.concatenate(rights)]).astype(np.intp).ravel()
+        self.value = np.concatenate(values)
+        self.roots = np.asarray(roots, dtype=np.intp)
+
+        self.strategy = "traversal"
+        max_leaves = max(len(order) for order in leaf_orders)
+        split_count = int(np.isfinite(self.threshold).sum())
+        if max_leaves <= MAX_LEAVES and (split_count + self.n_features) * self.n_trees * 8 <= MAX_MASK_TABLE_BYTES:
+            self._compile_bitvector(leaf_orders, n_classes)
+            self.strategy = "bitvector"
+
+    def _compile_bitvector(self, leaf_orders, n_classes):
+        per_feature = [[] for _ in range(self.n_features)]  # (threshold, tree, mask) per split
+        # Leaf class values, one contiguous array per class, indexed by tree * MAX_LEAVES + leaf position
+        leaf_values = np.zeros((n_classes, self.n_trees * MAX_LEAVES))
+        for t, (root, order) in enumerate(zip(self.roots, leaf_orders)):
+            order = np.asarray(order, dtype=np.intp) + root  # global node ids
+            position = {int(node): i for i, node in enumerate(order)}
+            leaf_values[:, t * MAX_LEAVES:t * MAX_LEAVES + len(order)] = self.value[order].T
+            # Leaves under each node form a contiguous range in left-to-right order
+            # (children always have higher ids than their parent, so walk ids backwards)
+            span = {}
+            for node in reversed(range(root, root + self._tree_size(t))):
+                left, right = self.children[2 * node], self.children[2 * node + 1]
+                if left == node:
+                    span[node] = (position[node], position[node] + 1)
+                else:
+                    span[node] = (span[left][0], span[right][1])
+            for node in span:
+                left = self.children[2 * node]
+                if left == node:
+                    continue
+                # A failed split (x > threshold) rules out every leaf in its left subtree
+                l_lo, l_hi = span[left]
+                mask = _ALL_ONES ^ np.uint64(((1 << (l_hi - l_lo)) - 1) << l_lo)
+                per_feature[self.feature[node]].append((self.threshold[node], t, mask))
+
+        self.sorted_thresholds = []
+        self.cumulative_masks = []
+        for splits in per_feature:
+            splits.sort(key=lambda s: s[0])
+            # Row k: per-tree AND of the masks of the k lowest-threshold splits on this feature
+            masks = np.full((len(splits) + 1, self.n_trees), _ALL_ONES, dtype=np.uint64)
+            for k, (_, t, mask) in enumerate(splits):
+                masks[k + 1] = masks[k]
+                masks[k + 1, t] &= mask
+            self.sorted_thresholds.append(np.array([s[0] for s in splits], dtype=np.float64))
+            self.cumulative_masks.append(masks)
+        self.leaf_values = leaf_values
+        self.leaf_base = np.arange(self.n_trees, dtype=np.intp) * MAX_LEAVES
+
+    def _tree_size(self, t: int) -> int:
+        end = self.roots[t + 1] if t + 1 < self.n_trees else len(self.feature)
+        return int(end - self.roots[t])
+
+    def _exit_leaves(self, X: np.ndarray) -> np.ndarray:
+        """Bitvector evaluation: (n, n_trees) indexes into leaf_values."""
+        masks = None
+        for f in range(self.n_features):
+            # Splits with threshold < x are failed (x goes right)
+            failed = np.searchsorted(self.sorted_thresholds[f], X[:, f], side="left")
+            m = self.cumulative_masks[f][failed]
+            masks = m if masks is None else np.bitwise_and(masks, m, out=masks)
+        lowest = masks & (~masks + np.uint64(1))
+        position = np.frexp(lowest.astype(np.float64))[1] - 1
+        return position + self.leaf_base
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Level-wise traversal: leaf node of every tree for every row. Returns (n, n_trees) node ids."""
+        if X.shape[0] == 1:
+            x = X[0]
+            node = self.roots.copy()
+            for _ in range(self.max_depth):
+                node = self.children[2 * node + (x[self.feature[node]] > self.threshold[node])]
+            return node[None, :]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees)).copy()
+        rows = np.arange(X.shape[0])[:, None]
+        for _ in range(self.max_depth):
+            node = self.children[2 * node + (X[rows, self.feature[node]] > self.threshold[node])]
+        return node
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Mean class probabilities over trees, like RandomForestClassifier.predict_proba. X holds raw features."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        if self.strategy == "bitvector":
+            leaves = self._exit_leaves(X)
+            # One contiguous gather per class is much cheaper than gathering (n, trees, classes)
+            totals = np.column_stack([np.take(values, leaves).sum(axis=1) for values in self.leaf_values])
+        else:
+            totals = self.value[self.apply(X)].sum(axis=1)
+        return totals / self.n_trees
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
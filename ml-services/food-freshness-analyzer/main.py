@@ -3,30 +3,106 @@ FastAPI wrapper for Food-Freshness-Analyzer (environment-based freshness).
 https://github.com/Parabellum768/Food-Freshness-Analyzer
 
 Uses temperature, humidity, storage time, and optional gas to classify Fresh / Stale / Spoiled.
+The model is loaded from a saved artifact (build it with export_model.py) in the background at
+startup; it is only trained here when no valid artifact exists. /livez and /readyz are the probes
+(see ml_common/readiness.py).
+Sensor gateways can also stream readings per donation (see stream.py) and only hear back when a
+donation's classification changes. /forecast tells how many hours each donation has left before it
+turns Stale and Spoiled (see forecast.py).
 
 Run: uvicorn main:app --host 0.0.0.0 --port 8001
 """
-from fastapi import FastAPI, HTTPException
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel, Field
 
-from model import train_model, predict_freshness
+# Shared helpers (ml-services/ml_common)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ml_common.metrics import instrument, stage  # noqa: E402
+from ml_common.readiness import ModelLoader, add_probes, preload  # noqa: E402
+
+from batch import BatchError, detect_format, iter_chunks, score, to_matrix
+from forecast import MAX_STORED_HOURS, ShelfLifeForecaster
+from forest import CompiledForest
+from model import load_or_train, predict_freshness
+from stream import DonationStateStore
+
+# Batch scoring limits: rows per request and rows read per chunk from uploaded files
+BATCH_MAX_ROWS = int(os.environ.get("FRESHNESS_BATCH_MAX_ROWS", "1000000"))
+BATCH_CHUNK_ROWS = int(os.environ.get("FRESHNESS_BATCH_CHUNK_ROWS", "50000"))
+# "compiled" (flat-array forest, see forest.py) or "sklearn"
+ENGINE = os.environ.get("FRESHNESS_ENGINE", "compiled")
+# Streaming ingestion: donations tracked, idle seconds before a donation is dropped, readings averaged
+STREAM_MAX_DONATIONS = int(os.environ.get("FRESHNESS_STREAM_MAX_DONATIONS", "100000"))
+STREAM_TTL_SECONDS = float(os.environ.get("FRESHNESS_STREAM_TTL_SECONDS", "86400"))
+STREAM_WINDOW = int(os.environ.get("FRESHNESS_STREAM_WINDOW", "12"))
+# Longest NDJSON line accepted on the streaming endpoint
+STREAM_MAX_LINE_BYTES = 64 * 1024
+# Shelf-life forecast: donations per request, storage-time grid step, and shelf-life profiles cached
+FORECAST_MAX_DONATIONS = int(os.environ.get("FRESHNESS_FORECAST_MAX_DONATIONS", "10000"))
+FORECAST_STEP_HOURS = float(os.environ.get("FRESHNESS_FORECAST_STEP_HOURS", "1"))
+FORECAST_CACHE_SIZE = int(os.environ.get("FRESHNESS_FORECAST_CACHE_SIZE", "10000"))
+
+_model_version = None
+_stream = DonationStateStore(STREAM_MAX_DONATIONS, STREAM_TTL_SECONDS, STREAM_WINDOW)
+_forecaster = ShelfLifeForecaster(FORECAST_STEP_HOURS, FORECAST_CACHE_SIZE)
+
+
+def load_model():
+    """(scaler, model); model is the compiled forest unless FRESHNESS_ENGINE=sklearn."""
+    global _model_version
+    scaler, model, _model_version = load_or_train()
+    if ENGINE == "compiled":
+        model = CompiledForest(scaler, model)
+    return scaler, model
+
+
+def warm_up(loaded):
+    """One reading and one small batch (the single-row and vectorized prediction paths)."""
+    scaler, model = loaded
+    predict_freshness(scaler, model, 4.0, 60.0, 12.0, 150.0)
+    score(scaler, model, np.tile([[4.0, 60.0, 12.0, 150.0]], (64, 1)))
+
+
+# Loaded (or trained) once, in the background from startup
+_loader = ModelLoader("analyzer", load_model, warm_up)
+
+
+def get_model():
+    """Return (scaler, model), waiting for the load if it is still running."""
+    return _loader.get()
+
+
+async def get_model_async():
+    """get_model() for async endpoints: waits for the load off the event loop."""
+    if _loader.ready:
+        return _loader.model
+    return await run_in_threadpool(get_model)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload(_loader)
+    yield
+
 
 app = FastAPI(
     title="Food Freshness Analyzer (Environment)",
     description="ResQ Meal - Freshness from environmental data (Food-Freshness-Analyzer)",
     version="1.0.0",
+    lifespan=lifespan,
 )
-
-# Train once at startup
-_scaler = None
-_model = None
-
-
-def get_model():
-    global _scaler, _model
-    if _scaler is None or _model is None:
-        _scaler, _model = train_model()
-    return _scaler, _model
+instrument(app, "analyzer")
+add_probes(app, _loader)
 
 
 class EvaluateRequest(BaseModel):
@@ -36,28 +112,246 @@ class EvaluateRequest(BaseModel):
     gas: float = Field(default=200.0, ge=0, le=1000, description="Gas concentration (optional)")
 
 
+class BatchEvaluateRequest(BaseModel):
+    temperature: list[float] = Field(..., description="Temperatures (°C)")
+    humidity: list[float] = Field(..., description="Humidity values (%)")
+    time_stored_hours: list[float] = Field(..., description="Storage times in hours")
+    gas: list[float] | None = Field(default=None, description="Gas concentrations (optional, default 200)")
+
+
+class ForecastDonation(BaseModel):
+    donation_id: str | None = Field(default=None, description="Echoed back (optional)")
+    temperature: float = Field(..., ge=-10, le=50, description="Storage temperature (°C)")
+    humidity: float = Field(..., ge=0, le=100, description="Storage humidity (%)")
+    time_stored_hours: float = Field(default=0.0, ge=0, le=168, description="Hours stored so far")
+    gas: float = Field(default=200.0, ge=0, le=1000, description="Gas concentration (optional)")
+
+
+class ForecastRequest(BaseModel):
+    donations: list[ForecastDonation] = Field(..., min_length=1, description="Donations to forecast")
+
+
 @app.get("/health")
 def health():
-    try:
-        get_model()
-        return {"status": "ok", "model_loaded": True}
-    except Exception as e:
-        return {"status": "degraded", "model_loaded": False, "message": str(e)}
+    """Service state; never waits for the model (status is loading until it is warm)."""
+    if _loader.state == "failed":
+        return {"status": "degraded", "model_loaded": False, "message": _loader.error}
+    return {
+        "status": "ok" if _loader.ready else "loading",
+        "model_loaded": _loader.ready,
+        "model": _loader.stats(),
+        "model_version": _model_version,
+        "engine": ENGINE,
+        "stream": _stream.stats(),
+        "forecast": _forecaster.stats(),
+    }
 
 
 @app.post("/evaluate-environment")
 def evaluate_environment(body: EvaluateRequest):
     """Predict freshness from environmental data. Returns classification and freshness_index (0-100)."""
     scaler, model = get_model()
-    label, freshness_index = predict_freshness(
-        scaler,
-        model,
-        body.temperature,
-        body.humidity,
-        body.time_stored_hours,
-        body.gas,
-    )
+    with stage("inference"):
+        label, freshness_index = predict_freshness(
+            scaler,
+            model,
+            body.temperature,
+            body.humidity,
+            body.time_stored_hours,
+            body.gas,
+        )
     return {
         "classification": label.lower(),
         "freshness_index": freshness_index,
     }
+
+
+@app.post("/evaluate-environment/batch")
+def evaluate_environment_batch(body: BatchEvaluateRequest):
+    """Score many readings given as JSON columns. Returns columnar classification and freshness_index arrays."""
+    if len(body.temperature) > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ROWS} rows per request")
+    scaler, model = get_model()
+    columns = {
+        "temperature": body.temperature,
+        "humidity": body.humidity,
+        "time_stored_hours": body.time_stored_hours,
+        "gas": body.gas,
+    }
+    try:
+        with stage("parse"):
+            X = to_matrix(columns)
+    except BatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    with stage("inference"):
+        classification, freshness_index = score(scaler, model, X)
+    return {
+        "count": len(X),
+        "classification": classification.tolist(),
+        "freshness_index": freshness_index.tolist(),
+    }
+
+
+@app.post("/evaluate-environment/batch/upload")
+def evaluate_environment_upload(file: UploadFile = File(...), format: str | None = None):
+    """
+    Score readings from an uploaded CSV, Arrow or Parquet file (columns temperature, humidity,
+    time_stored_hours, optional gas). The file is read in chunks; format overrides type detection.
+    """
+    scaler, model = get_model()
+    classifications, indices = [], []
+    rows = 0
+    try:
+        fmt = format or detect_format(file.filename, file.content_type)
+        chunks = iter_chunks(file.file, fmt, BATCH_CHUNK_ROWS)
+        while True:
+            # Reading and parsing the spooled upload (a temp file past 1 MB)
+            with stage("parse"):
+                columns = next(chunks, None)
+                if columns is None:
+                    break
+                X = to_matrix(columns, offset=rows)
+            rows += len(X)
+            if rows > BATCH_MAX_ROWS:
+                raise BatchError(f"At most {BATCH_MAX_ROWS} rows per request", status_code=413)
+            with stage("inference"):
+                classification, freshness_index = score(scaler, model, X)
+            classifications.append(classification)
+            indices.append(freshness_index)
+    except BatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=422, detail=f"Could not parse {file.filename or 'upload'}: {e}")
+    return {
+        "count": rows,
+        "classification": np.concatenate(classifications).tolist() if classifications else [],
+        "freshness_index": np.concatenate(indices).tolist() if indices else [],
+    }
+
+
+def _hours(value: float) -> float | None:
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+@app.post("/forecast")
+def forecast(body: ForecastRequest):
+    """
+    Hours each donation has left before it turns Stale and Spoiled if its storage conditions stay as they
+    are (0 when it already is; null when not within the model's range). Returns forecasts in input order
+    and ranking, the donation indices from most to least urgent (soonest Spoiled, then soonest Stale).
+    """
+    if len(body.donations) > FORECAST_MAX_DONATIONS:
+        raise HTTPException(status_code=413, detail=f"At most {FORECAST_MAX_DONATIONS} donations per request")
+    scaler, model = get_model()
+    with stage("parse"):
+        X = np.array([[d.temperature, d.humidity, d.time_stored_hours, d.gas] for d in body.donations])
+    with stage("inference"):
+        classification, freshness_index, until_stale, until_spoiled = _forecaster.forecast(
+            scaler, model, X, _model_version
+        )
+    forecasts = [
+        {
+            "donation_id": donation.donation_id,
+            "classification": str(classification[i]),
+            "freshness_index": int(freshness_index[i]),
+            "hours_until_stale": _hours(until_stale[i]),
+            "hours_until_spoiled": _hours(until_spoiled[i]),
+        }
+        for i, donation in enumerate(body.donations)
+    ]
+    # Beyond the horizon sorts last
+    urgency = np.lexsort((np.nan_to_num(until_stale, nan=np.inf), np.nan_to_num(until_spoiled, nan=np.inf)))
+    return {
+        "count": len(forecasts),
+        "horizon_hours": MAX_STORED_HOURS,
+        "forecasts": forecasts,
+        "ranking": urgency.tolist(),
+    }
+
+
+async def ingest(messages: list) -> list[dict]:
+    """Apply readings to the donation state; returns the classification changes followed by any errors."""
+    scaler, model = await get_model_async()
+    with stage("inference"):
+        changes, errors = await run_in_threadpool(_stream.ingest, scaler, model, messages)
+    return changes + errors
+
+
+@app.websocket("/evaluate-environment/stream")
+async def evaluate_environment_stream(websocket: WebSocket):
+    """
+    Stream readings over a WebSocket: each text message is one reading or a list of readings
+    ({donation_id, temperature, humidity, gas?, timestamp?, time_stored_hours?}).
+    A message is sent back only when a donation's classification changes, or for an invalid reading.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                payload = json.loads(text)
+            except ValueError:
+                await websocket.send_json({"error": "Invalid JSON"})
+                continue
+            for message in await ingest(payload if isinstance(payload, list) else [payload]):
+                await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body generator reads the request stream itself. The stock response also
+    listens for disconnects on the same receive channel, which would swallow request body chunks;
+    here a disconnect surfaces as ClientDisconnect from request.stream() instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+@app.post("/evaluate-environment/stream")
+async def evaluate_environment_ndjson(request: Request):
+    """
+    Same as the WebSocket endpoint over plain HTTP: the request body is NDJSON (one reading per line,
+    sent as it arrives) and the response streams NDJSON classification changes and errors.
+    """
+    await get_model_async()
+
+    async def results(lines: list[bytes]):
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                yield json.dumps({"error": "Invalid JSON line"}) + "\n"
+        if messages:
+            for message in await ingest(messages):
+                yield json.dumps(message) + "\n"
+
+    async def changes():
+        buffer = b""
+        try:
+            async for chunk in request.stream():
+                *lines, buffer = (buffer + chunk).split(b"\n")
+                if len(buffer) > STREAM_MAX_LINE_BYTES:
+                    yield json.dumps({"error": f"Line longer than {STREAM_MAX_LINE_BYTES} bytes"}) + "\n"
+                    return
+                async for line in results(lines):
+                    yield line
+        except ClientDisconnect:
+            return
+        async for line in results([buffer]):
+            yield line
+
+    return DuplexStreamingResponse(changes(), media_type="application/x-ndjson")
+
+
+@app.delete("/evaluate-environment/stream/{donation_id}")
+def forget_donation(donation_id: str):
+    """Drop a donation's streaming state (e.g. once it has been picked up)."""
+    if not _stream.forget(donation_id):
+        raise HTTPException(status_code=404, detail="Unknown donation_id")
+    return {"donation_id": donation_id, "forgotten": True}
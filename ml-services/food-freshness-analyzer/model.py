@@ -3,18 +3,38 @@ Train a RandomForest for food freshness from environmental data.
 Logic based on https://github.com/Parabellum768/Food-Freshness-Analyzer
 Inputs: Temperature, Humidity, Time (hours), Gas (optional).
 Output: Fresh | Stale | Spoiled
+
+The fitted scaler and forest are saved as one versioned artifact (see export_model.py) and
+loaded at startup; training only happens when no valid artifact exists.
 """
+import hashlib
+import json
+import os
 import random
-import pandas as pd
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
+from pathlib import Path
+
+import numpy as np
+
+# sklearn, pandas and joblib (over a second to import) are imported where models are trained,
+# saved or loaded, so the service can bind its port before its background load needs them
+from forest import CompiledForest
 
 RANDOM_STATE = 42
+N_SAMPLES = 500
+N_ESTIMATORS = 100
 LABELS = ["Fresh", "Stale", "Spoiled"]  # index 0, 1, 2
+FEATURES = ["Temperature", "Humidity", "Time", "Gas"]
+# Freshness index 0-100 per class index: Fresh=high, Stale=mid, Spoiled=low
+FRESHNESS_INDEX = np.array([90, 55, 20])
+
+ARTIFACT_DIR = Path(os.environ.get("FRESHNESS_ARTIFACT_DIR", str(Path(__file__).resolve().parent / "artifacts")))
+MANIFEST_NAME = "freshness-model.json"
 
 
-def _generate_synthetic_data(n=500):
+def _generate_synthetic_data(n=N_SAMPLES):
     """Generate synthetic dataset with same rules as the original repo."""
+    import pandas as pd
+
     data = []
     random.seed(RANDOM_STATE)
     for _ in range(n):
@@ -36,30 +56,147 @@ def _generate_synthetic_data(n=500):
 
 
 def train_model():
-    """Train RandomForest and scaler on synthetic data; return (scaler, model, label_encoder)."""
+    """Train RandomForest and scaler on synthetic data; return (scaler, model)."""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
     df = _generate_synthetic_data()
-    X = df[["Temperature", "Humidity", "Time", "Gas"]]
-    y = LabelEncoder().fit_transform(df["Label"])
+    X = df[FEATURES]
+    # Class index = position in LABELS, from Fresh to Spoiled (a LabelEncoder sorts the names, which puts
+    # Spoiled before Stale)
+    y = df["Label"].map(LABELS.index).to_numpy()
 
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
 
-    model = RandomForestClassifier(n_estimators=100, random_state=RANDOM_STATE)
+    model = RandomForestClassifier(n_estimators=N_ESTIMATORS, random_state=RANDOM_STATE)
     model.fit(X_scaled, y)
 
     return scaler, model
 
 
+def training_fingerprint() -> str:
+    """Hash of everything that determines the fitted model; an artifact from other settings is retrained."""
+    import sklearn
+
+    spec = {
+        "n_samples": N_SAMPLES,
+        "n_estimators": N_ESTIMATORS,
+        "random_state": RANDOM_STATE,
+        "features": FEATURES,
+        "labels": LABELS,
+        # Artifacts trained with LabelEncoder targets have Stale and Spoiled swapped
+        "targets": "LABELS.index",
+        "sklearn": sklearn.__version__,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_artifact(scaler, model, directory: Path = ARTIFACT_DIR) -> dict:
+    """
+    Save scaler + forest as one content-hashed file (uncompressed, so it can be memory-mapped)
+    plus a manifest. Returns the manifest.
+    """
+    import joblib
+    import sklearn
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f".freshness-{os.getpid()}.joblib.tmp"
+    joblib.dump({"scaler": scaler, "model": model}, tmp_path, compress=0)
+    sha256 = _file_sha256(tmp_path)
+    version = sha256[:12]
+    artifact_path = directory / f"freshness-{version}.joblib"
+    os.replace(tmp_path, artifact_path)
+
+    manifest = {
+        "version": version,
+        "file": artifact_path.name,
+        "sha256": sha256,
+        "training": training_fingerprint(),
+        "sklearn": sklearn.__version__,
+    }
+    manifest_tmp = directory / f".{MANIFEST_NAME}.{os.getpid()}.tmp"
+    manifest_tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(manifest_tmp, directory / MANIFEST_NAME)
+    return manifest
+
+
+def load_artifact(directory: Path = ARTIFACT_DIR):
+    """
+    Load (scaler, model, version) from the artifact directory.
+    Returns None when there is no manifest, the file is missing, its hash does not match,
+    or it was built with different training settings.
+    """
+    directory = Path(directory)
+    try:
+        manifest = json.loads((directory / MANIFEST_NAME).read_text())
+        artifact_path = directory / manifest["file"]
+        if manifest.get("training") != training_fingerprint():
+            return None
+        if _file_sha256(artifact_path) != manifest["sha256"]:
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    import joblib
+
+    bundle = joblib.load(artifact_path, mmap_mode="r")
+    return bundle["scaler"], bundle["model"], manifest["version"]
+
+
+def load_or_train(directory: Path = ARTIFACT_DIR, save: bool = True):
+    """
+    Return (scaler, model, version): the saved artifact if valid, otherwise a freshly trained model
+    (saved for the next start when save is True and the directory is writable).
+    """
+    loaded = load_artifact(directory)
+    if loaded is not None:
+        return loaded
+    scaler, model = train_model()
+    version = "unsaved"
+    if save:
+        try:
+            version = save_artifact(scaler, model, directory)["version"]
+        except OSError:
+            pass
+    return scaler, model, version
+
+
 def predict_freshness(scaler, model, temperature, humidity, time_stored, gas=200.0):
     """
     Predict Fresh (0), Stale (1), or Spoiled (2).
+    model is the sklearn forest or a CompiledForest (which already has the scaler folded in).
     Returns (label_string, freshness_index 0-100).
     """
-    import numpy as np
     X = np.array([[temperature, humidity, time_stored, gas]], dtype=float)
-    X_scaled = scaler.transform(X)
-    pred = model.predict(X_scaled)[0]
+    if isinstance(model, CompiledForest):
+        pred = model.predict(X)[0]
+    else:
+        X_scaled = scaler.transform(X)
+        pred = model.predict(X_scaled)[0]
     label = LABELS[pred]
     # Map to 0-100: Fresh=high, Stale=mid, Spoiled=low
     freshness_index = 90 if pred == 0 else (55 if pred == 1 else 20)
     return label, freshness_index
+
+
+def predict_freshness_batch(scaler, model, X: np.ndarray) -> np.ndarray:
+    """
+    Predict class indices (0 Fresh, 1 Stale, 2 Spoiled) for many rows at once.
+    X has shape (n, 4): temperature, humidity, time_stored, gas.
+    """
+    if len(X) == 0:
+        return np.empty(0, dtype=np.intp)
+    if isinstance(model, CompiledForest):
+        return np.asarray(model.predict(X), dtype=np.intp)
+    # Same arithmetic as scaler.transform, without per-call validation
+    X_scaled = (np.asarray(X, dtype=float) - scaler.mean_) / scaler.scale_
+    return np.asarray(model.predict(X_scaled), dtype=np.intp)
@@ -0,0 +1,172 @@
+"""
+Incremental per-donation freshness state for streamed sensor readings.
+A gateway sends readings tagged with a donation_id (temperature, humidity, optional gas and
+timestamp); storage time is derived from when the donation was first seen, temperature and
+humidity are smoothed over a rolling window, and a verdict is emitted only when the
+classification changes. State is kept in memory, bounded by LRU size and an idle TTL.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from batch import DEFAULT_GAS, RANGES, score
+
+MAX_STORED_HOURS = RANGES["time_stored_hours"][1]
+
+
+class DonationState:
+    __slots__ = ("first_seen", "last_seen", "last_touched", "temperature", "humidity", "classification")
+
+    def __init__(self, first_seen: float, window: int):
+        self.first_seen = first_seen  # reading time (unix seconds) the donation counts as stored from
+        self.last_seen = first_seen  # latest reading time
+        self.last_touched = 0.0  # server monotonic time of the latest update, for TTL eviction
+        self.temperature = deque(maxlen=window)
+        self.humidity = deque(maxlen=window)
+        self.classification = None
+
+
+def parse_reading(message: dict, now: float) -> tuple[str, float, float, float, float, float | None]:
+    """
+    Validate one reading; returns (donation_id, timestamp, temperature, humidity, gas, time_stored_hours).
+    time_stored_hours is None unless the sender provides it (e.g. food stored before the sensor was attached).
+    """
+    if not isinstance(message, dict):
+        raise ValueError("Each reading must be a JSON object")
+    donation_id = message.get("donation_id")
+    if not isinstance(donation_id, (str, int)) or isinstance(donation_id, bool) or donation_id == "":
+        raise ValueError("donation_id is required")
+    values = {}
+    for name in ("temperature", "humidity", "gas", "time_stored_hours"):
+        value = message.get(name)
+        if value is None:
+            if name in ("temperature", "humidity"):
+                raise ValueError(f"{name} is required")
+            values[name] = None
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be a number")
+        if not math.isfinite(value):
+            raise ValueError(f"{name} must be a finite number")
+        low, high = RANGES[name]
+        if not low <= value <= high:
+            raise ValueError(f"{name} out of range [{low}, {high}]")
+        values[name] = value
+    timestamp = message.get("timestamp", now)
+    try:
+        timestamp = float(timestamp)
+    except (TypeError, ValueError):
+        raise ValueError("timestamp must be unix seconds")
+    # Storage time is derived from it: NaN or inf would stick in first_seen / last_seen and reach the model
+    if not math.isfinite(timestamp):
+        raise ValueError("timestamp must be a finite number of unix seconds")
+    gas = DEFAULT_GAS if values["gas"] is None else values["gas"]
+    return str(donation_id), timestamp, values["temperature"], values["humidity"], gas, values["time_stored_hours"]
+
+
+class DonationStateStore:
+    """Thread-safe LRU + TTL map of donation_id -> DonationState."""
+
+    def __init__(self, max_donations: int = 100_000, ttl_seconds: float = 86_400.0, window: int = 12):
+        self.max_donations = max_donations
+        self.ttl_seconds = ttl_seconds
+        self.window = window
+        self._states: OrderedDict[str, DonationState] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _evict(self, now: float):
+        # Entries are kept in last-touched order, so expired ones are at the front
+        while self._states:
+            state = next(iter(self._states.values()))
+            if len(self._states) <= self.max_donations and now - state.last_touched <= self.ttl_seconds:
+                break
+            self._states.popitem(last=False)
+            self.evicted += 1
+
+    def ingest(self, scaler, model, messages: list) -> tuple[list[dict], list[dict]]:
+        """
+        Apply readings in order and score every touched donation in one vectorized pass.
+        Returns (changes, errors): changes holds one message per donation whose classification changed
+        (including its first verdict); errors holds one message per rejected reading.
+        """
+        wall, now = time.time(), time.monotonic()
+        errors = []
+        touched: dict[str, tuple[DonationState, float]] = {}
+        with self._lock:
+            for i, message in enumerate(messages):
+                try:
+                    donation_id, timestamp, temperature, humidity, gas, stored_hours = parse_reading(message, wall)
+                except ValueError as e:
+                    error = {"error": str(e), "index": i}
+                    if isinstance(message, dict) and "donation_id" in message:
+                        error["donation_id"] = message["donation_id"]
+                    errors.append(error)
+                    continue
+                state = self._states.get(donation_id)
+                if state is None:
+                    state = self._states[donation_id] = DonationState(timestamp, self.window)
+                else:
+                    self._states.move_to_end(donation_id)
+                if stored_hours is not None:
+                    state.first_seen = timestamp - stored_hours * 3600
+                state.first_seen = min(state.first_seen, timestamp)
+                state.last_seen = max(state.last_seen, timestamp)
+                state.last_touched = now
+                state.temperature.append(temperature)
+                state.humidity.append(humidity)
+                touched[donation_id] = (state, gas)
+            self._evict(now)
+            if not touched:
+                return [], errors
+
+            ids = list(touched)
+            X = np.empty((len(ids), 4))
+            for row, donation_id in enumerate(ids):
+                state, gas = touched[donation_id]
+                hours = (state.last_seen - state.first_seen) / 3600
+                X[row] = (
+                    sum(state.temperature) / len(state.temperature),
+                    sum(state.humidity) / len(state.humidity),
+                    min(hours, MAX_STORED_HOURS),
+                    gas,
+                )
+            classification, freshness_index = score(scaler, model, X)
+
+            changes = []
+            for row, donation_id in enumerate(ids):
+                state = touched[donation_id][0]
+                label = str(classification[row])
+                if label == state.classification:
+                    continue
+                changes.append({
+                    "donation_id": donation_id,
+                    "classification": label,
+                    "previous_classification": state.classification,
+                    "freshness_index": int(freshness_index[row]),
+                    "time_stored_hours": round(float(X[row, 2]), 3),
+                    "timestamp": state.last_seen,
+                })
+                state.classification = label
+        return changes, errors
+
+    def forget(self, donation_id: str) -> bool:
+        with self._lock:
+            return self._states.pop(str(donation_id), None) is not None
+
+    def stats(self) -> dict:
+        return {
+            "tracked_donations": len(self._states),
+            "max_donations": self.max_donations,
+            "ttl_seconds": self.ttl_seconds,
+            "window": self.window,
+            "evicted": self.evicted,
+        }
@@ -7,62 +7,110 @@ import os
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
 from PIL import Image
-from tensorflow.keras.applications.inception_v3 import preprocess_input
-from tensorflow.keras.preprocessing.image import img_to_array
 
 from classes import FOOD_101_CLASSES
+from ml_common.images import ImageSource, open_image
+from ml_common.metrics import stage
+from ml_common.runtimes import load_runtime_model
 
 INPUT_SIZE = (299, 299)
 
 
-def load_nutrition_csv(csv_path: str) -> pd.DataFrame | None:
-    """Load nutrition101.csv (columns: name, protein, calcium, fat, carbohydrates, vitamins)."""
+def load_local_model(path: str, backend: str = "auto"):
+    """Load the classifier in this process (also the shared inference process's loader; see main.load_classifier)."""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(
+            f"Model not found: {path}. "
+            "Clone https://github.com/MaharshSuryawala/Food-Image-Recognition and copy "
+            "best_model_101class.hdf5 to this service's models/ folder, or set FOOD_IMAGE_RECOGNITION_MODEL_PATH."
+        )
+    return load_runtime_model(path, backend)
+
+
+# CSV column -> response field
+NUTRITION_FIELDS = [
+    ("protein", "protein_g"),
+    ("calcium", "calcium_g"),
+    ("fat", "fat_g"),
+    ("carbohydrates", "carbohydrates_g"),
+    ("vitamins", "vitamins_g"),
+]
+
+
+def _name_key(name: str) -> str:
+    return str(name).strip().lower().replace("_", " ")
+
+
+def load_nutrition_csv(csv_path: str) -> list[dict | None] | None:
+    """
+    Load nutrition101.csv (columns: name, protein, calcium, fat, carbohydrates, vitamins) and compile it into
+    a list indexed by model class index (aligned with FOOD_101_CLASSES): one nutrition dict per class, or
+    None for classes missing from the CSV. Returns None when the CSV is missing or has no 'name' column.
+    """
     if not csv_path or not os.path.isfile(csv_path):
         return None
+    # Only needed here, at model load (pandas adds a few hundred ms to import)
+    import pandas as pd
+
     df = pd.read_csv(csv_path)
     # Repo CSV may have unnamed index column; ensure 'name' exists
     if "name" not in df.columns:
         return None
-    return df
+    by_name = {}
+    for record in df.to_dict("records"):
+        nutrition = {}
+        for column, field in NUTRITION_FIELDS:
+            value = record.get(column)
+            nutrition[field] = float(value) if value is not None and pd.notna(value) else None
+        # First row wins for duplicate names
+        by_name.setdefault(_name_key(record["name"]), nutrition)
+    return [by_name.get(_name_key(name)) for name in FOOD_101_CLASSES]
+
+
+def preprocess_image(image: ImageSource) -> np.ndarray:
+    """Decode image (bytes, buffer or path), resize to 299x299, apply InceptionV3 preprocessing. Shape (1, 299, 299, 3)."""
+    img = open_image(image, min_size=INPUT_SIZE)
+    with stage("resize"):
+        img = img.resize(INPUT_SIZE, Image.Resampling.BILINEAR)
+        # InceptionV3 preprocess_input: scale pixels to [-1, 1] (no Keras import needed)
+        arr = np.asarray(img, dtype=np.float32)[np.newaxis]
+        return arr / 127.5 - 1.0
 
 
-def preprocess_image(image_path: str) -> np.ndarray:
-    """Load image, resize to 299x299, apply InceptionV3 preprocessing. Shape (1, 299, 299, 3)."""
-    img = Image.open(image_path).convert("RGB")
-    img = img.resize(INPUT_SIZE, Image.Resampling.BILINEAR)
-    arr = img_to_array(img)
-    arr = np.expand_dims(arr, axis=0)
-    arr = preprocess_input(arr)
-    return arr
+def predict_probabilities(image: ImageSource, model) -> np.ndarray:
+    """Class probabilities (softmax output) for one image, shape (101,)."""
+    x = preprocess_image(image)
+    with stage("inference"):
+        return model.predict(x, verbose=0)[0]
+
+
+def top_classes(probs: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k most probable classes, best first (argpartition, then sort only those k)."""
+    k = max(1, min(k, len(probs)))
+    if k == 1:
+        return np.array([int(np.argmax(probs))])
+    top = np.argpartition(probs, -k)[-k:]
+    return top[np.argsort(probs[top])[::-1]]
+
+
+def describe_class(class_idx: int, probs: np.ndarray, nutrition_index: list[dict | None] | None) -> tuple[str, str, float, dict | None]:
+    """(food_class_id, food_name, confidence, nutrition_dict or None) for one class index."""
+    food_name = FOOD_101_CLASSES[class_idx] if class_idx < len(FOOD_101_CLASSES) else "unknown"
+    food_class = food_name.replace(" ", "_").replace("-", "_")
+    nutrition = None
+    if nutrition_index is not None and class_idx < len(nutrition_index):
+        nutrition = nutrition_index[class_idx]
+    return food_class, food_name, float(probs[class_idx]), nutrition
 
 
 def predict_and_nutrition(
-    image_path: str,
+    image: ImageSource,
     model,
-    nutrition_df: pd.DataFrame | None,
+    nutrition_index: list[dict | None] | None,
 ) -> tuple[str, str, float, dict | None]:
     """
     Run model on image. Returns (food_class_id, food_name, confidence, nutrition_dict or None).
     """
-    x = preprocess_image(image_path)
-    pred = model.predict(x, verbose=0)
-    class_idx = int(np.argmax(pred[0]))
-    confidence = float(pred[0][class_idx])
-    food_name = FOOD_101_CLASSES[class_idx] if class_idx < len(FOOD_101_CLASSES) else "unknown"
-    food_class = food_name.replace(" ", "_").replace("-", "_")
-
-    nutrition = None
-    if nutrition_df is not None and "name" in nutrition_df.columns:
-        row = nutrition_df[nutrition_df["name"].str.strip().str.lower() == food_name.strip().lower()]
-        if not row.empty:
-            r = row.iloc[0]
-            nutrition = {
-                "protein_g": float(r.get("protein", 0)) if pd.notna(r.get("protein")) else None,
-                "calcium_g": float(r.get("calcium", 0)) if pd.notna(r.get("calcium")) else None,
-                "fat_g": float(r.get("fat", 0)) if pd.notna(r.get("fat")) else None,
-                "carbohydrates_g": float(r.get("carbohydrates", 0)) if pd.notna(r.get("carbohydrates")) else None,
-                "vitamins_g": float(r.get("vitamins", 0)) if pd.notna(r.get("vitamins")) else None,
-            }
-    return food_class, food_name, confidence, nutrition
+    probs = predict_probabilities(image, model)
+    return describe_class(int(np.argmax(probs)), probs, nutrition_index)
@@ -3,90 +3,185 @@ FastAPI wrapper for Food-Image-Recognition (Food-101 classification + nutrition)
 https://github.com/MaharshSuryawala/Food-Image-Recognition
 
 Upload image → food class (101 classes) + optional nutrition (protein, fat, etc.).
+The model and nutrition table are loaded and warmed up in the background at startup; /livez and
+/readyz are the probes (see ml_common/readiness.py). A retrained model file is swapped in without a
+restart through /admin/model or MODEL_WATCH_SECONDS (see ml_common/model_swap.py).
 
 Run: uvicorn main:app --host 0.0.0.0 --port 8005
 """
 import os
-import tempfile
+import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from tensorflow.keras.models import load_model
-
-from evaluate import load_nutrition_csv, predict_and_nutrition
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Response
 
 MODEL_DIR = Path(__file__).resolve().parent
 DEFAULT_MODEL = MODEL_DIR / "models" / "best_model_101class.hdf5"
 DEFAULT_NUTRITION_CSV = MODEL_DIR / "nutrition101.csv"
 MODEL_PATH = os.environ.get("FOOD_IMAGE_RECOGNITION_MODEL_PATH", str(DEFAULT_MODEL))
 NUTRITION_CSV_PATH = os.environ.get("FOOD_IMAGE_RECOGNITION_NUTRITION_CSV", str(DEFAULT_NUTRITION_CSV))
+# keras, tflite, onnx, or auto (from the model file extension); see ml_common/runtimes.py
+MODEL_BACKEND = os.environ.get("FOOD_IMAGE_RECOGNITION_BACKEND", "auto")
+
+# Shared helpers (ml-services/ml_common)
+sys.path.insert(0, str(MODEL_DIR.parent))
+from ml_common.inference import InferencePool  # noqa: E402
+from ml_common.metrics import instrument, stage  # noqa: E402
+from ml_common.model_swap import ModelSwapper, add_model_admin, model_file_version  # noqa: E402
+from ml_common.readiness import ModelLoader, add_probes, preload, warmup_jpeg  # noqa: E402
+from ml_common.result_cache import ResultCache, file_fingerprint, variant  # noqa: E402
+from ml_common.runtimes import resolve_backend  # noqa: E402
+from ml_common.shared_inference import SHARED_INFERENCE, SharedModel  # noqa: E402
+from ml_common.uploads import limit_uploads, read_upload  # noqa: E402
+
+from evaluate import (  # noqa: E402
+    describe_class,
+    load_local_model,
+    load_nutrition_csv,
+    predict_probabilities,
+    top_classes,
+)
+
+# Fails at startup on an unknown backend rather than on the first request
+BACKEND = resolve_backend(MODEL_PATH, MODEL_BACKEND)
+
+
+def load_classifier(path: str = MODEL_PATH):
+    if SHARED_INFERENCE:
+        # One copy of InceptionV3 (and TensorFlow) per host, in the inference process; this worker only
+        # preprocesses and looks up nutrition. A new file version gets a new inference process.
+        return SharedModel(
+            MODEL_DIR.name, "evaluate.load_local_model", key=model_file_version(path), args=(path, BACKEND)
+        )
+    return load_local_model(path, BACKEND)
+
+
+def load_model():
+    global _nutrition
+    model = load_classifier()
+    # Nutrition per class index (compiled from the CSV once), or None without a CSV
+    _nutrition = load_nutrition_csv(NUTRITION_CSV_PATH)
+    return model
+
+
+def warm_up(model):
+    predict_probabilities(warmup_jpeg(), model)
+
+
+def parity_predict(model, image: bytes) -> tuple[int, float]:
+    """Best class and its probability for one held-out image, for the parity check of a swapped-in model."""
+    probs = predict_probabilities(image, model)
+    best = int(top_classes(probs, 1)[0])
+    return best, float(probs[best])
+
+
+_nutrition = None
+_loader = ModelLoader("food101", load_model, warm_up, version=lambda: model_file_version(MODEL_PATH))
+# Swaps replace the classifier only; the nutrition table stays
+_swapper = ModelSwapper(_loader, MODEL_PATH, load_classifier, parity_predict)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload(_loader)
+    _swapper.watch()
+    yield
+    if isinstance(_loader.model, SharedModel):
+        # Unlink this worker's ring now: uvicorn ends workers by re-raising the stop signal, skipping exit hooks
+        _loader.model.close()
+
 
 app = FastAPI(
     title="Food Image Recognition (Food-101 + Nutrition)",
     description="ResQ Meal - Food classification and nutrition from image (MaharshSuryawala/Food-Image-Recognition)",
     version="1.0.0",
+    lifespan=lifespan,
 )
+instrument(app, "food101")
+limit_uploads(app)
+add_probes(app, _loader)
+add_model_admin(app, _swapper)
 
-_model = None
-_nutrition_df = None
-
-
-def get_model():
-    global _model
-    if _model is None:
-        if not os.path.isfile(MODEL_PATH):
-            raise FileNotFoundError(
-                f"Model not found: {MODEL_PATH}. "
-                "Clone https://github.com/MaharshSuryawala/Food-Image-Recognition and copy "
-                "best_model_101class.hdf5 to this service's models/ folder, or set FOOD_IMAGE_RECOGNITION_MODEL_PATH."
-            )
-        _model = load_model(MODEL_PATH)
-    return _model
-
-
-def get_nutrition_df():
-    global _nutrition_df
-    if _nutrition_df is None:
-        _nutrition_df = load_nutrition_csv(NUTRITION_CSV_PATH)
-    return _nutrition_df
+# InceptionV3 is slow; running it off the event loop keeps /health responsive
+_pool = InferencePool.from_env(default_workers=1, name="food101")
+# Results for repeated images, keyed by content hash + nutrition file (+ active model version and top_k per request)
+_cache = ResultCache.from_env("food101")
+CACHE_VARIANT = variant(nutrition=file_fingerprint(NUTRITION_CSV_PATH))
 
 
 @app.get("/health")
 def health():
-    try:
-        get_model()
-        return {"status": "ok", "model_loaded": True, "nutrition_loaded": get_nutrition_df() is not None}
-    except FileNotFoundError as e:
-        return {"status": "degraded", "model_loaded": False, "message": str(e)}
+    """Service state; never waits for the model (status is loading until it is warm)."""
+    if _loader.state == "failed":
+        return {"status": "degraded", "model_loaded": False, "message": _loader.error}
+    out = {
+        "status": "ok" if _loader.ready else "loading",
+        "model_loaded": _loader.ready,
+        "model": _loader.stats(),
+        "model_version": _loader.version,
+        "backend": BACKEND,
+        "nutrition_loaded": _nutrition is not None,
+        "inference": _pool.stats(),
+        "cache": _cache.stats(),
+    }
+    if SHARED_INFERENCE and _loader.ready:
+        out["shared_inference"] = _loader.model.stats()
+    return out
+
+
+def infer(content: bytearray, top_k: int) -> tuple[list[tuple[str, str, float, dict | None]], str | None]:
+    """Best top_k classes, best first, as (food_class, food_name, confidence, nutrition), and the model version."""
+    model, version = _loader.get_versioned()
+    probs = predict_probabilities(content, model)
+    with stage("postprocess"):
+        return [describe_class(int(i), probs, _nutrition) for i in top_classes(probs, top_k)], version
+
+
+def class_result(food_class: str, food_name: str, confidence: float, nutrition: dict | None) -> dict:
+    out = {
+        "food_class": food_class,
+        "food_name": food_name,
+        "confidence": round(confidence, 4),
+    }
+    if nutrition:
+        out["nutrition"] = nutrition
+    return out
 
 
 @app.post("/evaluate")
-async def evaluate(file: UploadFile = File(...)):
-    """Upload image; returns food_class, food_name, confidence, and optional nutrition."""
+async def evaluate(
+    response: Response,
+    file: UploadFile = File(...),
+    top_k: int | None = Query(None, ge=1, le=101, description="Also return the k best classes"),
+):
+    """
+    Upload image; returns food_class, food_name, confidence, and optional nutrition.
+    With top_k, also returns the k best classes (with confidence and nutrition) in top_k.
+    """
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
-    try:
-        model = get_model()
-    except FileNotFoundError as e:
-        raise HTTPException(status_code=503, detail=str(e))
-
-    nutrition_df = get_nutrition_df()
-
-    suffix = Path(file.filename or "image").suffix or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
-    try:
-        food_class, food_name, confidence, nutrition = predict_and_nutrition(tmp_path, model, nutrition_df)
-        out = {
-            "food_class": food_class,
-            "food_name": food_name,
-            "confidence": round(confidence, 4),
-        }
-        if nutrition:
-            out["nutrition"] = nutrition
-        return out
-    finally:
-        if os.path.isfile(tmp_path):
-            os.unlink(tmp_path)
+    content = await read_upload(file)
+    version = _loader.version
+    cache_key = _cache.key(content, f"{CACHE_VARIANT}:{version}:{top_k or 0}")
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    with _pool.admit() as ticket:
+        try:
+            results, model_version = await _pool.run(infer, content, top_k or 1, ticket=ticket)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    ticket.apply_headers(response)
+    out = class_result(*results[0])
+    if top_k:
+        out["top_k"] = [class_result(*result) for result in results]
+    out["model_version"] = model_version
+    # Not cached under the version looked up when a swap happened meanwhile
+    if model_version == version:
+        _cache.put(cache_key, out)
+    response.headers["X-Cache"] = "miss"
+    return out
@@ -2,85 +2,292 @@
 FastAPI wrapper for Freshness_detection (Roboflow YOLO).
 https://github.com/Utkarsh-Shivhare/Freshness_detection
 
-Uses Roboflow object detection to find fresh/rotten produce in images.
-Requires ROBOFLOW_API_KEY (get from Roboflow). Optional: ROBOFLOW_PROJECT, ROBOFLOW_VERSION.
+Uses Roboflow object detection to find fresh/rotten produce in images, either through the hosted
+Roboflow API (ROBOFLOW_BACKEND=remote, needs ROBOFLOW_API_KEY; optional ROBOFLOW_PROJECT, ROBOFLOW_VERSION;
+see roboflow_client.py) or with an exported YOLO ONNX model on CPU (ROBOFLOW_BACKEND=local, see onnx_detector.py).
+/evaluate-video detects on sampled frames of a short clip (see ml_common/video.py).
+The local model is loaded and warmed up in the background at startup; /livez and /readyz are the
+probes (see ml_common/readiness.py).
 
 Run: uvicorn main:app --host 0.0.0.0 --port 8003
 """
+import asyncio
 import os
-import tempfile
+import sys
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
 
-import cv2
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from roboflow import Roboflow
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response
 
-from evaluate import aggregate_predictions
+MODEL_DIR = Path(__file__).resolve().parent
+
+# Shared helpers (ml-services/ml_common)
+sys.path.insert(0, str(MODEL_DIR.parent))
+from ml_common.images import decode_image_bgr  # noqa: E402
+from ml_common.inference import InferencePool, Ticket  # noqa: E402
+from ml_common.metrics import instrument  # noqa: E402
+from ml_common.readiness import ModelLoader, add_probes, preload, warmup_jpeg  # noqa: E402
+from ml_common.result_cache import ResultCache, file_fingerprint, variant  # noqa: E402
+from ml_common.uploads import limit_uploads, read_upload  # noqa: E402
+from ml_common.video import MAX_VIDEO_UPLOAD_BYTES, FrameSampler, check_video_upload, score_frames  # noqa: E402
+
+from evaluate import aggregate_predictions  # noqa: E402
+from roboflow_client import CircuitBreaker, CircuitOpenError, RoboflowClient, RoboflowError, encode_upload  # noqa: E402
+
+# remote: hosted Roboflow API; local: exported YOLO model with ONNX Runtime
+DETECTION_BACKEND = os.environ.get("ROBOFLOW_BACKEND", "remote").lower()
+if DETECTION_BACKEND not in ("remote", "local"):
+    raise ValueError("ROBOFLOW_BACKEND must be remote or local")
+# Local backend: ONNX export of the detector, optional class names (comma-separated or a file) and threads
+LOCAL_MODEL_PATH = os.environ.get("ROBOFLOW_LOCAL_MODEL_PATH", str(MODEL_DIR / "models" / "freshness-yolov8.onnx"))
+LOCAL_CLASS_NAMES = os.environ.get("ROBOFLOW_LOCAL_CLASSES") or None
+LOCAL_NUM_THREADS = int(os.environ.get("ROBOFLOW_LOCAL_NUM_THREADS", "0"))
 
 # Roboflow config: use your own API key (do not use the key from the original repo in production)
 ROBOFLOW_API_KEY = os.environ.get("ROBOFLOW_API_KEY", "")
 ROBOFLOW_PROJECT = os.environ.get("ROBOFLOW_PROJECT", "freshness-fruits-and-vegetables")
 ROBOFLOW_VERSION = int(os.environ.get("ROBOFLOW_VERSION", "7"))
+# Hosted detect endpoint (point it at a stand-in server to test, see roboflow_stub.py)
+ROBOFLOW_API_URL = os.environ.get("ROBOFLOW_API_URL", "https://detect.roboflow.com")
+# Uploads are downscaled so the longer side is at most this (the detector's input size) and re-encoded as JPEG
+ROBOFLOW_UPLOAD_MAX_SIDE = int(os.environ.get("ROBOFLOW_UPLOAD_MAX_SIDE", "640"))
+ROBOFLOW_UPLOAD_QUALITY = int(os.environ.get("ROBOFLOW_UPLOAD_QUALITY", "90"))
+# Per-attempt timeout, concurrent API calls, retries, and the circuit breaker
+ROBOFLOW_TIMEOUT_SECONDS = float(os.environ.get("ROBOFLOW_TIMEOUT_SECONDS", "10"))
+ROBOFLOW_MAX_CONCURRENCY = int(os.environ.get("ROBOFLOW_MAX_CONCURRENCY", "8"))
+ROBOFLOW_RETRIES = int(os.environ.get("ROBOFLOW_RETRIES", "2"))
+ROBOFLOW_BREAKER_FAILURES = int(os.environ.get("ROBOFLOW_BREAKER_FAILURES", "5"))
+ROBOFLOW_BREAKER_RESET_SECONDS = float(os.environ.get("ROBOFLOW_BREAKER_RESET_SECONDS", "30"))
+# Detection thresholds passed to Roboflow, and used by the local backend (percent)
+CONFIDENCE = 40
+OVERLAP = 30
+
+
+def check_remote_config():
+    if not ROBOFLOW_API_KEY:
+        raise ValueError(
+            "ROBOFLOW_API_KEY is not set. "
+            "Get an API key from https://app.roboflow.com and set ROBOFLOW_API_KEY."
+        )
+
+
+def load_local_model():
+    if not os.path.isfile(LOCAL_MODEL_PATH):
+        raise ValueError(
+            f"Local model not found: {LOCAL_MODEL_PATH}. "
+            "Export the project's YOLO model to ONNX (Roboflow or ultralytics export) and copy it there, "
+            "or set ROBOFLOW_LOCAL_MODEL_PATH."
+        )
+    from onnx_detector import OnnxYoloDetector
+
+    return OnnxYoloDetector(LOCAL_MODEL_PATH, LOCAL_CLASS_NAMES, LOCAL_NUM_THREADS)
+
+
+def warm_up_local(model):
+    image = decode_image_bgr(warmup_jpeg(), min_size=(model.input_size, model.input_size))
+    model.predict(image, confidence=CONFIDENCE, overlap=OVERLAP)
+
+
+if DETECTION_BACKEND == "local":
+    _loader = ModelLoader("roboflow_local", load_local_model, warm_up_local)
+else:
+    # Nothing to load: ready once configured (an unreachable API opens the breaker, it does not make the service unready)
+    _loader = ModelLoader("roboflow_remote", check_remote_config)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload(_loader)
+    yield
+    await _client.aclose()
+
 
 app = FastAPI(
     title="Freshness Detection (Roboflow YOLO)",
     description="ResQ Meal - Object detection for fresh/rotten produce (Utkarsh-Shivhare/Freshness_detection)",
     version="1.0.0",
+    lifespan=lifespan,
 )
+instrument(app, "roboflow")
+# Clips have their own, larger limit
+limit_uploads(app, path_limits={"/evaluate-video": MAX_VIDEO_UPLOAD_BYTES})
+add_probes(app, _loader)
 
-_model = None
+# Remote: the pool only decodes and re-encodes uploads (the API call is async); local: ONNX Runtime already uses every core
+_pool = InferencePool.from_env(default_workers=2 if DETECTION_BACKEND == "remote" else 1, name="roboflow")
+_client = RoboflowClient(
+    ROBOFLOW_API_KEY,
+    ROBOFLOW_PROJECT,
+    ROBOFLOW_VERSION,
+    base_url=ROBOFLOW_API_URL,
+    timeout=ROBOFLOW_TIMEOUT_SECONDS,
+    max_concurrency=ROBOFLOW_MAX_CONCURRENCY,
+    retries=ROBOFLOW_RETRIES,
+    breaker=CircuitBreaker(ROBOFLOW_BREAKER_FAILURES, ROBOFLOW_BREAKER_RESET_SECONDS),
+)
+# Results for repeated images (saves a Roboflow call), keyed by content hash + project version or local model
+_cache = ResultCache.from_env("roboflow")
+if DETECTION_BACKEND == "remote":
+    CACHE_VARIANT = variant(
+        project=ROBOFLOW_PROJECT,
+        version=ROBOFLOW_VERSION,
+        confidence=CONFIDENCE,
+        overlap=OVERLAP,
+        upload=(ROBOFLOW_UPLOAD_MAX_SIDE, ROBOFLOW_UPLOAD_QUALITY),
+    )
+else:
+    CACHE_VARIANT = variant(
+        model=file_fingerprint(LOCAL_MODEL_PATH), classes=LOCAL_CLASS_NAMES, confidence=CONFIDENCE, overlap=OVERLAP
+    )
 
 
-def get_model():
-    global _model
-    if _model is None:
-        if not ROBOFLOW_API_KEY:
-            raise ValueError(
-                "ROBOFLOW_API_KEY is not set. "
-                "Get an API key from https://app.roboflow.com and set ROBOFLOW_API_KEY."
-            )
-        rf = Roboflow(api_key=ROBOFLOW_API_KEY)
-        project = rf.workspace().project(ROBOFLOW_PROJECT)
-        _model = project.version(ROBOFLOW_VERSION).model
-    return _model
+def get_local_model():
+    return _loader.get()
 
 
 @app.get("/health")
 def health():
+    """Remote: configuration and client/breaker state, without calling the API. Local: model state (never waits for it)."""
+    if _loader.state == "failed":
+        return {"status": "degraded", "model_loaded": False, "backend": DETECTION_BACKEND, "message": _loader.error}
+    out = {
+        "status": "ok" if _loader.ready else "loading",
+        "model_loaded": _loader.ready,
+        "backend": DETECTION_BACKEND,
+        "model": _loader.stats(),
+        "inference": _pool.stats(),
+        "cache": _cache.stats(),
+    }
+    if DETECTION_BACKEND == "remote":
+        out["remote"] = _client.stats()
+        if _client.breaker.state == "open":
+            out["status"] = "degraded"
+    return out
+
+
+def infer_local(content) -> list:
+    """Decode and run the local detector (blocking); returns predictions in Roboflow's shape."""
     try:
-        get_model()
-        return {"status": "ok", "model_loaded": True}
-    except Exception as e:
-        return {"status": "degraded", "model_loaded": False, "message": str(e)}
+        model = get_local_model()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        # Only the model input size is needed (with IMAGE_DRAFT_DECODE=1 boxes are then in draft-decoded
+        # pixels; only classes and confidences are used)
+        image = decode_image_bgr(content, min_size=(model.input_size, model.input_size))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Could not read image")
+    return model.predict(image, confidence=CONFIDENCE, overlap=OVERLAP)
+
+
+def prepare_upload(content) -> bytes:
+    try:
+        return encode_upload(content, ROBOFLOW_UPLOAD_MAX_SIDE, ROBOFLOW_UPLOAD_QUALITY)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Could not read image")
+
+
+@contextmanager
+def remote_errors():
+    """Map the Roboflow client's errors to 503 (circuit open) and 502 (upstream failure)."""
+    try:
+        yield
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(round(e.retry_after))})
+    except RoboflowError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+async def detect(content, ticket: Ticket | None = None) -> list:
+    if DETECTION_BACKEND == "local":
+        return await _pool.run(infer_local, content, ticket=ticket)
+    try:
+        check_remote_config()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    with remote_errors():
+        # Fail fast while the upstream is down, before decoding and re-encoding the upload
+        _client.breaker.fail_fast()
+        upload = await _pool.run(prepare_upload, content, ticket=ticket)
+        return await _client.detect(upload, CONFIDENCE, OVERLAP)
+
+
+async def detect_frames(images: list) -> list:
+    """
+    Predictions per frame of a batch. The clip holds one ticket, so its pool work (local detection, or
+    encoding the uploads) runs on one worker, a frame at a time; remote API calls then go out together.
+    """
+    if DETECTION_BACKEND == "local":
+        return await _pool.run(lambda: [infer_local(image) for image in images])
+    with remote_errors():
+        _client.breaker.fail_fast()
+        uploads = await _pool.run(lambda: [prepare_upload(image) for image in images])
+        # Waiting on the network, not on the pool (bounded by ROBOFLOW_MAX_CONCURRENCY)
+        return await asyncio.gather(*(_client.detect(upload, CONFIDENCE, OVERLAP) for upload in uploads))
 
 
 @app.post("/evaluate")
-async def evaluate(file: UploadFile = File(...)):
+async def evaluate(response: Response, file: UploadFile = File(...)):
     """Upload image; runs YOLO detection and returns classification (fresh/rotten/mixed) and freshness_index (0-100)."""
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
-    try:
-        model = get_model()
-    except ValueError as e:
-        raise HTTPException(status_code=503, detail=str(e))
+    content = await read_upload(file)
+    cache_key = _cache.key(content, CACHE_VARIANT)
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    with _pool.admit() as ticket:
+        predictions = await detect(content, ticket)
+    ticket.apply_headers(response)
+    classification, freshness_index = aggregate_predictions(predictions)
+    # Normalize classification for backend: fresh | rotten | mixed
+    result = {
+        "classification": classification,
+        "freshness_index": freshness_index,
+    }
+    _cache.put(cache_key, result)
+    response.headers["X-Cache"] = "miss"
+    return result
 
-    suffix = Path(file.filename or "image").suffix or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
-    try:
-        image = cv2.imread(tmp_path)
-        if image is None:
-            raise HTTPException(status_code=400, detail="Could not read image")
-        results = model.predict(image, confidence=40, overlap=30).json()
-        predictions = results.get("predictions") or []
-        classification, freshness_index = aggregate_predictions(predictions)
-        # Normalize classification for backend: fresh | rotten | mixed
-        return {
-            "classification": classification,
-            "freshness_index": freshness_index,
-        }
-    finally:
-        if os.path.isfile(tmp_path):
-            os.unlink(tmp_path)
+
+def detector_side() -> int:
+    """Frame side to sample clips at: the local detector's input, or the remote upload size."""
+    if DETECTION_BACKEND == "local":
+        return get_local_model().input_size
+    check_remote_config()
+    return ROBOFLOW_UPLOAD_MAX_SIDE
+
+
+def open_video(video, side: int) -> FrameSampler:
+    return FrameSampler(video, min_size=(side, side))
+
+
+@app.post("/evaluate-video")
+async def evaluate_video(response: Response, file: UploadFile = File(...)):
+    """
+    Upload a short clip; frames are sampled and detected on a batch at a time, stopping once the frames'
+    verdicts agree. The predictions of all scored frames are aggregated as for one image; frame counts
+    (frames_scored, frames_decoded, early_exit, agreement, ...) are under video.
+    """
+    video = check_video_upload(file)
+    with _pool.admit() as ticket:
+        try:
+            side = await _pool.run(detector_side, ticket=ticket)
+        except ValueError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        try:
+            sampler = await _pool.run(open_video, video, side)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            frames, summary = await score_frames(
+                _pool, sampler, detect_frames, lambda predictions: aggregate_predictions(predictions)[0], ticket=ticket
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            sampler.close()
+    ticket.apply_headers(response)
+    classification, freshness_index = aggregate_predictions([p for predictions in frames for p in predictions])
+    return {"classification": classification, "freshness_index": freshness_index, "video": summary}
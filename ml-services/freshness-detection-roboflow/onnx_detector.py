@@ -0,0 +1,172 @@
+"""
+Local YOLO detection with ONNX Runtime, as an alternative to the hosted Roboflow API.
+Takes a YOLOv8-style ONNX export (Roboflow / ultralytics: input (1, 3, S, S), output (1, 4 + classes, N))
+or a YOLOv5-style one (output (1, N, 5 + classes), with an objectness column), and returns
+predictions shaped like Roboflow's JSON ('x', 'y', 'width', 'height', 'confidence', 'class', 'class_id'),
+so evaluate.aggregate_predictions() takes either.
+
+Post-processing is vectorized NumPy: confidence filtering over all candidates at once, then
+class-aware NMS (boxes offset per class so one NMS pass never suppresses across classes) with
+one vectorized IoU row per kept box.
+"""
+import ast
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from ml_common.metrics import stage
+
+# Letterbox padding value used by YOLO training pipelines
+PAD_VALUE = 114
+# Candidates kept (by score) before NMS, and detections kept after it
+MAX_CANDIDATES = 3000
+MAX_DETECTIONS = 300
+
+
+def read_class_names(session, override: str | None = None) -> list[str]:
+    """
+    Class names from override (comma-separated, or a file with one name per line), else from the
+    model's "names" metadata (ultralytics writes "{0: 'fresh_apple', ...}").
+    """
+    if override:
+        if os.path.isfile(override):
+            with open(override, encoding="utf-8") as f:
+                return [line.strip() for line in f if line.strip()]
+        return [name.strip() for name in override.split(",")]
+    names = session.get_modelmeta().custom_metadata_map.get("names")
+    if not names:
+        return []
+    parsed = ast.literal_eval(names)
+    if isinstance(parsed, dict):
+        return [str(parsed[i]) for i in sorted(parsed)]
+    return [str(name) for name in parsed]
+
+
+def letterbox(image: np.ndarray, size: int) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """Resize keeping aspect ratio and pad to size x size; returns (image, scale, (pad_x, pad_y))."""
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = round(w * scale), round(h * scale)
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, left = round(pad_y - 0.1), round(pad_x - 0.1)
+    out = cv2.copyMakeBorder(
+        image, top, size - new_h - top, left, size - new_w - left, cv2.BORDER_CONSTANT, value=(PAD_VALUE,) * 3
+    )
+    return out, scale, (left, top)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, max_detections: int = MAX_DETECTIONS) -> np.ndarray:
+    """Greedy NMS on xyxy boxes; returns kept indices, best first. Each step is one vectorized IoU row."""
+    x1, y1, x2, y2 = boxes.T
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size and len(keep) < max_detections:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess(
+    output: np.ndarray,
+    confidence: float,
+    iou_threshold: float,
+    num_classes: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Raw model output (one image) -> (xyxy boxes, scores, class ids) in model input pixels.
+    YOLOv8 rows are (cx, cy, w, h, class scores...); YOLOv5 rows add objectness before the class scores.
+    """
+    output = np.asarray(output, dtype=np.float32)
+    if output.ndim == 3:
+        output = output[0]
+    # v8 exports are (attributes, candidates); there are always far more candidates than attributes
+    if output.shape[0] < output.shape[1]:
+        output = output.T
+    attributes = output.shape[1]
+    if num_classes is not None and attributes == num_classes + 5:
+        class_scores = output[:, 5:] * output[:, 4:5]
+    else:
+        class_scores = output[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_scores)), class_ids]
+
+    mask = scores >= confidence
+    boxes, scores, class_ids = output[mask, :4], scores[mask], class_ids[mask]
+    if len(scores) > MAX_CANDIDATES:
+        top = np.argpartition(-scores, MAX_CANDIDATES)[:MAX_CANDIDATES]
+        boxes, scores, class_ids = boxes[top], scores[top], class_ids[top]
+    xyxy = np.empty_like(boxes)
+    xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+    xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+    if not len(scores):
+        return xyxy, scores, class_ids
+    # Shift each class into its own region so a single NMS pass stays per class
+    offsets = class_ids[:, None].astype(np.float32) * (float(xyxy.max() - xyxy.min()) + 1)
+    keep = nms(xyxy + offsets, scores, iou_threshold)
+    return xyxy[keep], scores[keep], class_ids[keep]
+
+
+class OnnxYoloDetector:
+    def __init__(self, model_path: str, class_names: str | None = None, num_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Square input (dynamic exports fall back to 640, the YOLO default)
+        side = model_input.shape[2]
+        self.input_size = side if isinstance(side, int) else 640
+        self.class_names = read_class_names(self.session, class_names)
+        self._lock = threading.Lock()
+
+    def class_name(self, class_id: int) -> str:
+        return self.class_names[class_id] if class_id < len(self.class_names) else str(class_id)
+
+    def preprocess(self, image_bgr: np.ndarray) -> tuple[np.ndarray, float, tuple[int, int]]:
+        padded, scale, pad = letterbox(image_bgr, self.input_size)
+        x = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)[np.newaxis]
+        return np.ascontiguousarray(x, dtype=np.float32) / 255.0, scale, pad
+
+    def predict(self, image_bgr: np.ndarray, confidence: float = 40, overlap: float = 30) -> list[dict]:
+        """
+        Detect on a BGR image; confidence and overlap are percents, as in Roboflow's model.predict.
+        Boxes are centre x/y, width and height in the given image's pixels.
+        """
+        with stage("resize"):
+            x, scale, (pad_x, pad_y) = self.preprocess(image_bgr)
+        # onnxruntime sessions are thread-safe, but one run at a time keeps intra-op threads from contending
+        with self._lock, stage("inference"):
+            output = self.session.run(None, {self.input_name: x})[0]
+        with stage("postprocess"):
+            boxes, scores, class_ids = postprocess(
+                output, confidence / 100, overlap / 100, len(self.class_names) or None
+            )
+        boxes = (boxes - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / scale
+        h, w = image_bgr.shape[:2]
+        boxes = np.clip(boxes, 0, [w, h, w, h])
+        return [
+            {
+                "x": round(float((x1 + x2) / 2), 1),
+                "y": round(float((y1 + y2) / 2), 1),
+                "width": round(float(x2 - x1), 1),
+                "height": round(float(y2 - y1), 1),
+                "confidence": round(float(score), 4),
+                "class": self.class_name(int(class_id)),
+                "class_id": int(class_id),
+            }
+            for (x1, y1, x2, y2), score, class_id in zip(boxes, scores, class_ids)
+        ]
@@ -0,0 +1,220 @@
+"""
+Async client for Roboflow's hosted detection API (POST {base_url}/{project}/{version}).
+Replaces the roboflow SDK on the request path: no workspace/project discovery, one pooled
+keep-alive connection set, and the image is uploaded as a JPEG already downscaled to the
+detector's input size.
+
+Every call has a per-attempt timeout and waits for one of max_concurrency slots. Connection
+errors, timeouts, 429 and 5xx are retried with exponential backoff and full jitter. After
+failure_threshold failed calls in a row the circuit breaker opens, and calls fail at once for
+reset_seconds; one probe is then let through (half-open). The base URL is configurable so the
+client can be pointed at a local stand-in server (see roboflow_stub.py).
+"""
+import asyncio
+import base64
+import io
+import random
+import time
+
+import httpx
+
+from ml_common.images import ImageSource, open_image
+from ml_common.metrics import stage
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RoboflowError(Exception):
+    """The API answered with an error that retrying will not fix, or retries ran out."""
+
+
+class CircuitOpenError(RoboflowError):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Roboflow API unavailable; retrying after {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open (fail fast) -> half-open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def fail_fast(self):
+        """Raise CircuitOpenError while open, so callers can skip work before the call (does not take the probe)."""
+        if self.state == "open":
+            self._reject()
+
+    def check(self) -> bool:
+        """Raise CircuitOpenError unless a call may go out now; True when that call is the half-open probe."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self._reject()
+
+    def release_probe(self):
+        """Give the probe back when it ended without a verdict (e.g. cancelled), so the next call can probe."""
+        self._probing = False
+
+    def _reject(self):
+        self.rejected += 1
+        remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+        raise CircuitOpenError(max(1.0, remaining))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_seconds": self.reset_seconds,
+            "rejected": self.rejected,
+        }
+
+
+def encode_upload(image: ImageSource, max_side: int = 640, quality: int = 90) -> bytes:
+    """
+    Decode (draft-scaled with IMAGE_DRAFT_DECODE=1), shrink so the longer side is at most max_side, and JPEG-encode once.
+    The hosted detector resizes to its input size anyway, so larger uploads only cost bandwidth.
+    """
+    from PIL import Image
+
+    img = open_image(image, min_size=(max_side, max_side))
+    with stage("encode"):
+        scale = max_side / max(img.size)
+        if scale < 1:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.Resampling.BILINEAR)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=quality)
+        return buf.getvalue()
+
+
+class RoboflowClient:
+    def __init__(
+        self,
+        api_key: str,
+        project: str,
+        version: int,
+        base_url: str = "https://detect.roboflow.com",
+        timeout: float = 10.0,
+        max_concurrency: int = 8,
+        retries: int = 2,
+        backoff_seconds: float = 0.2,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.api_key = api_key
+        self.path = f"/{project}/{version}"
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.retries = max(0, int(retries))
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self._client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.requests = 0
+        self.retried = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created on first use, inside the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def detect(self, jpeg: bytes, confidence: float, overlap: float) -> list:
+        """Predictions for one JPEG (confidence and overlap in percent), as in the SDK's .json()["predictions"]."""
+        probe = self.breaker.check()
+        try:
+            return await self._detect(jpeg, confidence, overlap)
+        except BaseException:
+            # A probe that neither succeeded nor failed (client gone, unexpected error) must not keep the
+            # breaker half-open with the probe taken forever
+            if probe:
+                self.breaker.release_probe()
+            raise
+
+    async def _detect(self, jpeg: bytes, confidence: float, overlap: float) -> list:
+        client = self._get_client()
+        params = {"api_key": self.api_key, "confidence": confidence, "overlap": overlap}
+        body = base64.b64encode(jpeg)
+        async with self._semaphore:
+            # Time on the wire, retries and backoff included
+            with stage("remote"):
+                for attempt in range(self.retries + 1):
+                    self.requests += 1
+                    try:
+                        response = await client.post(
+                            self.path,
+                            params=params,
+                            content=body,
+                            headers={"Content-Type": "application/x-www-form-urlencoded"},
+                        )
+                    except (httpx.TimeoutException, httpx.TransportError) as e:
+                        error = f"{type(e).__name__}: {e}"
+                    else:
+                        if response.status_code < 400:
+                            try:
+                                payload = response.json()
+                            except ValueError:
+                                payload = None
+                            if not isinstance(payload, dict):
+                                # Not a detection reply (e.g. an HTML page from a proxy): a failing upstream, a 502
+                                self.breaker.record_failure()
+                                raise RoboflowError(f"Malformed Roboflow response: {response.text[:200]}")
+                            self.breaker.record_success()
+                            return payload.get("predictions") or []
+                        error = f"HTTP {response.status_code}: {response.text[:200]}"
+                        if response.status_code not in RETRY_STATUS:
+                            # Bad key or project: the upstream is up, so it counts as reachable for the breaker
+                            self.breaker.record_success()
+                            raise RoboflowError(error)
+                    if attempt < self.retries:
+                        self.retried += 1
+                        await asyncio.sleep(random.uniform(0, self.backoff_seconds * 2**attempt))
+        self.breaker.record_failure()
+        raise RoboflowError(f"Roboflow API failed after {self.retries + 1} attempts ({error})")
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "timeout_seconds": self.timeout,
+            "max_concurrency": self.max_concurrency,
+            "retries": self.retries,
+            "requests": self.requests,
+            "retried": self.retried,
+            "breaker": self.breaker.stats(),
+        }
@@ -0,0 +1,66 @@
+"""
+Stand-in for Roboflow's hosted detect API, for testing the remote client without a key or network.
+Answers POST /{project}/{version} (base64 image body) with canned predictions, after an optional
+delay and with an optional failure rate.
+
+Run: uvicorn roboflow_stub:app --port 9003
+Then: ROBOFLOW_API_URL=http://localhost:9003 ROBOFLOW_API_KEY=test uvicorn main:app --port 8003
+
+Environment: STUB_LATENCY_MS (default 50), STUB_FAILURE_RATE (0-1, answered with 503; default 0),
+STUB_CLASSES (comma-separated classes to detect; default "fresh_apple,rotten_banana").
+"""
+import asyncio
+import base64
+import binascii
+import io
+import os
+import random
+
+from fastapi import FastAPI, HTTPException, Request
+
+LATENCY_MS = float(os.environ.get("STUB_LATENCY_MS", "50"))
+FAILURE_RATE = float(os.environ.get("STUB_FAILURE_RATE", "0"))
+CLASSES = [c.strip() for c in os.environ.get("STUB_CLASSES", "fresh_apple,rotten_banana").split(",") if c.strip()]
+
+app = FastAPI(title="Roboflow detect stand-in")
+stats = {"requests": 0, "failures": 0, "bytes": 0, "last_image_size": None}
+
+
+@app.post("/{project}/{version}")
+async def detect(project: str, version: int, request: Request, api_key: str = "", confidence: float = 40, overlap: float = 30):
+    stats["requests"] += 1
+    body = await request.body()
+    stats["bytes"] += len(body)
+    if not api_key:
+        raise HTTPException(status_code=403, detail="Missing api_key")
+    await asyncio.sleep(LATENCY_MS / 1000)
+    if random.random() < FAILURE_RATE:
+        stats["failures"] += 1
+        raise HTTPException(status_code=503, detail="Stub failure")
+    try:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(base64.b64decode(body, validate=True)))
+        width, height = image.size
+    except (binascii.Error, OSError):
+        raise HTTPException(status_code=400, detail="Body is not a base64 image")
+    stats["last_image_size"] = [width, height]
+    predictions = [
+        {
+            "x": width * (i + 1) / (len(CLASSES) + 1),
+            "y": height / 2,
+            "width": width / 4,
+            "height": height / 4,
+            "confidence": 0.9 - 0.1 * i,
+            "class": name,
+            "class_id": i,
+        }
+        for i, name in enumerate(CLASSES)
+        if 0.9 - 0.1 * i >= confidence / 100
+    ]
+    return {"predictions": predictions, "image": {"width": width, "height": height}}
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
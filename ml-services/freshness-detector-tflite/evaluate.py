@@ -9,6 +9,9 @@ import os
 import numpy as np
 from PIL import Image
 
+from ml_common.images import ImageSource, open_image
+from ml_common.metrics import stage
+
 # Class names in model output order (index 0-11)
 CLASS_NAMES = [
     "fresh_apple", "stale_apple",
@@ -22,43 +25,91 @@ CLASS_NAMES = [
 ITEM_TYPES = ["apple", "banana", "bitter_gourd", "capsicum", "orange", "tomato"]
 
 
-def preprocess_image(image_path: str, input_height: int, input_width: int, dtype_name: str) -> np.ndarray:
-    """Load image, resize to model input size, normalize. Returns shape (1, H, W, 3)."""
-    img = Image.open(image_path).convert("RGB")
+class InterpreterSlot:
+    """
+    One TFLite interpreter with its tensor metadata resolved once at load.
+    Input pixels go through a 256-entry lookup table straight into the interpreter's input buffer,
+    so every input dtype (uint8, int8, float32) is a single uint8 -> input conversion.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        interpreter.allocate_tensors()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        self.input_index = input_details["index"]
+        self.output_index = output_details["index"]
+        self.input_height = int(input_details["shape"][1])
+        self.input_width = int(input_details["shape"][2])
+        # Callable returning a numpy view on the input buffer (must not be held across invoke())
+        self._input_view = interpreter.tensor(self.input_index)
+
+        dtype = np.dtype(input_details["dtype"])
+        pixels = np.arange(256, dtype=np.float32)
+        if dtype == np.uint8:
+            # uint8 models take raw 0-255 pixels
+            lut = pixels
+        elif np.issubdtype(dtype, np.integer):
+            scale, zero_point = input_details.get("quantization", (0.0, 0))
+            lut = np.round(pixels / 255.0 / scale + zero_point) if scale else pixels
+            info = np.iinfo(dtype)
+            lut = np.clip(lut, info.min, info.max)
+        else:
+            lut = pixels / 255.0
+        self.input_lut = lut.astype(dtype)
+
+        out_scale, out_zero_point = output_details.get("quantization", (0.0, 0))
+        self.output_scale = float(out_scale) if np.issubdtype(np.dtype(output_details["dtype"]), np.integer) else 0.0
+        self.output_zero_point = int(out_zero_point)
+
+    def set_input(self, image: ImageSource):
+        """Decode, resize and write the image into the interpreter's input buffer."""
+        size = (self.input_width, self.input_height)
+        img = open_image(image, min_size=size)
+        with stage("resize"):
+            img = img.resize(size, Image.Resampling.BILINEAR)
+            np.take(self.input_lut, np.asarray(img), out=self._input_view()[0])
+
+    def invoke(self) -> np.ndarray:
+        """Run the model; returns class scores (dequantized for quantized outputs)."""
+        with stage("inference"):
+            self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_index)[0]
+        if self.output_scale:
+            output = (output.astype(np.float32) - self.output_zero_point) * self.output_scale
+        return output
+
+
+def preprocess_image(image: ImageSource, input_height: int, input_width: int, dtype_name: str) -> np.ndarray:
+    """Decode image (bytes, buffer or path), resize to model input size, normalize. Returns shape (1, H, W, 3)."""
+    img = open_image(image, min_size=(input_width, input_height))
     img = img.resize((input_width, input_height), Image.Resampling.BILINEAR)
-    arr = np.array(img, dtype=np.float32) / 255.0
-    if dtype_name == "uint8":
-        arr = (arr * 255).astype(np.uint8)
-    arr = np.expand_dims(arr, axis=0)
-    return arr
+    arr = np.asarray(img)
+    if dtype_name != "uint8":
+        arr = arr.astype(np.float32) / 255.0
+    return np.expand_dims(arr, axis=0)
 
 
-def run_inference(interpreter, image_path: str) -> tuple[str, str, int]:
+def classify(interpreter, image: ImageSource) -> tuple[str, float]:
     """
-    Run TFLite model on image.
-    Returns (classification: 'fresh'|'stale', item_type: str, freshness_index: 0-100).
+    Run TFLite model on image. interpreter is an InterpreterSlot (a bare interpreter is wrapped,
+    resolving its metadata on every call).
+    Returns (class_name, confidence: the best class's score, 0-1).
     """
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-    shape = input_details[0]["shape"]
-    dtype = input_details[0]["dtype"]
-    dtype_name = np.dtype(dtype).name if hasattr(dtype, "name") else str(dtype)
-    h, w = int(shape[1]), int(shape[2])
-
-    input_data = preprocess_image(image_path, h, w, dtype_name)
-    if dtype_name == "uint8" and input_data.dtype != np.uint8:
-        scale, zero_point = input_details[0].get("quantization", (1.0, 0))
-        input_data = np.round(input_data / scale + zero_point).astype(np.uint8)
-
-    interpreter.set_tensor(input_details[0]["index"], input_data)
-    interpreter.invoke()
-    output = interpreter.get_tensor(output_details[0]["index"])[0]
+    slot = interpreter if isinstance(interpreter, InterpreterSlot) else InterpreterSlot(interpreter)
+    slot.set_input(image)
+    output = slot.invoke()
 
     class_idx = int(np.argmax(output))
     class_name = CLASS_NAMES[class_idx] if class_idx < len(CLASS_NAMES) else "fresh_tomato"
+    confidence = float(output[class_idx]) if len(output) > class_idx else 1.0
+    return class_name, confidence
+
+
+def describe_class(class_name: str, confidence: float) -> tuple[str, str, int]:
+    """(classification: 'fresh'|'stale', item_type: str, freshness_index: 0-100) for a classify() result."""
     is_fresh = class_name.startswith("fresh_")
     item_type = class_name.replace("fresh_", "").replace("stale_", "")
-    confidence = float(output[class_idx]) if len(output) > class_idx else 1.0
     freshness_index = round(confidence * 100) if is_fresh else round((1 - confidence) * 100)
     freshness_index = max(0, min(100, freshness_index))
     if not is_fresh:
@@ -66,3 +117,26 @@ def run_inference(interpreter, image_path: str) -> tuple[str, str, int]:
 
     classification = "fresh" if is_fresh else "stale"
     return classification, item_type, freshness_index
+
+
+def run_inference(interpreter, image: ImageSource) -> tuple[str, str, int]:
+    """
+    Run TFLite model on image (see classify).
+    Returns (classification: 'fresh'|'stale', item_type: str, freshness_index: 0-100).
+    """
+    return describe_class(*classify(interpreter, image))
+
+
+def aggregate_frames(results: list[tuple[str, str, int]]) -> tuple[str, str, int]:
+    """
+    Merge per-frame run_inference results of one clip: the majority classification, the item type
+    seen most often in those frames, and the mean freshness_index (capped at 45 when stale, as per frame).
+    """
+    classifications = [classification for classification, _, _ in results]
+    classification = max(("fresh", "stale"), key=classifications.count)
+    item_types = [item_type for c, item_type, _ in results if c == classification]
+    item_type = max(dict.fromkeys(item_types), key=item_types.count)
+    freshness_index = round(sum(index for _, _, index in results) / len(results))
+    if classification == "stale":
+        freshness_index = min(freshness_index, 45)
+    return classification, item_type, freshness_index
@@ -0,0 +1,58 @@
+"""
+Pool of TFLite interpreters for concurrent requests.
+A TFLite Interpreter is not thread-safe, so each request checks out its own slot
+(interpreter + cached tensor metadata, see evaluate.InterpreterSlot) and returns it afterwards.
+"""
+import contextlib
+import queue
+import sys
+
+from evaluate import InterpreterSlot
+
+
+def create_interpreter(interpreter_class, model_path: str, num_threads: int, use_xnnpack: bool):
+    """
+    Build one interpreter of interpreter_class (see ml_common.runtimes.import_tflite_interpreter); XNNPACK
+    is applied through the default delegates unless disabled.
+    """
+    # OpResolverType sits beside Interpreter in tflite_runtime, ai_edge_litert and tensorflow.lite alike
+    resolver = sys.modules[interpreter_class.__module__].OpResolverType
+    op_resolver_type = resolver.AUTO if use_xnnpack else resolver.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    return interpreter_class(
+        model_path=model_path,
+        num_threads=num_threads,
+        experimental_op_resolver_type=op_resolver_type,
+    )
+
+
+class InterpreterPool:
+    def __init__(
+        self, interpreter_class, model_path: str, size: int = 2, num_threads: int = 2, use_xnnpack: bool = True
+    ):
+        self.size = max(1, int(size))
+        self.num_threads = max(1, int(num_threads))
+        self.use_xnnpack = use_xnnpack
+        self._slots: queue.Queue = queue.Queue()
+        for _ in range(self.size):
+            interpreter = create_interpreter(interpreter_class, model_path, self.num_threads, use_xnnpack)
+            slot = InterpreterSlot(interpreter)
+            self._slots.put(slot)
+        # Model input (width, height), the same for every slot
+        self.input_size = (slot.input_width, slot.input_height)
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Check out one slot, blocking until one is free."""
+        slot = self._slots.get()
+        try:
+            yield slot
+        finally:
+            self._slots.put(slot)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "available": self._slots.qsize(),
+            "num_threads": self.num_threads,
+            "xnnpack": self.use_xnnpack,
+        }
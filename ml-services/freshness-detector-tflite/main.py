@@ -3,76 +3,180 @@ FastAPI wrapper for Freshness-Detector (TensorFlow Lite).
 https://github.com/Kayuemkhan/Freshness-Detector
 
 12 classes: 6 items × (fresh / stale). Upload image → classification + item type.
+Requests run concurrently on a pool of interpreters (see interpreter_pool.py).
+/evaluate-video scores sampled frames of a short clip (see ml_common/video.py).
+The interpreters are created and warmed up in the background at startup (TensorFlow is imported
+there, not at module import); /livez and /readyz are the probes (see ml_common/readiness.py).
 
 Run: uvicorn main:app --host 0.0.0.0 --port 8002
 """
 import os
-import tempfile
+import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-import tensorflow.lite as tflite
-
-from evaluate import run_inference
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response
 
 MODEL_DIR = Path(__file__).resolve().parent
 DEFAULT_MODEL = MODEL_DIR / "model.tflite"
 MODEL_PATH = os.environ.get("TFLITE_FRESHNESS_MODEL_PATH", str(DEFAULT_MODEL))
+# Interpreters in the pool, threads per interpreter, and whether XNNPACK is applied
+POOL_SIZE = int(os.environ.get("TFLITE_POOL_SIZE", "2"))
+NUM_THREADS = int(os.environ.get("TFLITE_NUM_THREADS", "2"))
+USE_XNNPACK = os.environ.get("TFLITE_USE_XNNPACK", "1") not in ("0", "false", "False")
+
+# Shared helpers (ml-services/ml_common)
+sys.path.insert(0, str(MODEL_DIR.parent))
+from ml_common.inference import InferencePool  # noqa: E402
+from ml_common.metrics import instrument  # noqa: E402
+from ml_common.readiness import ModelLoader, add_probes, preload, warmup_jpeg  # noqa: E402
+from ml_common.result_cache import ResultCache, file_fingerprint, variant  # noqa: E402
+from ml_common.runtimes import import_tflite_interpreter  # noqa: E402
+from ml_common.uploads import limit_uploads, read_upload  # noqa: E402
+from ml_common.video import MAX_VIDEO_UPLOAD_BYTES, FrameSampler, check_video_upload, score_frames  # noqa: E402
+
+from evaluate import aggregate_frames, run_inference  # noqa: E402
+from interpreter_pool import InterpreterPool  # noqa: E402
+
+
+def load_interpreters() -> InterpreterPool:
+    if not os.path.isfile(MODEL_PATH):
+        raise FileNotFoundError(
+            f"Model not found: {MODEL_PATH}. "
+            "Clone https://github.com/Kayuemkhan/Freshness-Detector and copy app/src/main/ml/model.tflite here, "
+            "or set TFLITE_FRESHNESS_MODEL_PATH."
+        )
+    # tflite_runtime or ai_edge_litert when installed; full TensorFlow only as a last resort
+    return InterpreterPool(import_tflite_interpreter(), MODEL_PATH, POOL_SIZE, NUM_THREADS, USE_XNNPACK)
+
+
+def warm_up(interpreters: InterpreterPool):
+    """One dummy photo through every interpreter (each allocates its tensors and XNNPACK state on first invoke)."""
+    content = warmup_jpeg()
+    for _ in range(interpreters.size):
+        # The slot queue is FIFO, so consecutive check-outs visit every slot once
+        with interpreters.acquire() as slot:
+            run_inference(slot, content)
+
+
+_loader = ModelLoader("tflite", load_interpreters, warm_up)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload(_loader)
+    yield
+
 
 app = FastAPI(
     title="Freshness Detector (TFLite)",
     description="ResQ Meal - Fresh/stale classification for 6 fruits/vegetables (Kayuemkhan/Freshness-Detector)",
     version="1.0.0",
+    lifespan=lifespan,
 )
+instrument(app, "tflite")
+# Clips have their own, larger limit
+limit_uploads(app, path_limits={"/evaluate-video": MAX_VIDEO_UPLOAD_BYTES})
+add_probes(app, _loader)
 
-_interpreter = None
+# One worker per interpreter so every running request has its own
+_pool = InferencePool.from_env(default_workers=POOL_SIZE, name="tflite")
+# Results for repeated images, keyed by content hash + model file
+_cache = ResultCache.from_env("tflite")
+CACHE_VARIANT = variant(model=file_fingerprint(MODEL_PATH))
 
 
-def get_interpreter():
-    global _interpreter
-    if _interpreter is None:
-        if not os.path.isfile(MODEL_PATH):
-            raise FileNotFoundError(
-                f"Model not found: {MODEL_PATH}. "
-                "Clone https://github.com/Kayuemkhan/Freshness-Detector and copy app/src/main/ml/model.tflite here, "
-                "or set TFLITE_FRESHNESS_MODEL_PATH."
-            )
-        _interpreter = tflite.Interpreter(model_path=MODEL_PATH)
-        _interpreter.allocate_tensors()
-    return _interpreter
+def get_interpreter_pool() -> InterpreterPool:
+    return _loader.get()
 
 
 @app.get("/health")
 def health():
-    try:
-        get_interpreter()
-        return {"status": "ok", "model_loaded": True}
-    except FileNotFoundError as e:
-        return {"status": "degraded", "model_loaded": False, "message": str(e)}
+    """Service state; never waits for the model (status is loading until it is warm)."""
+    if _loader.state == "failed":
+        return {"status": "degraded", "model_loaded": False, "message": _loader.error}
+    out = {
+        "status": "ok" if _loader.ready else "loading",
+        "model_loaded": _loader.ready,
+        "model": _loader.stats(),
+        "inference": _pool.stats(),
+        "cache": _cache.stats(),
+    }
+    if _loader.ready:
+        out["interpreters"] = _loader.model.stats()
+    return out
+
+
+def infer(content) -> tuple[str, str, int]:
+    with get_interpreter_pool().acquire() as slot:
+        return run_inference(slot, content)
 
 
 @app.post("/evaluate")
-async def evaluate(file: UploadFile = File(...)):
+async def evaluate(response: Response, file: UploadFile = File(...)):
     """Upload image; returns classification (fresh/stale), item_type, freshness_index (0-100)."""
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
-    try:
-        interpreter = get_interpreter()
-    except FileNotFoundError as e:
-        raise HTTPException(status_code=503, detail=str(e))
-
-    suffix = Path(file.filename or "image").suffix or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
-    try:
-        classification, item_type, freshness_index = run_inference(interpreter, tmp_path)
-        return {
-            "classification": classification,
-            "item_type": item_type,
-            "freshness_index": freshness_index,
-        }
-    finally:
-        if os.path.isfile(tmp_path):
-            os.unlink(tmp_path)
+    content = await read_upload(file)
+    cache_key = _cache.key(content, CACHE_VARIANT)
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    with _pool.admit() as ticket:
+        try:
+            classification, item_type, freshness_index = await _pool.run(infer, content, ticket=ticket)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    ticket.apply_headers(response)
+    result = {
+        "classification": classification,
+        "item_type": item_type,
+        "freshness_index": freshness_index,
+    }
+    _cache.put(cache_key, result)
+    response.headers["X-Cache"] = "miss"
+    return result
+
+
+def open_video(video) -> FrameSampler:
+    """Frame sampler for the model's input size (loads the interpreters first)."""
+    return FrameSampler(video, min_size=get_interpreter_pool().input_size)
+
+
+@app.post("/evaluate-video")
+async def evaluate_video(response: Response, file: UploadFile = File(...)):
+    """
+    Upload a short clip; frames are sampled and scored a batch at a time, stopping once the frames agree.
+    Returns classification, item_type and freshness_index over the scored frames, plus frame counts
+    (frames_scored, frames_decoded, early_exit, agreement, ...) under video.
+    """
+    video = check_video_upload(file)
+    with _pool.admit() as ticket:
+        try:
+            sampler = await _pool.run(open_video, video, ticket=ticket)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        async def score_batch(images: list) -> list:
+            # The clip holds one ticket, so its frames run on one worker, one after another
+            return await _pool.run(lambda: [infer(image) for image in images])
+
+        try:
+            frames, summary = await score_frames(_pool, sampler, score_batch, lambda result: result[0], ticket=ticket)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            sampler.close()
+    ticket.apply_headers(response)
+    classification, item_type, freshness_index = aggregate_frames(frames)
+    return {
+        "classification": classification,
+        "item_type": item_type,
+        "freshness_index": freshness_index,
+        "video": summary,
+    }
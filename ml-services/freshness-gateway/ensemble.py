@@ -0,0 +1,303 @@
+"""
+In-process adapters for the image models, each running through its own service's evaluate.py
+(loaded with ml_common.services.load_service_modules, so the four evaluate modules coexist).
+Every adapter loads its model through a ModelLoader (in the background from the gateway's startup, or
+on first use), warms it up, takes an already decoded RGB PIL image and returns the same fields as that
+service's /evaluate, plus a 0-1 confidence (what the gateway's cascade mode escalates on).
+"""
+import os
+
+from ml_common.images import open_image
+from ml_common.readiness import ModelLoader, warmup_jpeg
+from ml_common.result_cache import file_fingerprint
+from ml_common.runtimes import import_tflite_interpreter, load_runtime_model, resolve_backend
+from ml_common.services import ML_SERVICES_DIR, load_service_modules
+
+MODEL_NAMES = ("fruit_veg", "tflite", "freshvision", "food101")
+
+# Verdict per model classification: fresh, spoiled, or in between (no vote either way)
+FRESH_VOTES = {
+    "fresh": True,
+    "medium_fresh": None,
+    "not_fresh": False,
+    "stale": False,
+    "rotten": False,
+}
+
+
+class ModelAdapter:
+    name = ""
+    service = ""
+    # Appended to the "model not found" error
+    setup_hint = ""
+    # Whether results carry classification / freshness_index (Food-101 only names the food)
+    scores_freshness = True
+    # Model input (width, height); the gateway decodes each upload once, for the largest one
+    input_size = (224, 224)
+    # Item types the model tells apart (None: any produce); the cascade skips it for other items
+    item_types: tuple[str, ...] | None = None
+
+    def __init__(self, model_path: str, weight: float = 1.0):
+        self.model_path = model_path
+        self.weight = weight
+        self.model_loader = ModelLoader(self.name, self._load_checked, self.warm_up)
+
+    def _load_checked(self):
+        if not os.path.isfile(self.model_path):
+            raise FileNotFoundError(f"Model not found: {self.model_path}. {self.setup_hint}")
+        return self.load()
+
+    def get_model(self):
+        """The model, waiting for its load (or loading it now)."""
+        return self.model_loader.get()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model_loader.ready
+
+    def warm_up(self, model):
+        """A dummy photo through predict() (whose get_model() returns the model being warmed up)."""
+        self.predict(open_image(warmup_jpeg(), min_size=self.input_size))
+
+    def variant(self) -> dict:
+        """Everything that changes this model's results (part of the gateway's cache key)."""
+        return {"model": file_fingerprint(self.model_path)}
+
+    def stats(self) -> dict:
+        return {"model_path": self.model_path, "loaded": self.loaded, "weight": self.weight, **self.model_loader.stats()}
+
+    def load(self):
+        raise NotImplementedError
+
+    def predict(self, image) -> dict:
+        raise NotImplementedError
+
+
+class FruitVegAdapter(ModelAdapter):
+    name = "fruit_veg"
+    service = "fruit-veg-freshness"
+    setup_hint = "Copy rottenvsfresh98pval.h5 (or an exported .tflite/.onnx) there, or set FRESHNESS_MODEL_PATH."
+
+    def __init__(self, model_path: str, backend: str = "auto", weight: float = 1.0):
+        super().__init__(model_path, weight)
+        self.evaluate = load_service_modules(self.service, "evaluate").evaluate
+        self.backend = resolve_backend(model_path, backend)
+        self.input_size = self.evaluate.INPUT_SIZE
+
+    def load(self):
+        return load_runtime_model(self.model_path, self.backend)
+
+    def variant(self) -> dict:
+        ev = self.evaluate
+        return {**super().variant(), "backend": self.backend, "fresh": ev.THRESHOLD_FRESH, "medium": ev.THRESHOLD_MEDIUM}
+
+    def predict(self, image) -> dict:
+        prediction = self.evaluate.evaluate_freshness(image, self.get_model())
+        return {
+            "prediction": round(prediction, 4),
+            "classification": self.evaluate.get_classification(prediction),
+            "confidence": round(self.evaluate.get_confidence(prediction), 4),
+            "freshness_index": self.evaluate.get_freshness_index(prediction),
+        }
+
+
+class TFLiteAdapter(ModelAdapter):
+    name = "tflite"
+    service = "freshness-detector-tflite"
+    setup_hint = "Copy Freshness-Detector's model.tflite there, or set TFLITE_FRESHNESS_MODEL_PATH."
+
+    def __init__(self, model_path: str, pool_size: int = 2, num_threads: int = 2, use_xnnpack: bool = True, weight: float = 1.0):
+        super().__init__(model_path, weight)
+        modules = load_service_modules(self.service, "evaluate", "interpreter_pool")
+        self.evaluate = modules.evaluate
+        self.interpreter_pool = modules.interpreter_pool
+        self.item_types = tuple(self.evaluate.ITEM_TYPES)
+        self.pool_size = pool_size
+        self.num_threads = num_threads
+        self.use_xnnpack = use_xnnpack
+
+    def load(self):
+        pool = self.interpreter_pool.InterpreterPool(
+            import_tflite_interpreter(), self.model_path, self.pool_size, self.num_threads, self.use_xnnpack
+        )
+        # Known only once the model is read (the class default until then)
+        self.input_size = pool.input_size
+        return pool
+
+    def stats(self) -> dict:
+        out = super().stats()
+        if self.loaded:
+            out["interpreters"] = self.get_model().stats()
+        return out
+
+    def predict(self, image) -> dict:
+        with self.get_model().acquire() as slot:
+            class_name, confidence = self.evaluate.classify(slot, image)
+        classification, item_type, freshness_index = self.evaluate.describe_class(class_name, confidence)
+        return {
+            "classification": classification,
+            "item_type": item_type,
+            "confidence": round(confidence, 4),
+            "freshness_index": freshness_index,
+        }
+
+
+class FreshVisionAdapter(ModelAdapter):
+    name = "freshvision"
+    service = "freshvision"
+    setup_hint = "Copy effnetb0_freshvisionv0_10_epochs.pt there, or set FRESHVISION_MODEL_PATH."
+    # Its evaluate.py CLASS_NAMES (known here before the model, and torch, are loaded)
+    item_types = ("apple", "banana", "orange")
+
+    def __init__(
+        self,
+        model_path: str,
+        mode: str = "torchscript",
+        channels_last: bool = False,
+        cache_dir: str | None = None,
+        calibration_dir: str | None = None,
+        warmup_runs: int = 2,
+        weight: float = 1.0,
+    ):
+        super().__init__(model_path, weight)
+        # evaluate, loader and modes import torch, so they are loaded with the model (the gateway starts without it);
+        # the input size is the class default, 224x224
+        self.evaluate = self.loader = self.modes = self.device = None
+        self.mode = mode
+        self.channels_last = channels_last
+        self.cache_dir = cache_dir
+        self.calibration_dir = calibration_dir
+        self.warmup_runs = warmup_runs
+
+    def load(self):
+        modules = load_service_modules(self.service, "evaluate", "loader", "modes")
+        self.evaluate, self.loader, self.modes = modules.evaluate, modules.loader, modules.modes
+        if self.mode not in self.modes.MODES:
+            raise ValueError(f"FRESHVISION_INFERENCE_MODE must be one of {', '.join(self.modes.MODES)}")
+        import torch
+
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # Same CPU-only fallbacks as the FreshVision service
+        if self.device.type != "cpu":
+            self.mode, self.channels_last = "eager", False
+        cache_dir = self.cache_dir if self.mode in self.modes.TORCHSCRIPT_MODES else None
+        model, _ = self.loader.load_model(self.model_path, self.device, cache_dir)
+        return self.modes.prepare_model(
+            model, self.mode, self.channels_last, self.calibration_dir, self.warmup_runs, self.device
+        )
+
+    def variant(self) -> dict:
+        return {**super().variant(), "mode": self.mode, "channels_last": self.channels_last}
+
+    def stats(self) -> dict:
+        return {**super().stats(), "mode": self.mode, "channels_last": self.channels_last}
+
+    def predict(self, image) -> dict:
+        classification, item_type, confidence = self.evaluate.predict(image, self.get_model(), self.device)
+        return {
+            "classification": classification,
+            "item_type": item_type,
+            "confidence": round(confidence, 4),
+            "freshness_index": self.evaluate.get_freshness_index(classification, confidence),
+        }
+
+
+class Food101Adapter(ModelAdapter):
+    name = "food101"
+    service = "food-image-recognition"
+    setup_hint = "Copy best_model_101class.hdf5 (or an exported model) there, or set FOOD_IMAGE_RECOGNITION_MODEL_PATH."
+    scores_freshness = False
+
+    def __init__(self, model_path: str, nutrition_csv: str | None = None, backend: str = "auto", weight: float = 0.0):
+        super().__init__(model_path, weight)
+        self.evaluate = load_service_modules(self.service, "evaluate").evaluate
+        self.backend = resolve_backend(model_path, backend)
+        self.nutrition_csv = nutrition_csv
+        self.nutrition = None
+        self.input_size = self.evaluate.INPUT_SIZE
+
+    def load(self):
+        model = load_runtime_model(self.model_path, self.backend)
+        self.nutrition = self.evaluate.load_nutrition_csv(self.nutrition_csv) if self.nutrition_csv else None
+        return model
+
+    def variant(self) -> dict:
+        return {**super().variant(), "backend": self.backend, "nutrition": file_fingerprint(self.nutrition_csv)}
+
+    def predict(self, image) -> dict:
+        probs = self.evaluate.predict_probabilities(image, self.get_model())
+        food_class, food_name, confidence, nutrition = self.evaluate.describe_class(
+            int(probs.argmax()), probs, self.nutrition
+        )
+        out = {"food_class": food_class, "food_name": food_name, "confidence": round(confidence, 4)}
+        if nutrition:
+            out["nutrition"] = nutrition
+        return out
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default) not in ("0", "false", "False", "")
+
+
+def build_adapter(name: str, weight: float) -> ModelAdapter:
+    """
+    Adapter for one model, configured from the same environment variables (and default model
+    locations) as the standalone service, so one .env serves both.
+    """
+    if name == "fruit_veg":
+        return FruitVegAdapter(
+            os.environ.get("FRESHNESS_MODEL_PATH", str(ML_SERVICES_DIR / "fruit-veg-freshness" / "rottenvsfresh98pval.h5")),
+            os.environ.get("FRESHNESS_MODEL_BACKEND", "auto"),
+            weight,
+        )
+    if name == "tflite":
+        return TFLiteAdapter(
+            os.environ.get("TFLITE_FRESHNESS_MODEL_PATH", str(ML_SERVICES_DIR / "freshness-detector-tflite" / "model.tflite")),
+            int(os.environ.get("TFLITE_POOL_SIZE", "2")),
+            int(os.environ.get("TFLITE_NUM_THREADS", "2")),
+            _env_flag("TFLITE_USE_XNNPACK", "1"),
+            weight,
+        )
+    if name == "freshvision":
+        freshvision_dir = ML_SERVICES_DIR / "freshvision" / "models"
+        return FreshVisionAdapter(
+            os.environ.get("FRESHVISION_MODEL_PATH", str(freshvision_dir / "effnetb0_freshvisionv0_10_epochs.pt")),
+            os.environ.get("FRESHVISION_INFERENCE_MODE", "torchscript"),
+            _env_flag("FRESHVISION_CHANNELS_LAST", "0"),
+            os.environ.get("FRESHVISION_CACHE_DIR", str(freshvision_dir / "cache")) or None,
+            os.environ.get("FRESHVISION_CALIBRATION_DIR") or None,
+            int(os.environ.get("FRESHVISION_WARMUP_RUNS", "2")),
+            weight,
+        )
+    if name == "food101":
+        food_dir = ML_SERVICES_DIR / "food-image-recognition"
+        return Food101Adapter(
+            os.environ.get("FOOD_IMAGE_RECOGNITION_MODEL_PATH", str(food_dir / "models" / "best_model_101class.hdf5")),
+            os.environ.get("FOOD_IMAGE_RECOGNITION_NUTRITION_CSV", str(food_dir / "nutrition101.csv")),
+            os.environ.get("FOOD_IMAGE_RECOGNITION_BACKEND", "auto"),
+            weight,
+        )
+    raise ValueError(f"Unknown model {name!r}; use one of {', '.join(MODEL_NAMES)}")
+
+
+def combine(results: dict[str, dict], weights: dict[str, float]) -> dict:
+    """
+    Combined verdict over the freshness models that answered: freshness_index is their weighted mean,
+    classification is "fresh" / "rotten" when they all agree and "mixed" otherwise (or when one is
+    in between, like medium_fresh).
+    """
+    scored = {
+        name: result for name, result in results.items()
+        if "freshness_index" in result and weights.get(name, 0) > 0
+    }
+    if not scored:
+        return {"classification": None, "freshness_index": None, "models_used": []}
+    total = sum(weights[name] for name in scored)
+    freshness_index = sum(weights[name] * result["freshness_index"] for name, result in scored.items()) / total
+    votes = {FRESH_VOTES.get(result["classification"]) for result in scored.values()}
+    classification = "fresh" if votes == {True} else "rotten" if votes == {False} else "mixed"
+    return {
+        "classification": classification,
+        "freshness_index": round(freshness_index),
+        "models_used": sorted(scored),
+    }
@@ -0,0 +1,325 @@
+"""
+Freshness gateway: the fruit-veg, TFLite, FreshVision and Food-101 image models in one process.
+Each upload is decoded once and the selected models run in parallel on the inference pool, through
+each service's own evaluate.py (see ensemble.py). The response has every model's verdict plus a
+combined freshness score, so the backend makes one call instead of trying the services in turn.
+In cascade mode the models run one at a time instead, cheapest first, and a more expensive one runs only
+when the cheaper ones are not confident enough (see run_cascade).
+The models are loaded and warmed up in the background at startup, side by side; /livez and /readyz
+are the probes (ready once some model is warm and none is still on its first load; see
+ml_common/readiness.py).
+
+Run: uvicorn main:app --host 0.0.0.0 --port 8006
+"""
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Response
+
+SERVICE_DIR = Path(__file__).resolve().parent
+# Models hosted by this process (a subset of ensemble.MODEL_NAMES); each request may narrow it further
+GATEWAY_MODELS = os.environ.get("FRESHNESS_GATEWAY_MODELS", "fruit_veg,tflite,freshvision,food101")
+# Weights of the freshness models in the combined freshness_index ("name=weight", comma-separated)
+GATEWAY_WEIGHTS = os.environ.get("FRESHNESS_GATEWAY_WEIGHTS", "fruit_veg=1,tflite=1,freshvision=1")
+# ensemble (every selected model, in parallel) or cascade (cheapest first); a request's ?mode= overrides it
+GATEWAY_MODE = os.environ.get("FRESHNESS_GATEWAY_MODE", "ensemble")
+# Cascade stages, cheapest first (freshness models; ones this gateway does not host are left out)
+GATEWAY_CASCADE = os.environ.get("FRESHNESS_GATEWAY_CASCADE", "fruit_veg,tflite,freshvision")
+# Confidence (0-1) at which a stage answers on its own instead of escalating ("name=threshold", comma-separated)
+GATEWAY_CASCADE_THRESHOLDS = os.environ.get("FRESHNESS_GATEWAY_CASCADE_THRESHOLDS", "fruit_veg=0.5,tflite=0.8,freshvision=0.8")
+# Item types (e.g. apple) for which a confident stage still escalates to a later stage whose classes include them
+GATEWAY_CASCADE_ESCALATE = os.environ.get("FRESHNESS_GATEWAY_CASCADE_ESCALATE", "")
+
+# Shared helpers (ml-services/ml_common)
+sys.path.insert(0, str(SERVICE_DIR.parent))
+from ml_common.images import open_image  # noqa: E402
+from ml_common.inference import InferencePool  # noqa: E402
+from ml_common.metrics import count_cascade_stage, instrument, stage  # noqa: E402
+from ml_common.readiness import add_probes, preload  # noqa: E402
+from ml_common.result_cache import ResultCache, variant  # noqa: E402
+from ml_common.uploads import limit_uploads, read_upload  # noqa: E402
+
+from ensemble import MODEL_NAMES, ModelAdapter, build_adapter, combine  # noqa: E402
+
+MODES = ("ensemble", "cascade")
+
+
+def parse_names(value: str) -> list[str]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in MODEL_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown model(s) {', '.join(unknown)}; use {', '.join(MODEL_NAMES)}")
+    return list(dict.fromkeys(names))
+
+
+def parse_values(value: str) -> dict[str, float]:
+    """{"name": value} from "name=value,name=value" (weights, thresholds)."""
+    values = {}
+    for part in value.split(","):
+        if part.strip():
+            name, _, number = part.partition("=")
+            values[name.strip()] = float(number)
+    return values
+
+
+def normalize_item_type(item_type: str | None) -> str | None:
+    """The models' spelling of an item type: "Bitter gourd" -> bitter_gourd."""
+    if not item_type or not item_type.strip():
+        return None
+    return "_".join(item_type.strip().lower().replace("-", " ").split())
+
+
+# Fails at startup on unknown model names, backends or modes rather than on the first request (FreshVision's
+# mode is checked by its load, which imports torch)
+_weights = parse_values(GATEWAY_WEIGHTS)
+_adapters: dict[str, ModelAdapter] = {
+    name: build_adapter(name, _weights.get(name, 0.0)) for name in parse_names(GATEWAY_MODELS)
+}
+if not _adapters:
+    raise ValueError("FRESHNESS_GATEWAY_MODELS must name at least one model")
+if GATEWAY_MODE not in MODES:
+    raise ValueError(f"FRESHNESS_GATEWAY_MODE must be one of {', '.join(MODES)}")
+_thresholds = parse_values(GATEWAY_CASCADE_THRESHOLDS)
+_cascade = [name for name in parse_names(GATEWAY_CASCADE) if name in _adapters]
+_no_freshness = [name for name in _cascade if not _adapters[name].scores_freshness]
+if _no_freshness:
+    raise ValueError(f"FRESHNESS_GATEWAY_CASCADE: {', '.join(_no_freshness)} does not score freshness")
+if GATEWAY_MODE == "cascade" and not _cascade:
+    raise ValueError("FRESHNESS_GATEWAY_CASCADE names no model hosted by this gateway")
+_escalate = {normalize_item_type(item) for item in GATEWAY_CASCADE_ESCALATE.split(",") if item.strip()}
+_known_items = {item for name in _cascade for item in _adapters[name].item_types or ()}
+if _escalate - _known_items:
+    raise ValueError(
+        f"FRESHNESS_GATEWAY_CASCADE_ESCALATE: {', '.join(sorted(_escalate - _known_items))} is not a class of any "
+        f"cascade stage ({', '.join(sorted(_known_items))})"
+    )
+
+_loaders = [adapter.model_loader for adapter in _adapters.values()]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload(*_loaders)
+    yield
+
+
+app = FastAPI(
+    title="Freshness Gateway",
+    description="ResQ Meal - All image freshness models in one process, with a combined verdict",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+instrument(app, "gateway")
+limit_uploads(app)
+# A missing model does not fail the others' answers, so it does not keep the gateway unready either
+add_probes(app, *_loaders, partial=True)
+
+# One worker per model, so one request's models all run at once
+_pool = InferencePool.from_env(default_workers=len(_adapters), name="gateway")
+# Results for repeated images, keyed by content hash + every hosted model's version, the weights and the
+# cascade thresholds (+ the mode and models per request)
+_cache = ResultCache.from_env("gateway")
+CACHE_VARIANT = variant(
+    models={name: adapter.variant() for name, adapter in _adapters.items()},
+    weights=_weights,
+    thresholds=_thresholds,
+    escalate=sorted(_escalate),
+)
+
+
+def decode(content: bytearray, names: list[str]):
+    """Decode once, at a draft scale large enough for the biggest input among the selected models."""
+    sizes = [_adapters[name].input_size for name in names]
+    return open_image(content, min_size=(max(w for w, _ in sizes), max(h for _, h in sizes)))
+
+
+def run_model(adapter: ModelAdapter, image) -> dict:
+    """One model's result, or its error (a missing or failing model does not fail the others)."""
+    try:
+        # Each model's total is its own stage; its resize / inference stages add up across models
+        with stage(adapter.name):
+            return adapter.predict(image)
+    except FileNotFoundError as e:
+        return {"error": str(e), "status": 503}
+    except Exception as e:  # noqa: BLE001 - reported per model
+        return {"error": f"{type(e).__name__}: {e}", "status": 500}
+
+
+def run_cascade(content: bytearray, names: list[str], item_type: str | None) -> tuple[dict[str, dict], list[dict]]:
+    """
+    The cascade stages in names, one after another on one decode. A stage whose confidence reaches its
+    threshold answers on its own; below it, or when it fails, the next stage runs. A stage is skipped
+    when the item type is known and is not one of its classes: item_type when given, else the item a
+    confident stage predicted. A confident stage whose predicted item is in _escalate still escalates
+    when a later stage knows that item. Returns the results of the stages that ran and each stage's
+    record (model, outcome, and confidence / threshold when it answered).
+    """
+    image = decode(content, names)
+    results: dict[str, dict] = {}
+    stages: list[dict] = []
+    for index, name in enumerate(names):
+        adapter = _adapters[name]
+        if item_type and adapter.item_types is not None and item_type not in adapter.item_types:
+            record = {"model": name, "outcome": "item_type"}
+        else:
+            result = results[name] = run_model(adapter, image)
+            if "error" in result:
+                record = {"model": name, "outcome": "error"}
+            else:
+                threshold = _thresholds.get(name, 0.0)
+                outcome = "accepted" if result["confidence"] >= threshold else "low_confidence"
+                predicted = result.get("item_type")
+                if outcome == "accepted" and predicted:
+                    item_type = item_type or predicted
+                    if predicted in _escalate and any(knows_item(later, predicted) for later in names[index + 1:]):
+                        outcome = "escalated"
+                record = {
+                    "model": name,
+                    "outcome": outcome,
+                    "confidence": result["confidence"],
+                    "threshold": threshold,
+                }
+        stages.append(record)
+        count_cascade_stage(name, record["outcome"])
+        if record["outcome"] == "accepted":
+            break
+    return results, stages
+
+
+def knows_item(name: str, item_type: str) -> bool:
+    """Whether item_type is one of the model's classes (False for models without item classes)."""
+    item_types = _adapters[name].item_types
+    return item_types is not None and item_type in item_types
+
+
+def select_models(models: str | None) -> list[str]:
+    if not models:
+        return list(_adapters)
+    try:
+        names = parse_names(models)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    missing = [name for name in names if name not in _adapters]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Not hosted by this gateway: {', '.join(missing)}")
+    return names
+
+
+def select_mode(mode: str | None) -> str:
+    mode = mode or GATEWAY_MODE
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(MODES)}")
+    return mode
+
+
+def raise_unanswered(results: dict[str, dict]):
+    """503 when some model is missing (not loaded yet), else 500, with every model's error."""
+    failed = [result["status"] for result in results.values()]
+    detail = "; ".join(f"{name}: {result['error']}" for name, result in results.items())
+    raise HTTPException(status_code=503 if 503 in failed else 500, detail=detail)
+
+
+@app.get("/health")
+def health():
+    """Every model's state; never waits for a model (status is loading until all are warm)."""
+    states = {loader.state for loader in _loaders}
+    return {
+        "status": "degraded" if "failed" in states else "ok" if states == {"ready"} else "loading",
+        "mode": GATEWAY_MODE,
+        "cascade": {
+            "stages": _cascade,
+            "thresholds": {name: _thresholds.get(name, 0.0) for name in _cascade},
+            "escalate": sorted(_escalate),
+        },
+        "models": {name: adapter.stats() for name, adapter in _adapters.items()},
+        "inference": _pool.stats(),
+        "cache": _cache.stats(),
+    }
+
+
+@app.post("/evaluate")
+async def evaluate(
+    response: Response,
+    file: UploadFile = File(...),
+    models: str | None = Query(None, description="Comma-separated subset of the hosted models (default: all)"),
+    mode: str | None = Query(None, description="ensemble or cascade (default: FRESHNESS_GATEWAY_MODE)"),
+    item_type: str | None = Query(None, description="Cascade: the item, when known (skips models without that class)"),
+):
+    """
+    Upload image; returns each selected model's result under models (or {"error": ...}) plus a combined
+    classification (fresh / mixed / rotten) and freshness_index (0-100) over the freshness models.
+    In cascade mode only the stages that ran are under models, and cascade lists every stage's outcome
+    (accepted, low_confidence, error, or item_type when skipped); the verdict is the accepted stage's,
+    or combined over the stages that answered when none was confident enough.
+    """
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    names = select_models(models)
+    mode = select_mode(mode)
+    if mode == "cascade":
+        return await evaluate_cascade(response, file, names, normalize_item_type(item_type))
+    content = await read_upload(file)
+    cache_key = _cache.key(content, f"{CACHE_VARIANT}:{','.join(sorted(names))}")
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    with _pool.admit() as ticket:
+        try:
+            image = await _pool.run(decode, content, names, ticket=ticket)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        outputs = await asyncio.gather(*(_pool.run(run_model, _adapters[name], image) for name in names))
+    ticket.apply_headers(response)
+    results = dict(zip(names, outputs))
+    answered = [name for name in names if "error" not in results[name]]
+    if not answered:
+        raise_unanswered(results)
+    for result in outputs:
+        result.pop("status", None)
+    out = {**combine(results, {name: _adapters[name].weight for name in names}), "models": results}
+    # Partial answers are not cached, so a model that comes back is used on the next upload
+    if len(answered) == len(names):
+        _cache.put(cache_key, out)
+    response.headers["X-Cache"] = "miss"
+    return out
+
+
+async def evaluate_cascade(response: Response, file: UploadFile, names: list[str], item_type: str | None) -> dict:
+    stages = [name for name in _cascade if name in names]
+    if not stages:
+        detail = f"No cascade stage among the selected models; stages: {', '.join(_cascade)}"
+        raise HTTPException(status_code=400, detail=detail)
+    content = await read_upload(file)
+    cache_key = _cache.key(content, f"{CACHE_VARIANT}:cascade:{','.join(stages)}:{item_type or ''}")
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    with _pool.admit() as ticket:
+        try:
+            results, records = await _pool.run(run_cascade, content, stages, item_type, ticket=ticket)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    ticket.apply_headers(response)
+    answered = {name: result for name, result in results.items() if "error" not in result}
+    if not results:
+        raise HTTPException(status_code=422, detail=f"No cascade stage covers item type {item_type!r}")
+    if not answered:
+        raise_unanswered(results)
+    for result in results.values():
+        result.pop("status", None)
+    accepted = [record["model"] for record in records if record["outcome"] == "accepted"]
+    if accepted:
+        verdict = combine({accepted[0]: results[accepted[0]]}, {accepted[0]: 1.0})
+    else:
+        verdict = combine(answered, {name: _adapters[name].weight for name in answered})
+    out = {**verdict, "models": results, "cascade": records}
+    # As in ensemble mode, an answer that went around a failing model is not cached
+    if len(answered) == len(results):
+        _cache.put(cache_key, out)
+    response.headers["X-Cache"] = "miss"
+    return out
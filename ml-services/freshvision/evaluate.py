@@ -6,9 +6,11 @@ import os
 from pathlib import Path
 
 import torch
-from PIL import Image
 from torchvision import transforms
 
+from ml_common.images import ImageSource, open_image
+from ml_common.metrics import stage
+
 # Class names from app.py (order must match model output indices)
 CLASS_NAMES = [
     "Fresh Apple",
@@ -25,21 +27,30 @@ NORMALIZE = transforms.Normalize(
     std=[0.229, 0.224, 0.225],
 )
 
+# Model input (width, height)
+INPUT_SIZE = (224, 224)
+
 IMAGE_TRANSFORM = transforms.Compose([
-    transforms.Resize(size=(224, 224)),
+    transforms.Resize(size=INPUT_SIZE[::-1]),
     transforms.ToTensor(),
     NORMALIZE,
 ])
 
 
-def predict(image_path: str, model: torch.nn.Module, device: torch.device) -> tuple[str, str, float]:
+def preprocess_image(image: ImageSource) -> torch.Tensor:
+    """Decode image (bytes, buffer or path), resize to 224x224 and normalize. Shape (1, 3, 224, 224)."""
+    img = open_image(image, min_size=INPUT_SIZE)
+    with stage("resize"):
+        return IMAGE_TRANSFORM(img).unsqueeze(0)
+
+
+def predict(image: ImageSource, model: torch.nn.Module, device: torch.device) -> tuple[str, str, float]:
     """
-    Run model on image. Returns (classification: 'fresh'|'rotten', item_type: str, confidence: 0-1).
+    Run model on image (bytes, buffer or path). Returns (classification: 'fresh'|'rotten', item_type: str, confidence: 0-1).
+    model must already be in eval mode (see loader.load_model / modes.prepare_model).
     """
-    img = Image.open(image_path).convert("RGB")
-    x = IMAGE_TRANSFORM(img).unsqueeze(0).to(device)
-    model.eval()
-    with torch.inference_mode():
+    x = preprocess_image(image).to(device)
+    with torch.inference_mode(), stage("inference"):
         logits = model(x)
         probs = torch.softmax(logits, dim=-1)
         pred_idx = probs.argmax(dim=-1).item()
@@ -49,3 +60,9 @@ def predict(image_path: str, model: torch.nn.Module, device: torch.device) -> tu
     item_type = class_name.replace("Fresh ", "").replace("Rotten ", "").lower()
     classification = "fresh" if is_fresh else "rotten"
     return classification, item_type, confidence
+
+
+def get_freshness_index(classification: str, confidence: float) -> int:
+    """Freshness index 0-100 for UI: the confidence for fresh, its complement for rotten."""
+    freshness_index = round(confidence * 100) if classification == "fresh" else round((1 - confidence) * 100)
+    return max(0, min(100, freshness_index))
@@ -0,0 +1,128 @@
+"""
+Fast, offline model loading for FreshVision.
+The EfficientNet-B0 architecture is built without ImageNet weights (nothing is downloaded), the fine-tuned
+state dict is memory-mapped straight into it, and a traced TorchScript copy is cached so later starts
+skip building the architecture entirely.
+
+Prebuild the cache (e.g. in the image build): python loader.py
+"""
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+from model_builder import create_model_baseline_effnetb0
+
+NUM_CLASSES = 6
+INPUT_SHAPE = (1, 3, 224, 224)
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process in MB (None where the resource module is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_state_dict(model_path: str) -> dict:
+    """Load the state dict on CPU, memory-mapped when this torch supports it (2.1+, zip checkpoints)."""
+    for kwargs in ({"weights_only": True, "mmap": True}, {"weights_only": True}, {}):
+        try:
+            return torch.load(model_path, map_location="cpu", **kwargs)
+        except TypeError:
+            continue  # older torch without this keyword
+        except RuntimeError:
+            if kwargs.get("mmap"):
+                continue  # legacy (non-zip) checkpoint cannot be memory-mapped
+            raise
+    raise RuntimeError(f"Could not load {model_path}")
+
+
+def build_model(model_path: str) -> torch.nn.Module:
+    """EfficientNet-B0 with the fine-tuned weights, in eval mode on CPU."""
+    model = create_model_baseline_effnetb0(out_feats=NUM_CLASSES)
+    state = load_state_dict(model_path)
+    try:
+        # assign=True keeps the (memory-mapped) tensors instead of copying into fresh parameters
+        model.load_state_dict(state, assign=True)
+    except TypeError:
+        model.load_state_dict(state)
+    return model.eval()
+
+
+def cache_path(model_path: str, cache_dir: str) -> Path:
+    """Cache file for this checkpoint and torch version; a new checkpoint or torch gets a new file."""
+    key = hashlib.sha256(f"{_file_sha256(model_path)}:{torch.__version__}".encode()).hexdigest()[:16]
+    return Path(cache_dir) / f"effnetb0-{key}.ts"
+
+
+def save_torchscript(model: torch.nn.Module, path: Path) -> bool:
+    """Trace model and save it atomically; returns False when the directory is not writable."""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.zeros(INPUT_SHAPE))
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        torch.jit.save(traced, str(tmp))
+        os.replace(tmp, path)
+    except OSError:
+        return False
+    return True
+
+
+def load_model(model_path: str, device: torch.device, cache_dir: str | None) -> tuple[torch.nn.Module, dict]:
+    """
+    Return (model in eval mode on device, load info). Uses the TorchScript cache when present,
+    otherwise builds from the state dict and fills the cache (cache_dir None disables caching).
+    """
+    start = time.perf_counter()
+    path = cache_path(model_path, cache_dir) if cache_dir else None
+    source = "state_dict"
+    model = None
+    if path is not None and path.is_file():
+        try:
+            model = torch.jit.load(str(path), map_location=device).eval()
+            source = "torchscript_cache"
+        except RuntimeError:
+            model = None  # unreadable cache (e.g. torch changed in place); rebuild below
+    if model is None:
+        model = build_model(model_path)
+        if path is not None and save_torchscript(model, path):
+            source = "state_dict (cached)"
+        model = model.to(device)
+    info = {
+        "source": source,
+        "model_load_ms": round((time.perf_counter() - start) * 1000, 1),
+        "cache_file": str(path) if path is not None else None,
+    }
+    return model, info
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the FreshVision TorchScript cache.")
+    parser.add_argument("--model", default=os.environ.get(
+        "FRESHVISION_MODEL_PATH", str(Path(__file__).resolve().parent / "models" / "effnetb0_freshvisionv0_10_epochs.pt")
+    ))
+    parser.add_argument("--cache-dir", default=os.environ.get(
+        "FRESHVISION_CACHE_DIR", str(Path(__file__).resolve().parent / "models" / "cache")
+    ))
+    args = parser.parse_args()
+    _, info = load_model(args.model, torch.device("cpu"), args.cache_dir)
+    print(info)
@@ -3,84 +3,197 @@ FastAPI wrapper for FreshVision (EfficientNetB0 freshness).
 https://github.com/devdezzies/freshvision
 
 Classifies apple, banana, orange as Fresh or Rotten. Requires cloned repo and model file.
+torch is imported and the model loaded and warmed up in the background at startup; /livez and
+/readyz are the probes (see ml_common/readiness.py). A retrained model file is swapped in without a
+restart through /admin/model or MODEL_WATCH_SECONDS (see ml_common/model_swap.py).
 
 Run: uvicorn main:app --host 0.0.0.0 --port 8004
 """
 import os
-import tempfile
+import sys
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-import torch
-from fastapi import FastAPI, File, UploadFile, HTTPException
+_IMPORT_STARTED = time.perf_counter()
 
-from model_builder import create_model_baseline_effnetb0
-from evaluate import predict
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response  # noqa: E402
 
 MODEL_DIR = Path(__file__).resolve().parent
 DEFAULT_MODEL = MODEL_DIR / "models" / "effnetb0_freshvisionv0_10_epochs.pt"
 MODEL_PATH = os.environ.get("FRESHVISION_MODEL_PATH", str(DEFAULT_MODEL))
+# Traced TorchScript copies of the model are cached here for fast restarts; set to an empty value to disable
+CACHE_DIR = os.environ.get("FRESHVISION_CACHE_DIR", str(MODEL_DIR / "models" / "cache")) or None
+# CPU inference mode (see modes.py), NHWC layout, calibration images for static_int8, threads, warm-up passes
+INFERENCE_MODE = os.environ.get("FRESHVISION_INFERENCE_MODE", "torchscript")
+CHANNELS_LAST = os.environ.get("FRESHVISION_CHANNELS_LAST", "0") not in ("0", "false", "False", "")
+CALIBRATION_DIR = os.environ.get("FRESHVISION_CALIBRATION_DIR") or None
+NUM_THREADS = int(os.environ.get("FRESHVISION_NUM_THREADS", "0"))
+WARMUP_RUNS = int(os.environ.get("FRESHVISION_WARMUP_RUNS", "2"))
+
+# Shared helpers (ml-services/ml_common)
+sys.path.insert(0, str(MODEL_DIR.parent))
+from ml_common.inference import InferencePool  # noqa: E402
+from ml_common.metrics import instrument  # noqa: E402
+from ml_common.model_swap import ModelSwapper, add_model_admin, model_file_version  # noqa: E402
+from ml_common.readiness import ModelLoader, add_probes, preload, warmup_jpeg  # noqa: E402
+from ml_common.result_cache import ResultCache, variant  # noqa: E402
+from ml_common.uploads import limit_uploads, read_upload  # noqa: E402
+
+# torch, torchvision and the modules built on them (evaluate, loader, modes) are imported by the
+# background load, so the process binds its port without waiting seconds for torch
+_IMPORT_MS = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+
+# Set by the load: torch device, effective mode (the optimized modes target CPU; on GPU the model runs
+# eager), and load timings
+_device = None
+_mode = INFERENCE_MODE
+_channels_last = CHANNELS_LAST
+_load_info = {}
+
+
+def load_model(path: str = MODEL_PATH):
+    global _device, _mode, _channels_last, _load_info
+    if not os.path.isfile(path):
+        raise FileNotFoundError(
+            f"Model not found: {path}. "
+            "Clone https://github.com/devdezzies/freshvision and copy models/effnetb0_freshvisionv0_10_epochs.pt "
+            "to this service's models/ folder, or set FRESHVISION_MODEL_PATH."
+        )
+    start = time.perf_counter()
+    import torch
+    from loader import load_model as load_weights
+    from modes import TORCHSCRIPT_MODES, prepare_model
+
+    info = {"torch_import_ms": round((time.perf_counter() - start) * 1000, 1)}
+    if NUM_THREADS > 0:
+        torch.set_num_threads(NUM_THREADS)
+    _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    _mode = INFERENCE_MODE if _device.type == "cpu" else "eager"
+    _channels_last = CHANNELS_LAST and _device.type == "cpu"
+    # Only the TorchScript modes use the cached copy; eager, quantization and torch.compile need the nn.Module
+    model, load_info = load_weights(path, _device, CACHE_DIR if _mode in TORCHSCRIPT_MODES else None)
+    info.update(load_info)
+    start = time.perf_counter()
+    model = prepare_model(model, _mode, _channels_last, CALIBRATION_DIR, WARMUP_RUNS, _device)
+    info["prepare_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    _load_info = info
+    return model
+
+
+def warm_up(model):
+    """A dummy photo through decode, transforms and the model (prepare_model already warmed the model alone)."""
+    from evaluate import predict
+
+    predict(warmup_jpeg(), model, _device)
+
+
+def parity_predict(model, image: bytes) -> tuple[str, float]:
+    """Label and confidence of one held-out image, for the parity check of a swapped-in model."""
+    from evaluate import predict
+
+    classification, item_type, confidence = predict(image, model, _device)
+    return f"{item_type}:{classification}", confidence
+
+
+_loader = ModelLoader("freshvision", load_model, warm_up, version=lambda: model_file_version(MODEL_PATH))
+_swapper = ModelSwapper(_loader, MODEL_PATH, load_model, parity_predict)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload(_loader)
+    _swapper.watch()
+    yield
+
 
 app = FastAPI(
     title="FreshVision (EfficientNet)",
     description="ResQ Meal - Fresh/rotten classifier for apple, banana, orange (devdezzies/freshvision)",
     version="1.0.0",
+    lifespan=lifespan,
 )
+instrument(app, "freshvision")
+limit_uploads(app)
+add_probes(app, _loader)
+add_model_admin(app, _swapper)
 
-_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-_model = None
-
-
-def get_model():
-    global _model
-    if _model is None:
-        if not os.path.isfile(MODEL_PATH):
-            raise FileNotFoundError(
-                f"Model not found: {MODEL_PATH}. "
-                "Clone https://github.com/devdezzies/freshvision and copy models/effnetb0_freshvisionv0_10_epochs.pt "
-                "to this service's models/ folder, or set FRESHVISION_MODEL_PATH."
-            )
-        _model = create_model_baseline_effnetb0(out_feats=6, device=_device)
-        try:
-            _model.load_state_dict(torch.load(MODEL_PATH, map_location=_device, weights_only=True))
-        except TypeError:
-            _model.load_state_dict(torch.load(MODEL_PATH, map_location=_device))
-    return _model
+# torch already parallelizes each forward pass across cores, so one worker by default
+_pool = InferencePool.from_env(default_workers=1, name="freshvision")
+# Results for repeated images, keyed by content hash + active model version (per request) and configured mode
+# (int8 modes can differ slightly; the version is known once the load starts, so cached results are served
+# while it runs)
+_cache = ResultCache.from_env("freshvision")
+CACHE_VARIANT = variant(mode=INFERENCE_MODE, channels_last=CHANNELS_LAST)
 
 
 @app.get("/health")
 def health():
-    try:
-        get_model()
-        return {"status": "ok", "model_loaded": True}
-    except FileNotFoundError as e:
-        return {"status": "degraded", "model_loaded": False, "message": str(e)}
+    """Service state; never waits for the model (status is loading until it is warm)."""
+    if _loader.state == "failed":
+        return {"status": "degraded", "model_loaded": False, "message": _loader.error}
+    out = {
+        "status": "ok" if _loader.ready else "loading",
+        "model_loaded": _loader.ready,
+        "model": _loader.stats(),
+        "model_version": _loader.version,
+        "startup": {"import_ms": _IMPORT_MS},
+        "inference": _pool.stats(),
+        "cache": _cache.stats(),
+    }
+    if _loader.ready:
+        # Imported by the load already
+        import torch
+        from loader import peak_rss_mb
+
+        out["startup"].update(**_load_info, peak_rss_mb=peak_rss_mb())
+        out["inference_mode"] = {"mode": _mode, "channels_last": _channels_last, "threads": torch.get_num_threads()}
+    return out
+
+
+def infer(content: bytearray) -> tuple[str, str, float, int, str | None]:
+    """
+    (classification, item_type, confidence, freshness_index, model_version); waits for the model if it
+    is still loading.
+    """
+    model, version = _loader.get_versioned()
+    from evaluate import get_freshness_index, predict
+
+    classification, item_type, confidence = predict(content, model, _device)
+    return classification, item_type, confidence, get_freshness_index(classification, confidence), version
 
 
 @app.post("/evaluate")
-async def evaluate(file: UploadFile = File(...)):
+async def evaluate(response: Response, file: UploadFile = File(...)):
     """Upload image; returns classification (fresh/rotten), item_type, freshness_index (0-100)."""
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
-    try:
-        model = get_model()
-    except FileNotFoundError as e:
-        raise HTTPException(status_code=503, detail=str(e))
-
-    suffix = Path(file.filename or "image").suffix or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
-    try:
-        classification, item_type, confidence = predict(tmp_path, model, _device)
-        freshness_index = round(confidence * 100) if classification == "fresh" else round((1 - confidence) * 100)
-        freshness_index = max(0, min(100, freshness_index))
-        return {
-            "classification": classification,
-            "item_type": item_type,
-            "confidence": round(confidence, 4),
-            "freshness_index": freshness_index,
-        }
-    finally:
-        if os.path.isfile(tmp_path):
-            os.unlink(tmp_path)
+    content = await read_upload(file)
+    version = _loader.version
+    cache_key = _cache.key(content, f"{CACHE_VARIANT}:{version}")
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    with _pool.admit() as ticket:
+        try:
+            classification, item_type, confidence, freshness_index, model_version = await _pool.run(
+                infer, content, ticket=ticket
+            )
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    ticket.apply_headers(response)
+    result = {
+        "classification": classification,
+        "item_type": item_type,
+        "confidence": round(confidence, 4),
+        "freshness_index": freshness_index,
+        "model_version": model_version,
+    }
+    # Not cached under the version looked up when a swap happened meanwhile
+    if model_version == version:
+        _cache.put(cache_key, result)
+    response.headers["X-Cache"] = "miss"
+    return result
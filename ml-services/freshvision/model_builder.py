@@ -1,14 +1,16 @@
 """
 EfficientNetB0 model builder for FreshVision.
 Based on https://github.com/devdezzies/freshvision model_builder.py
+Serving builds the bare architecture (pretrained=False) since the fine-tuned state dict replaces every weight;
+pretrained=True is only useful for training from the ImageNet checkpoint.
 """
 import torch
 import torchvision
 from torch import nn
 
 
-def create_model_baseline_effnetb0(out_feats: int, device: torch.device = None) -> torch.nn.Module:
-    weights = torchvision.models.EfficientNet_B0_Weights.DEFAULT
+def create_model_baseline_effnetb0(out_feats: int, device: torch.device = None, pretrained: bool = False) -> torch.nn.Module:
+    weights = torchvision.models.EfficientNet_B0_Weights.DEFAULT if pretrained else None
     model = torchvision.models.efficientnet_b0(weights=weights).to(device)
     for param in model.features.parameters():
         param.requires_grad = False
@@ -0,0 +1,112 @@
+"""
+CPU inference modes for FreshVision's EfficientNet-B0, applied once at load.
+
+- eager: the float32 nn.Module built from the state dict, never TorchScript (reference for parity.py)
+- torchscript: the traced TorchScript copy, loaded from the cache when there is one (fastest start)
+- frozen: traced, frozen and optimized TorchScript (conv/bn folding, fused ops)
+- compiled: torch.compile (first calls are slow; the load warm-up absorbs them)
+- dynamic_int8: dynamic int8 quantization (Linear layers; the convolutions stay float32)
+- static_int8: FX post-training static int8 quantization, calibrated on sample images
+
+channels_last can be combined with any float mode; it converts weights and inputs to NHWC, which
+oneDNN convolutions prefer on CPU.
+"""
+from pathlib import Path
+
+import torch
+
+from evaluate import preprocess_image
+
+MODES = ("eager", "torchscript", "frozen", "compiled", "dynamic_int8", "static_int8")
+# Modes that start from the cached TorchScript copy; the others need the plain nn.Module
+TORCHSCRIPT_MODES = ("torchscript", "frozen")
+INPUT_SHAPE = (1, 3, 224, 224)
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+class ChannelsLastInput(torch.nn.Module):
+    """Feed the wrapped module NHWC (channels_last) inputs."""
+
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, x):
+        return self.module(x.contiguous(memory_format=torch.channels_last))
+
+
+def sample_images(directory: str, limit: int) -> list[Path]:
+    paths = sorted(p for p in Path(directory).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return paths[:limit]
+
+
+def calibration_batches(directory: str, limit: int = 100) -> list[torch.Tensor]:
+    """Preprocessed (1, 3, 224, 224) tensors from sample images, as predict() sees them."""
+    batches = []
+    for path in sample_images(directory, limit):
+        try:
+            batches.append(preprocess_image(str(path)))
+        except ValueError:
+            continue
+    if not batches:
+        raise RuntimeError(f"No readable calibration images in {directory}")
+    return batches
+
+
+def _static_int8(model: torch.nn.Module, calibration_dir: str | None) -> torch.nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if not calibration_dir:
+        raise RuntimeError("static_int8 needs calibration images (FRESHVISION_CALIBRATION_DIR)")
+    prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (torch.zeros(INPUT_SHAPE),))
+    with torch.inference_mode():
+        for x in calibration_batches(calibration_dir):
+            prepared(x)
+    return convert_fx(prepared)
+
+
+def prepare_model(
+    model: torch.nn.Module,
+    mode: str = "eager",
+    channels_last: bool = False,
+    calibration_dir: str | None = None,
+    warmup_runs: int = 2,
+    device: torch.device | None = None,
+) -> torch.nn.Module:
+    """
+    Apply an inference mode to an eval-mode CPU model (nn.Module, or the cached TorchScript module for
+    TORCHSCRIPT_MODES), then run warmup_runs forward passes so the first request pays no setup cost.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown inference mode {mode!r}; use one of {', '.join(MODES)}")
+    if mode not in TORCHSCRIPT_MODES and isinstance(model, torch.jit.ScriptModule):
+        raise ValueError(f"Inference mode {mode} needs the nn.Module, not a TorchScript copy")
+    model = model.eval()
+    example = torch.zeros(INPUT_SHAPE, device=device)
+    # int8 kernels take NCHW; channels_last only applies to float modes
+    channels_last = channels_last and mode not in ("dynamic_int8", "static_int8")
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    if mode in TORCHSCRIPT_MODES and not isinstance(model, torch.jit.ScriptModule):
+        # No cached copy (cache disabled or unwritable): trace it here
+        with torch.no_grad():
+            model = torch.jit.trace(model, example).eval()
+    if mode == "frozen":
+        with torch.no_grad():
+            model = torch.jit.optimize_for_inference(torch.jit.freeze(model))
+    elif mode == "compiled":
+        model = torch.compile(model)
+    elif mode == "dynamic_int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif mode == "static_int8":
+        model = _static_int8(model, calibration_dir)
+
+    if channels_last:
+        model = ChannelsLastInput(model)
+    with torch.inference_mode():
+        for _ in range(warmup_runs):
+            model(example)
+    return model
@@ -0,0 +1,88 @@
+"""
+Parity and latency check for the FreshVision inference modes (modes.py).
+Every mode is run on the sample images and compared with the float32 eager model: top-1 agreement,
+max probability difference and single-image latency.
+
+Run from this folder: python parity.py --samples DIR [--modes frozen static_int8] [--channels-last]
+    [--calibration-dir DIR] [--min-agreement 0.99] [--json]
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from loader import build_model  # noqa: E402
+from modes import MODES, calibration_batches, prepare_model  # noqa: E402
+
+
+def run(model, inputs: list[torch.Tensor]) -> tuple[torch.Tensor, list[float]]:
+    probs, times = [], []
+    with torch.inference_mode():
+        for x in inputs:
+            start = time.perf_counter()
+            logits = model(x)
+            times.append((time.perf_counter() - start) * 1000)
+            probs.append(torch.softmax(logits.float(), dim=-1))
+    return torch.cat(probs), times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FreshVision inference modes against float32.")
+    parser.add_argument("--model", default=os.environ.get(
+        "FRESHVISION_MODEL_PATH", str(Path(__file__).resolve().parent / "models" / "effnetb0_freshvisionv0_10_epochs.pt")
+    ))
+    parser.add_argument("--samples", required=True, help="Directory of sample images")
+    parser.add_argument("--limit", type=int, default=200, help="Max sample images (default: %(default)s)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=[m for m in MODES if m != "eager"])
+    parser.add_argument("--channels-last", action="store_true", help="Also convert float modes to channels_last")
+    parser.add_argument("--calibration-dir", help="Calibration images for static_int8 (default: --samples)")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--min-agreement", type=float, help="Exit with status 1 if any mode agrees less than this")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    inputs = calibration_batches(args.samples, args.limit)
+    base = build_model(args.model)
+    reference, reference_times = run(prepare_model(copy.deepcopy(base), "eager"), inputs)
+    reference_top1 = reference.argmax(dim=-1)
+
+    results = {"images": len(inputs), "threads": torch.get_num_threads(), "modes": {}}
+    results["modes"]["eager"] = {"top1_agreement": 1.0, "max_prob_diff": 0.0, "p50_ms": round(float(np.median(reference_times)), 2)}
+    for mode in args.modes:
+        start = time.perf_counter()
+        model = prepare_model(
+            copy.deepcopy(base), mode, args.channels_last, args.calibration_dir or args.samples
+        )
+        prepare_s = time.perf_counter() - start
+        probs, times = run(model, inputs)
+        results["modes"][mode] = {
+            "top1_agreement": round(float((probs.argmax(dim=-1) == reference_top1).float().mean()), 4),
+            "max_prob_diff": round(float((probs - reference).abs().max()), 5),
+            "p50_ms": round(float(np.median(times)), 2),
+            "prepare_s": round(prepare_s, 2),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{results['images']} images, {results['threads']} threads, channels_last={args.channels_last}")
+        print(f"{'mode':<14} {'top-1 agree':>11} {'max Δprob':>10} {'p50 ms':>8}")
+        for mode, row in results["modes"].items():
+            print(f"{mode:<14} {row['top1_agreement']:>11} {row['max_prob_diff']:>10} {row['p50_ms']:>8}")
+    if args.min_agreement is not None and any(
+        row["top1_agreement"] < args.min_agreement for row in results["modes"].values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,27 @@ Uses MobileNetV2-based model; prediction is probability that item is fresh (0 =
 import os
 import cv2
 import numpy as np
-from tensorflow.keras.models import load_model
+
+from ml_common.images import ImageSource, decode_image_bgr
+from ml_common.metrics import stage
+from ml_common.runtimes import load_runtime_model
 
 # Thresholds (from repo: lower value = more fresh in their model)
 THRESHOLD_FRESH = float(os.environ.get("THRESHOLD_FRESH", "0.10"))
 THRESHOLD_MEDIUM = float(os.environ.get("THRESHOLD_MEDIUM", "0.35"))
+# Model input (width, height)
+INPUT_SIZE = (100, 100)
+
+
+def load_local_model(path: str, backend: str = "auto"):
+    """Load the model in this process (also the shared inference process's loader; see main.load_model)."""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(
+            f"Model file not found: {path}. "
+            "Clone https://github.com/captraj/fruit-veg-freshness-ai and copy rottenvsfresh98pval.h5 here, "
+            "or set FRESHNESS_MODEL_PATH."
+        )
+    return load_runtime_model(path, backend)
 
 
 def get_classification(prediction: float) -> str:
@@ -22,20 +38,49 @@ def get_classification(prediction: float) -> str:
     return "not_fresh"
 
 
-def preprocess_image(image_path: str) -> np.ndarray:
-    """Resize and normalize image for the model (100x100, RGB, 0-1)."""
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Could not read image: {image_path}")
-    img = cv2.resize(img, (100, 100))
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = img.astype(np.float32) / 255.0
-    img = np.expand_dims(img, axis=0)
-    return img
+def get_confidence(prediction: float) -> float:
+    """
+    How clearly prediction falls in its class, 0-1: how far it is past the class's threshold, as a share
+    of the way to the end of the scale. Always 0 for medium_fresh, the band between the thresholds.
+    """
+    if prediction < THRESHOLD_FRESH:
+        return min(1.0, (THRESHOLD_FRESH - prediction) / THRESHOLD_FRESH)
+    if prediction < THRESHOLD_MEDIUM:
+        return 0.0
+    return min(1.0, (prediction - THRESHOLD_MEDIUM) / max(1.0 - THRESHOLD_MEDIUM, 1e-6))
+
 
+def preprocess_image(image: ImageSource) -> np.ndarray:
+    """Decode (bytes, buffer or path), resize and normalize image for the model (100x100, RGB, 0-1)."""
+    img = decode_image_bgr(image, min_size=INPUT_SIZE)
+    with stage("resize"):
+        img = cv2.resize(img, INPUT_SIZE)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        img = img.astype(np.float32) / 255.0
+        return np.expand_dims(img, axis=0)
 
-def evaluate_freshness(image_path: str, model) -> float:
+
+def get_freshness_index(prediction: float) -> int:
+    """Freshness index 0-100 for UI (invert if model uses "rotten" as high)."""
+    freshness_index = round((1.0 - prediction) * 100) if prediction <= 1.0 else round(prediction * 100)
+    return max(0, min(100, freshness_index))
+
+
+def evaluate_freshness(image: ImageSource, model) -> float:
     """Run model on image; returns freshness score (higher = more fresh in typical setups)."""
-    x = preprocess_image(image_path)
-    pred = model.predict(x, verbose=0)
+    x = preprocess_image(image)
+    with stage("inference"):
+        pred = model.predict(x, verbose=0)
     return float(pred[0][0])
+
+
+def evaluate_freshness_batch(images: list[np.ndarray], model) -> list[float]:
+    """
+    Run model once on several preprocessed images (each shape (1, 100, 100, 3)).
+    Returns one prediction per image, in order.
+    """
+    if not images:
+        return []
+    x = np.concatenate(images, axis=0)
+    pred = model.predict(x, batch_size=len(images), verbose=0)
+    return [float(p[0]) for p in pred]
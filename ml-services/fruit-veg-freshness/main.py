@@ -2,80 +2,225 @@
 FastAPI wrapper for fruit-veg-freshness-ai model.
 https://github.com/captraj/fruit-veg-freshness-ai
 
+Concurrent /evaluate calls are micro-batched into one model.predict (see ml_common/batching.py),
+which runs on a bounded inference pool off the event loop (see ml_common/inference.py).
+
+The model is loaded and warmed up in the background at startup; /livez and /readyz are the
+liveness and readiness probes (see ml_common/readiness.py). A retrained model file is swapped in
+without a restart through /admin/model or MODEL_WATCH_SECONDS (see ml_common/model_swap.py).
+
 Run: uvicorn main:app --host 0.0.0.0 --port 8000
 """
 import os
-import tempfile
+import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from tensorflow.keras.models import load_model
-
-from evaluate import evaluate_freshness, get_classification
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response
 
 # Model path: clone repo and copy rottenvsfresh98pval.h5 here, or set MODEL_PATH
 MODEL_DIR = Path(__file__).resolve().parent
 DEFAULT_MODEL = MODEL_DIR / "rottenvsfresh98pval.h5"
 MODEL_PATH = os.environ.get("FRESHNESS_MODEL_PATH", str(DEFAULT_MODEL))
+# keras, tflite, onnx, or auto (from the model file extension); see ml_common/runtimes.py
+MODEL_BACKEND = os.environ.get("FRESHNESS_MODEL_BACKEND", "auto")
+
+# Shared helpers (ml-services/ml_common)
+sys.path.insert(0, str(MODEL_DIR.parent))
+from ml_common.batching import MicroBatcher  # noqa: E402
+from ml_common.inference import InferencePool, Ticket  # noqa: E402
+from ml_common.metrics import instrument  # noqa: E402
+from ml_common.model_swap import ModelSwapper, add_model_admin, model_file_version  # noqa: E402
+from ml_common.readiness import ModelLoader, add_probes, preload, warmup_jpeg  # noqa: E402
+from ml_common.result_cache import ResultCache, variant  # noqa: E402
+from ml_common.runtimes import resolve_backend  # noqa: E402
+from ml_common.shared_inference import SHARED_INFERENCE, SharedModel  # noqa: E402
+from ml_common.uploads import limit_uploads, read_upload  # noqa: E402
+
+from evaluate import (  # noqa: E402
+    THRESHOLD_FRESH,
+    THRESHOLD_MEDIUM,
+    evaluate_freshness_batch,
+    get_classification,
+    get_freshness_index,
+    load_local_model,
+    preprocess_image,
+)
+
+# Fails at startup on an unknown backend rather than on the first request
+BACKEND = resolve_backend(MODEL_PATH, MODEL_BACKEND)
+
+# Micro-batching: wait up to BATCH_MAX_WAIT_MS for up to BATCH_MAX_SIZE images per model.predict
+BATCH_MAX_SIZE = int(os.environ.get("FRESHNESS_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("FRESHNESS_BATCH_MAX_WAIT_MS", "5"))
+# Upper bound on images accepted by one /evaluate-batch request
+BATCH_MAX_FILES = int(os.environ.get("FRESHNESS_BATCH_MAX_FILES", "64"))
+# Upper bound on the whole /evaluate-batch body (each image is still held to MAX_UPLOAD_BYTES)
+BATCH_MAX_BYTES = int(os.environ.get("FRESHNESS_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def load_model(path: str = MODEL_PATH):
+    if SHARED_INFERENCE:
+        # One copy of the model per host, in the inference process; this worker only preprocesses.
+        # A new file version gets a new inference process (the old one exits once no worker uses it).
+        return SharedModel(
+            MODEL_DIR.name, "evaluate.load_local_model", key=model_file_version(path), args=(path, BACKEND)
+        )
+    return load_local_model(path, BACKEND)
+
+
+def warm_up(model):
+    """Decode and predict a dummy photo, alone and as a full batch (the two shapes the batcher sends most)."""
+    image = preprocess_image(warmup_jpeg())
+    for size in sorted({1, BATCH_MAX_SIZE}):
+        evaluate_freshness_batch([image] * size, model)
+
+
+def parity_predict(model, image: bytes) -> tuple[str, float]:
+    """Label and score of one held-out image, for the parity check of a swapped-in model."""
+    [prediction] = evaluate_freshness_batch([preprocess_image(image)], model)
+    return get_classification(prediction), prediction
+
+
+# Loaded and warmed up in the background from startup; if the file is missing, /evaluate returns 503 until it is there
+_loader = ModelLoader("fruit_veg", load_model, warm_up, version=lambda: model_file_version(MODEL_PATH))
+_swapper = ModelSwapper(_loader, MODEL_PATH, load_model, parity_predict)
+
+
+def get_model():
+    return _loader.get()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preload(_loader)
+    _swapper.watch()
+    yield
+    if isinstance(_loader.model, SharedModel):
+        # Unlink this worker's ring now: uvicorn ends workers by re-raising the stop signal, skipping exit hooks
+        _loader.model.close()
+
 
 app = FastAPI(
     title="Fruit-Veg Freshness API",
     description="ResQ Meal - Freshness classification for fruits/vegetables (fruit-veg-freshness-ai)",
     version="1.0.0",
+    lifespan=lifespan,
 )
+instrument(app, "fruit-veg")
+limit_uploads(app, path_limits={"/evaluate-batch": BATCH_MAX_BYTES})
+add_probes(app, _loader)
+add_model_admin(app, _swapper)
 
-# Load model once at startup (optional; if missing, /evaluate will return 503 until model is available)
-_model = None
 
+# Decode and batched predict run here (two workers so decoding overlaps the running batch)
+_pool = InferencePool.from_env(default_workers=2, name="fruit-veg")
 
-def get_model():
-    global _model
-    if _model is None:
-        if not os.path.isfile(MODEL_PATH):
-            raise FileNotFoundError(
-                f"Model file not found: {MODEL_PATH}. "
-                "Clone https://github.com/captraj/fruit-veg-freshness-ai and copy rottenvsfresh98pval.h5 here, "
-                "or set FRESHNESS_MODEL_PATH."
-            )
-        _model = load_model(MODEL_PATH)
-    return _model
 
+def predict_batch(images: list) -> list[tuple[float, str | None]]:
+    """(prediction, model_version) per image; one batch always runs on one model, even during a swap."""
+    model, version = _loader.get_versioned()
+    return [(prediction, version) for prediction in evaluate_freshness_batch(images, model)]
 
-@app.get("/health")
-def health():
-    try:
-        get_model()
-        return {"status": "ok", "model_loaded": True}
-    except FileNotFoundError as e:
-        return {"status": "degraded", "model_loaded": False, "message": str(e)}
 
+_batcher = MicroBatcher(
+    predict_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    executor=_pool.executor,
+)
+# Results for repeated images, keyed by content hash + active model version (per request), backend and thresholds
+_cache = ResultCache.from_env("fruit-veg")
+CACHE_VARIANT = variant(backend=BACKEND, fresh=THRESHOLD_FRESH, medium=THRESHOLD_MEDIUM)
 
-@app.post("/evaluate")
-async def evaluate(file: UploadFile = File(...)):
-    """Upload an image; returns prediction and freshness classification."""
+
+def build_result(prediction: float, version: str | None) -> dict:
+    return {
+        "prediction": round(prediction, 4),
+        "classification": get_classification(prediction),
+        "freshness_index": get_freshness_index(prediction),
+        "model_version": version,
+    }
+
+
+async def read_image_upload(file: UploadFile) -> bytearray:
+    """Check the content type and read the upload into memory (bounded)."""
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image (JPEG, PNG, etc.)")
+    return await read_upload(file)
+
+
+async def prepare(contents: list[bytearray], ticket: Ticket) -> list:
+    """Load the model if needed and preprocess each image to (1, 100, 100, 3), on the inference pool."""
     try:
-        model = get_model()
+        await _pool.run(get_model, ticket=ticket)
+        return await _pool.run(lambda: [preprocess_image(c) for c in contents])
     except FileNotFoundError as e:
         raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    suffix = Path(file.filename or "image").suffix or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
-    try:
-        prediction = evaluate_freshness(tmp_path, model)
-        classification = get_classification(prediction)
-        # Freshness index 0-100 for UI (invert if model uses "rotten" as high)
-        freshness_index = round((1.0 - prediction) * 100) if prediction <= 1.0 else round(prediction * 100)
-        freshness_index = max(0, min(100, freshness_index))
-        return {
-            "prediction": round(prediction, 4),
-            "classification": classification,
-            "freshness_index": freshness_index,
-        }
-    finally:
-        if os.path.isfile(tmp_path):
-            os.unlink(tmp_path)
+
+@app.get("/health")
+def health():
+    """Service state; never waits for the model (status is loading until it is warm)."""
+    if _loader.state == "failed":
+        return {"status": "degraded", "model_loaded": False, "message": _loader.error}
+    out = {
+        "status": "ok" if _loader.ready else "loading",
+        "model_loaded": _loader.ready,
+        "model": _loader.stats(),
+        "model_version": _loader.version,
+        "backend": BACKEND,
+        "inference": _pool.stats(),
+        "cache": _cache.stats(),
+    }
+    if SHARED_INFERENCE and _loader.ready:
+        out["shared_inference"] = _loader.model.stats()
+    return out
+
+
+@app.post("/evaluate")
+async def evaluate(response: Response, file: UploadFile = File(...)):
+    """Upload an image; returns prediction and freshness classification."""
+    content = await read_image_upload(file)
+    version = _loader.version
+    cache_key = _cache.key(content, f"{CACHE_VARIANT}:{version}")
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    with _pool.admit() as ticket:
+        [image] = await prepare([content], ticket)
+        prediction, model_version = await _batcher.submit(image)
+    ticket.apply_headers(response)
+    result = build_result(prediction, model_version)
+    # Not cached under the version looked up when a swap happened meanwhile
+    if model_version == version:
+        _cache.put(cache_key, result)
+    response.headers["X-Cache"] = "miss"
+    return result
+
+
+@app.post("/evaluate-batch")
+async def evaluate_batch(response: Response, files: list[UploadFile] = File(...)):
+    """Upload several images (`files`); returns one result per image, in upload order."""
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} images per request")
+    contents = [await read_image_upload(f) for f in files]
+    version = _loader.version
+    keys = [_cache.key(c, f"{CACHE_VARIANT}:{version}") for c in contents]
+    results = [_cache.get(k) for k in keys]
+    # Only images not in the cache go to the model
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        with _pool.admit() as ticket:
+            images = await prepare([contents[i] for i in missing], ticket)
+            predictions = await _batcher.submit_many(images)
+        ticket.apply_headers(response)
+        for i, (prediction, model_version) in zip(missing, predictions):
+            results[i] = build_result(prediction, model_version)
+            if model_version == version:
+                _cache.put(keys[i], results[i])
+    response.headers["X-Cache-Hits"] = str(len(contents) - len(missing))
+    return {"results": results}
@@ -0,0 +1,4 @@
+"""
+Shared helpers for the ResQ Meal ML services.
+Each service runs from its own folder (uvicorn main:app) and adds ml-services/ to sys.path to import this package.
+"""
@@ -0,0 +1,112 @@
+"""
+In-process micro-batching for model inference.
+Concurrent requests are collected for a few milliseconds (up to max_batch_size items)
+and run as one batched call, so per-call model overhead is paid once per batch.
+Batch sizes go to the ml_batch_size histogram; each caller's request timings get the batch's
+inference time (see metrics.py).
+"""
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Sequence
+
+from ml_common.metrics import add_timing, observe_batch, observe_stage
+
+
+class MicroBatcher:
+    """
+    Collect items submitted from concurrent requests and run them through run_batch together.
+    run_batch(items) must return one result per item, in the same order. It is called in
+    an executor thread so the event loop stays free while the model runs.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[list], Sequence[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        executor: Executor | None = None,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        # Created lazily so the queue and task belong to the server's running event loop
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            # Own, empty context: the task outlives the request that happened to start it
+            loop = asyncio.get_running_loop()
+            self._worker = contextvars.Context().run(loop.create_task, self._run())
+        return self._queue
+
+    async def submit(self, item, on_start: Callable[[], None] | None = None) -> Any:
+        """
+        Queue one item and wait for its own result.
+        on_start (optional) is called from the executor thread right before the batch runs.
+        """
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((item, future, on_start))
+        result, seconds = await future
+        add_timing("inference", seconds)
+        return result
+
+    async def submit_many(self, items: list, on_start: Callable[[], None] | None = None) -> list:
+        """Queue several items at once (they may share batches with other requests)."""
+        return list(await asyncio.gather(*(self.submit(item, on_start) for item in items)))
+
+    async def _collect(self) -> list:
+        """Wait for the first item, then keep collecting until the batch is full or max_wait elapses."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip callers that went away (client disconnect cancels their future)
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+            items = [item for item, _, _ in batch]
+            callbacks = [cb for _, _, cb in batch if cb is not None]
+
+            def call():
+                for cb in callbacks:
+                    cb()
+                return self.run_batch(items)
+
+            observe_batch(len(items))
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, call)
+                if len(results) != len(items):
+                    raise RuntimeError(f"run_batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            seconds = time.perf_counter() - start
+            observe_stage("inference", seconds)
+            for (_, fut, _), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result((result, seconds))
@@ -0,0 +1,166 @@
+"""
+Benchmark and parity check for reduced-size (draft) JPEG decoding in the services' preprocess_image.
+
+For each model input size (fruit-veg 100, TFLite 224 by default, FreshVision 224, Food-101 299) the
+service's own preprocess_image is timed with a full decode (the default) and with draft decoding
+(IMAGE_DRAFT_DECODE=1), and the model inputs are compared. The "all" row compares four full decodes
+with the gateway's path: one draft decode for the largest input, then every model's preprocessing.
+
+Run from ml-services/:
+    python -m ml_common.bench_preprocess [--images DIR] [--repeat 20] [--max-mean-diff 0.02] [--json]
+
+Without --images a synthetic 12 MP JPEG is used. Services whose dependencies are missing are skipped.
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ml_common import images
+from ml_common.images import open_image
+from ml_common.services import load_service_modules
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg"}
+
+
+def synthetic_jpeg(width: int = 4032, height: int = 3024, seed: int = 0) -> bytes:
+    """Phone-sized JPEG with smooth gradients and sensor-like noise."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 6, base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def load_targets(tflite_size: int) -> dict:
+    """name -> (input (width, height), preprocess(image) -> array); services with missing dependencies are skipped."""
+    services = {
+        "fruit_veg": "fruit-veg-freshness",
+        "tflite": "freshness-detector-tflite",
+        "freshvision": "freshvision",
+        "food101": "food-image-recognition",
+    }
+    targets = {}
+    for name, service in services.items():
+        try:
+            ev = load_service_modules(service, "evaluate").evaluate
+        except ImportError as e:
+            print(f"skipping {name}: {e}", file=sys.stderr)
+            continue
+        if name == "tflite":
+            targets[name] = ((tflite_size, tflite_size), lambda img, ev=ev: ev.preprocess_image(img, tflite_size, tflite_size, "float32"))
+        elif name == "freshvision":
+            targets[name] = (ev.INPUT_SIZE, lambda img, ev=ev: ev.preprocess_image(img).numpy())
+        else:
+            targets[name] = (ev.INPUT_SIZE, ev.preprocess_image)
+    return targets
+
+
+def timed(fn, repeat: int) -> tuple[object, float]:
+    """Last result and median latency in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, float(np.median(samples))
+
+
+def with_draft(enabled: bool, fn):
+    def run():
+        images.DRAFT_DECODE = enabled
+        return fn()
+
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time full vs draft JPEG decoding in each service's preprocessing.")
+    parser.add_argument("--images", help="Directory of JPEGs (default: one synthetic 12 MP JPEG)")
+    parser.add_argument("--limit", type=int, default=10, help="Max images from --images (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per image and variant")
+    parser.add_argument("--tflite-size", type=int, default=224, help="TFLite model input side (default: %(default)s)")
+    parser.add_argument("--max-mean-diff", type=float, help="Exit with status 1 if any mean |diff| (relative to the input's range) exceeds this")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.images:
+        paths = sorted(p for p in Path(args.images).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)[: args.limit]
+        samples = [p.read_bytes() for p in paths]
+    else:
+        samples = [synthetic_jpeg()]
+    if not samples:
+        sys.exit(f"No JPEGs in {args.images}")
+    targets = load_targets(args.tflite_size)
+    draft_default = images.DRAFT_DECODE
+
+    rows = {}
+    for name, (size, preprocess) in targets.items():
+        full_ms, draft_ms, max_diff, mean_diff = [], [], [], []
+        for data in samples:
+            full, t_full = timed(with_draft(False, lambda: np.asarray(preprocess(data), dtype=np.float32)), args.repeat)
+            draft, t_draft = timed(with_draft(True, lambda: np.asarray(preprocess(data), dtype=np.float32)), args.repeat)
+            # Model inputs use different scales ([0, 1], [-1, 1], ImageNet z-scores); report diffs per unit of range
+            scale = float(full.max() - full.min()) or 1.0
+            diff = np.abs(draft - full) / scale
+            full_ms.append(t_full)
+            draft_ms.append(t_draft)
+            max_diff.append(float(diff.max()))
+            mean_diff.append(float(diff.mean()))
+        rows[name] = {
+            "size": f"{size[0]}x{size[1]}",
+            "full_ms": round(float(np.mean(full_ms)), 2),
+            "draft_ms": round(float(np.mean(draft_ms)), 2),
+            "max_diff": round(max(max_diff), 4),
+            "mean_diff": round(float(np.mean(mean_diff)), 5),
+        }
+
+    if len(targets) > 1:
+        largest = (max(s[0] for s, _ in targets.values()), max(s[1] for s, _ in targets.values()))
+
+        def separate():
+            return [preprocess(data) for _, preprocess in targets.values()]
+
+        def shared():
+            image = open_image(data, min_size=largest)
+            return [preprocess(image) for _, preprocess in targets.values()]
+
+        separate_ms, shared_ms = [], []
+        for data in samples:
+            separate_ms.append(timed(with_draft(False, separate), args.repeat)[1])
+            shared_ms.append(timed(with_draft(True, shared), args.repeat)[1])
+        rows["all"] = {
+            "size": "-",
+            "full_ms": round(float(np.mean(separate_ms)), 2),
+            "draft_ms": round(float(np.mean(shared_ms)), 2),
+        }
+    images.DRAFT_DECODE = draft_default
+
+    results = {"images": len(samples), "repeat": args.repeat, "targets": rows}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{len(samples)} image(s), median of {args.repeat} runs each")
+        print(f"{'target':<12} {'size':>9} {'full ms':>9} {'draft ms':>9} {'speedup':>8} {'max diff':>9} {'mean diff':>10}")
+        for name, row in rows.items():
+            speedup = row["full_ms"] / row["draft_ms"] if row["draft_ms"] else float("inf")
+            print(
+                f"{name:<12} {row['size']:>9} {row['full_ms']:>9} {row['draft_ms']:>9} {speedup:>7.1f}x "
+                f"{row.get('max_diff', ''):>9} {row.get('mean_diff', ''):>10}"
+            )
+    if args.max_mean_diff is not None and any(
+        row.get("mean_diff", 0) > args.max_mean_diff for row in rows.values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Export a service's Keras model to TFLite and/or ONNX, optionally with post-training int8 quantization
+calibrated on sample images, and write an accuracy-vs-latency report against the original Keras model.
+
+Images are preprocessed with the service's own evaluate.preprocess_image, so calibration and the
+comparison see exactly what the API feeds the model.
+
+Run from ml-services/:
+    python -m ml_common.export --service fruit-veg-freshness --model fruit-veg-freshness/rottenvsfresh98pval.h5 \
+        --calibration-dir samples/ [--eval-dir samples/] [--formats tflite onnx] [--no-int8]
+
+Needs tensorflow (both formats) and tf2onnx + onnxruntime (ONNX). Serve a result by pointing the service's
+model path at it (the backend is picked from the extension; see runtimes.py).
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ml_common.runtimes import load_runtime_model
+from ml_common.services import load_service_modules
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def list_images(directory: str | None, limit: int) -> list[Path]:
+    if not directory:
+        return []
+    paths = sorted(p for p in Path(directory).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return paths[:limit]
+
+
+def preprocess_all(preprocess, paths: list[Path]) -> list[np.ndarray]:
+    """Preprocessed (1, H, W, C) float32 arrays; unreadable images are skipped."""
+    arrays = []
+    for path in paths:
+        try:
+            arrays.append(np.asarray(preprocess(str(path)), dtype=np.float32))
+        except ValueError:
+            print(f"skipping unreadable image {path}", file=sys.stderr)
+    return arrays
+
+
+def export_tflite(model, path: Path, calibration: list[np.ndarray] | None):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration:
+        # Full int8 weights and activations; input/output stay float32 so callers are unchanged
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([x] for x in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    path.write_bytes(converter.convert())
+
+
+def export_onnx(model, path: Path, opset: int):
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=str(path))
+
+
+def quantize_onnx(fp32_path: Path, path: Path, calibration: list[np.ndarray]):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnx.load(str(fp32_path)).graph.input[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._items = iter(calibration)
+
+        def get_next(self):
+            x = next(self._items, None)
+            return None if x is None else {input_name: x}
+
+    quantize_static(
+        str(fp32_path),
+        str(path),
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def labels_of(outputs: np.ndarray, classify) -> np.ndarray:
+    """Predicted label per row: argmax for multi-class outputs, the service's thresholds for a single score."""
+    if outputs.shape[1] > 1:
+        return np.argmax(outputs, axis=1)
+    if classify is not None:
+        return np.array([classify(float(v)) for v in outputs[:, 0]])
+    return (outputs[:, 0] >= 0.5).astype(int)
+
+
+def measure(model, inputs: list[np.ndarray], repeat: int) -> tuple[np.ndarray, dict]:
+    """Outputs for every input (batch of 1, like /evaluate) plus single-image latency stats in ms."""
+    model.predict(inputs[0], verbose=0)  # warm-up
+    outputs = np.concatenate([model.predict(x, verbose=0) for x in inputs])
+    samples = []
+    for i in range(repeat):
+        x = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        model.predict(x, verbose=0)
+        samples.append((time.perf_counter() - start) * 1000)
+    return outputs, {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a Keras model to TFLite / ONNX with optional int8 quantization.")
+    parser.add_argument("--service", required=True, help="Service folder whose evaluate.preprocess_image is used")
+    parser.add_argument("--model", required=True, help="Keras .h5 / .hdf5 model")
+    parser.add_argument("--output-dir", help="Where exported models and the report go (default: next to the model)")
+    parser.add_argument("--formats", nargs="+", choices=["tflite", "onnx"], default=["tflite", "onnx"])
+    parser.add_argument("--calibration-dir", help="Sample images for int8 calibration")
+    parser.add_argument("--calibration-count", type=int, default=200, help="Max calibration images (default: %(default)s)")
+    parser.add_argument("--eval-dir", help="Images for the comparison (default: the calibration images)")
+    parser.add_argument("--eval-count", type=int, default=200, help="Max comparison images (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed single-image predictions per variant")
+    parser.add_argument("--no-int8", action="store_true", help="Only export float32 variants")
+    parser.add_argument("--opset", type=int, default=13, help="ONNX opset (default: %(default)s)")
+    args = parser.parse_args()
+
+    evaluate = load_service_modules(args.service, "evaluate").evaluate
+    model_path = Path(args.model)
+    output_dir = Path(args.output_dir or model_path.parent)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    calibration = preprocess_all(evaluate.preprocess_image, list_images(args.calibration_dir, args.calibration_count))
+    inputs = preprocess_all(evaluate.preprocess_image, list_images(args.eval_dir, args.eval_count)) or calibration
+    int8 = bool(calibration) and not args.no_int8
+    if not args.no_int8 and not calibration:
+        print("no calibration images; exporting float32 variants only", file=sys.stderr)
+
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(model_path)
+    stem = model_path.stem
+    variants = {}
+    if "tflite" in args.formats:
+        variants["tflite"] = output_dir / f"{stem}.tflite"
+        export_tflite(keras_model, variants["tflite"], None)
+        if int8:
+            variants["tflite-int8"] = output_dir / f"{stem}.int8.tflite"
+            export_tflite(keras_model, variants["tflite-int8"], calibration)
+    if "onnx" in args.formats:
+        variants["onnx"] = output_dir / f"{stem}.onnx"
+        export_onnx(keras_model, variants["onnx"], args.opset)
+        if int8:
+            variants["onnx-int8"] = output_dir / f"{stem}.int8.onnx"
+            quantize_onnx(variants["onnx"], variants["onnx-int8"], calibration)
+
+    report = {"model": str(model_path), "service": args.service, "images": len(inputs), "variants": {}}
+    if not inputs:
+        print("no images to compare; skipping the report", file=sys.stderr)
+    else:
+        classify = getattr(evaluate, "get_classification", None)
+        reference, latency = measure(keras_model, inputs, args.repeat)
+        reference_labels = labels_of(reference, classify)
+        report["variants"]["keras"] = {"file": str(model_path), "size_mb": round(model_path.stat().st_size / 1e6, 2), **latency}
+        for name, path in variants.items():
+            start = time.perf_counter()
+            model = load_runtime_model(str(path))
+            load_ms = (time.perf_counter() - start) * 1000
+            outputs, latency = measure(model, inputs, args.repeat)
+            diff = np.abs(outputs - reference)
+            report["variants"][name] = {
+                "file": str(path),
+                "size_mb": round(path.stat().st_size / 1e6, 2),
+                "load_ms": round(load_ms, 1),
+                **latency,
+                "label_agreement": round(float(np.mean(labels_of(outputs, classify) == reference_labels)), 4),
+                "max_abs_diff": round(float(diff.max()), 5),
+                "mean_abs_diff": round(float(diff.mean()), 6),
+            }
+        report_path = output_dir / f"{stem}.export-report.json"
+        report_path.write_text(json.dumps(report, indent=2))
+        report["report"] = str(report_path)
+
+        print(f"{'variant':<12} {'size MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'agree':>7} {'max diff':>9}")
+        for name, row in report["variants"].items():
+            print(
+                f"{name:<12} {row['size_mb']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+                f"{row.get('label_agreement', 1.0):>7} {row.get('max_abs_diff', 0.0):>9}"
+            )
+    print(json.dumps({name: str(path) for name, path in variants.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
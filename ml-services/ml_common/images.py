@@ -0,0 +1,95 @@
+"""
+Decode images from memory (bytes / bytearray / memoryview), a file-like object, or a path.
+An already decoded PIL image is accepted too, so a caller that runs several models (the gateway)
+decodes once and passes the same image to each model's preprocessing.
+Decoding errors are raised as ValueError so services can map them to 400.
+
+Callers that only need a small input pass min_size: with IMAGE_DRAFT_DECODE=1, JPEGs are then decoded
+with DCT scaling (PIL draft mode) to the smallest 1/2, 1/4 or 1/8 scale still DRAFT_OVERSAMPLE times
+larger than min_size, instead of decoding every pixel of a 12 MP photo and throwing most away in the
+resize. It is off by default: it is 2-3x faster, but the model input is not the one the models were
+evaluated on (see bench_preprocess.py).
+EXIF orientation is applied on decode, as OpenCV's imdecode already does.
+"""
+import io
+import os
+from typing import Any, BinaryIO, Union
+
+from ml_common.metrics import stage
+
+# Any covers a decoded PIL.Image.Image (PIL is imported lazily)
+ImageSource = Union[bytes, bytearray, memoryview, BinaryIO, str, Any]
+
+# Opt-in reduced-size JPEG decoding for callers passing min_size (off: always decode full size, so the
+# model input is exactly the one the models were evaluated on)
+DRAFT_DECODE = os.environ.get("IMAGE_DRAFT_DECODE", "0") not in ("0", "false", "False", "")
+# Keep the draft this many times larger than the target, so the final resize still averages real pixels
+DRAFT_OVERSAMPLE = 2
+
+# EXIF orientation tag value -> PIL transpose method (same table as ImageOps.exif_transpose)
+_EXIF_ORIENTATION = 0x0112
+_ORIENTATION_TRANSPOSE = {2: 0, 3: 3, 4: 1, 5: 5, 6: 4, 7: 6, 8: 2}
+
+
+def _is_buffer(source) -> bool:
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def _is_pil_image(source) -> bool:
+    # Services decoding with OpenCV may not have Pillow installed
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    return isinstance(source, Image.Image)
+
+
+def open_image(source: ImageSource, min_size: tuple[int, int] | None = None):
+    """
+    Open an image with PIL, upright (EXIF orientation applied) and in RGB.
+    min_size (width, height) is the largest size the caller will resize to; JPEGs are then decoded at
+    a reduced scale (see DRAFT_OVERSAMPLE). A decoded PIL image is returned as is (converted to RGB).
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    if isinstance(source, Image.Image):
+        return source if source.mode == "RGB" else source.convert("RGB")
+    with stage("decode"):
+        try:
+            img = Image.open(io.BytesIO(source) if _is_buffer(source) else source)
+            if min_size and DRAFT_DECODE:
+                # draft() is a no-op for formats without DCT scaling; the side is used for both axes so
+                # the request holds whichever way the photo is rotated
+                side = max(min_size) * DRAFT_OVERSAMPLE
+                img.draft("RGB", (side, side))
+            orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+            if img.mode == "RGB":
+                img.load()
+            else:
+                img = img.convert("RGB")
+            if orientation in _ORIENTATION_TRANSPOSE:
+                img = img.transpose(_ORIENTATION_TRANSPOSE[orientation])
+            return img
+        except (UnidentifiedImageError, OSError) as e:
+            raise ValueError(f"Could not read image: {e}") from e
+
+
+def decode_image_bgr(source: ImageSource, min_size: tuple[int, int] | None = None):
+    """
+    Decode an image with OpenCV; returns a BGR uint8 array (H, W, 3).
+    With min_size (or a decoded PIL image) it is decoded by open_image instead, for draft decoding.
+    """
+    import cv2
+    import numpy as np
+
+    if _is_pil_image(source) or (min_size and DRAFT_DECODE):
+        return cv2.cvtColor(np.asarray(open_image(source, min_size)), cv2.COLOR_RGB2BGR)
+    with stage("decode"):
+        if isinstance(source, str):
+            img = cv2.imread(source)
+        else:
+            data = source if _is_buffer(source) else source.read()
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not read image")
+    return img
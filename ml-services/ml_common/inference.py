@@ -0,0 +1,111 @@
+"""
+Bounded inference executor with admission control.
+Blocking inference (model.predict, interpreter.invoke, torch forward) runs on a dedicated thread pool
+so the event loop keeps serving /health and new uploads. When more than max_workers + max_queue
+requests are admitted, new ones get 503 with Retry-After instead of piling up.
+
+Threads are used rather than processes: TensorFlow, TFLite and torch release the GIL while running,
+and the loaded models cannot be shipped to worker processes.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from fastapi import HTTPException, Response
+
+from ml_common.metrics import observe_queue_wait
+
+
+class Ticket:
+    """One admitted request: queue depth seen at admission and when its inference started."""
+
+    def __init__(self, queue_depth: int):
+        self.queue_depth = queue_depth
+        self.admitted_at = time.perf_counter()
+        self.started_at: float | None = None
+
+    def mark_started(self):
+        # Called from the worker thread; only the first call counts
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+            observe_queue_wait(self.started_at - self.admitted_at)
+
+    @property
+    def wait_ms(self) -> float:
+        end = self.started_at if self.started_at is not None else time.perf_counter()
+        return (end - self.admitted_at) * 1000
+
+    def apply_headers(self, response: Response):
+        """Report queue depth and wait time on the response."""
+        response.headers["X-Queue-Depth"] = str(self.queue_depth)
+        response.headers["X-Queue-Wait-Ms"] = f"{self.wait_ms:.1f}"
+
+
+class InferencePool:
+    def __init__(self, max_workers: int = 1, max_queue: int = 32, retry_after: int = 1, name: str = "inference"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.retry_after = max(1, int(retry_after))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        # Admitted requests (queued or running); only touched from the event loop thread
+        self._in_flight = 0
+
+    @classmethod
+    def from_env(cls, default_workers: int = 1, name: str = "inference") -> "InferencePool":
+        """Configure from INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE and INFERENCE_RETRY_AFTER."""
+        return cls(
+            max_workers=int(os.environ.get("INFERENCE_WORKERS", str(default_workers))),
+            max_queue=int(os.environ.get("INFERENCE_QUEUE_SIZE", "32")),
+            retry_after=int(os.environ.get("INFERENCE_RETRY_AFTER", "1")),
+            name=name,
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+    @contextlib.contextmanager
+    def admit(self):
+        """Admit one request or raise 503 (with Retry-After) when the queue is full."""
+        if self._in_flight >= self.max_workers + self.max_queue:
+            raise HTTPException(
+                status_code=503,
+                detail="Inference queue is full; retry later",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        ticket = Ticket(self.queue_depth)
+        self._in_flight += 1
+        try:
+            yield ticket
+        finally:
+            self._in_flight -= 1
+
+    async def run(self, fn: Callable, *args, ticket: Ticket | None = None):
+        """
+        Run fn(*args) on the pool; marks the ticket when a worker picks it up. fn runs in a copy of
+        the caller's context, so stages it times are added to the request's timings.
+        """
+        context = contextvars.copy_context()
+
+        def call():
+            if ticket is not None:
+                ticket.mark_started()
+            return fn(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, call)
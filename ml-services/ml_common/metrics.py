@@ -0,0 +1,312 @@
+"""
+Request and per-stage latency instrumentation, exposed in Prometheus text format on /metrics.
+
+instrument(app, service) adds a pure ASGI middleware and the /metrics route. The middleware times
+every request (by route template and status) and gives it a RequestTimings, reachable from any code
+the request runs through a context variable; InferencePool.run copies the request's context into its
+worker thread, so stages timed there are attributed to the right request. Code marks its stages with
+`with stage("decode"):` (upload, decode, resize, inference, postprocess, ...): each one is observed in
+a per-stage histogram and added to the request's timings, which SERVER_TIMING=1 returns as a
+Server-Timing header. Model load time, batch sizes, cache lookups and model cascade stages are recorded
+as well.
+
+Everything is in-process and cheap (a perf_counter pair, a bisect and a lock per stage, a few
+microseconds); METRICS_ENABLED=0 turns stages and the middleware into no-ops.
+"""
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") not in ("0", "false", "False", "")
+# Return each request's stage timings in a Server-Timing header (visible to browsers and clients)
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") not in ("0", "false", "False", "")
+
+# Seconds; covers a cache hit (sub-millisecond) to a cold model load
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, label_names: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = ("service", *label_names)
+        self._series: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: tuple) -> tuple:
+        return (REGISTRY.service, *labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines += [
+                f"{self.name}{_format_labels(self.label_names, labels)} {_format_number(value)}"
+                for labels, value in series
+            ]
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._label_values(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        key = self._label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound if bound == "+Inf" else _format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        # Constant service label on every series (set by instrument())
+        self.service = os.environ.get("METRICS_SERVICE_NAME", "")
+        self.metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram("ml_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+)
+STAGE_SECONDS = REGISTRY.register(
+    Histogram("ml_stage_duration_seconds", "Time spent in each processing stage", ("stage",))
+)
+QUEUE_WAIT_SECONDS = REGISTRY.register(
+    Histogram("ml_queue_wait_seconds", "Time admitted requests waited for an inference worker")
+)
+MODEL_LOAD_SECONDS = REGISTRY.register(
+    Gauge("ml_model_load_seconds", "Duration of the last model load", ("model",))
+)
+BATCH_SIZE = REGISTRY.register(
+    Histogram("ml_batch_size", "Items per batched model call", (), buckets=BATCH_BUCKETS)
+)
+CACHE_LOOKUPS = REGISTRY.register(
+    Counter("ml_cache_lookups_total", "Result cache lookups by outcome", ("cache", "result"))
+)
+CASCADE_STAGES = REGISTRY.register(
+    Counter("ml_cascade_stages_total", "Model cascade stages by model and outcome", ("model", "outcome"))
+)
+
+
+class RequestTimings:
+    """Stage durations of one request; appended from the event loop and worker threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # (stage, seconds); list.append is atomic, so concurrent stages need no lock
+        self.stages: list[tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float):
+        self.stages.append((name, seconds))
+
+    def totals(self) -> dict[str, float]:
+        out: dict[str, float] = {}
+        for name, seconds in list(self.stages):
+            out[name] = out.get(name, 0.0) + seconds
+        return out
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+# Set while warming up models, so dummy inferences stay out of the histograms
+_quiet: contextvars.ContextVar[bool] = contextvars.ContextVar("metrics_quiet", default=False)
+
+
+def current_timings() -> RequestTimings | None:
+    return _current.get()
+
+
+def add_timing(name: str, seconds: float):
+    """Add a duration to the current request's timings only (its histogram is observed elsewhere)."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def observe_stage(name: str, seconds: float):
+    """Record a stage duration measured by the caller."""
+    if not METRICS_ENABLED or _quiet.get():
+        return
+    STAGE_SECONDS.observe(seconds, name)
+    add_timing(name, seconds)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time the block as one stage of the current request."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Record nothing from the block's stages and batches (in this thread / task)."""
+    token = _quiet.set(True)
+    try:
+        yield
+    finally:
+        _quiet.reset(token)
+
+
+@contextlib.contextmanager
+def model_load(model: str):
+    """Time a model load: sets ml_model_load_seconds{model} and counts as the request's model_load stage."""
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    if METRICS_ENABLED:
+        MODEL_LOAD_SECONDS.set(seconds, model)
+        observe_stage("model_load", seconds)
+
+
+def observe_queue_wait(seconds: float):
+    if METRICS_ENABLED:
+        QUEUE_WAIT_SECONDS.observe(seconds)
+        add_timing("queue", seconds)
+
+
+def observe_batch(size: int):
+    if METRICS_ENABLED and not _quiet.get():
+        BATCH_SIZE.observe(size)
+
+
+def count_cache_lookup(cache: str, result: str):
+    if METRICS_ENABLED:
+        CACHE_LOOKUPS.inc(cache, result)
+
+
+def count_cascade_stage(model: str, outcome: str):
+    if METRICS_ENABLED:
+        CASCADE_STAGES.inc(model, outcome)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware: it would buffer streaming responses and run the
+    endpoint in another task): times each HTTP request and adds Server-Timing when enabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    headers = [*message.get("headers", []), (b"server-timing", timings.server_timing().encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            # Route template (e.g. /evaluate-environment/stream/{donation_id}), so paths stay low-cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - timings.started, scope["method"], route, str(status))
+
+
+def metrics_endpoint() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def instrument(app: FastAPI, service: str):
+    """Label this process's metrics with service, time every request and serve /metrics."""
+    REGISTRY.service = REGISTRY.service or service
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
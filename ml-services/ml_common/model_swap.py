@@ -0,0 +1,226 @@
+"""
+Zero-downtime model replacement for the image services.
+
+A ModelSwapper puts a retrained model file in without a restart: its ModelLoader loads the new
+model beside the active one, warms it up with the service's own warm-up, optionally checks parity
+on held-out images, then switches over in one assignment while requests in flight finish on the old
+model (see ModelLoader.swap). Responses and /health carry the active model_version (a hash of the
+model file), and the result cache is keyed by it, so results of the old model are not served for the
+new one while the cache stays warm for everything else.
+
+Two triggers:
+- add_model_admin(app, swapper): POST /admin/model (optional ?path= of another model file, ?parity=true)
+  and GET /admin/model, only with MODEL_ADMIN_TOKEN set (sent as X-Admin-Token). With uvicorn
+  --workers N a request swaps only the worker that answers it; use the file watch there.
+- MODEL_WATCH_SECONDS > 0: every worker polls its model file and swaps once a replaced file has not
+  changed for one interval (write the new file beside it and rename it over the old one).
+
+The parity check runs the old and the new model on the images in MODEL_PARITY_DIR and rejects the new
+one when their labels agree on fewer than MODEL_PARITY_MIN_AGREEMENT of them; file-watch swaps run it
+whenever MODEL_PARITY_DIR is set.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+
+from ml_common.readiness import ModelLoader
+from ml_common.result_cache import file_fingerprint
+from ml_common.runtimes import EXTENSION_BACKENDS
+
+# Enables /admin/model; requests must send it as X-Admin-Token
+MODEL_ADMIN_TOKEN = os.environ.get("MODEL_ADMIN_TOKEN") or None
+# Poll the model file this often and swap in a replaced one (0 disables)
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", "0"))
+# Held-out images for the parity check, the share whose labels must agree, and how many are used
+MODEL_PARITY_DIR = os.environ.get("MODEL_PARITY_DIR") or None
+MODEL_PARITY_MIN_AGREEMENT = float(os.environ.get("MODEL_PARITY_MIN_AGREEMENT", "0.95"))
+MODEL_PARITY_MAX_SAMPLES = int(os.environ.get("MODEL_PARITY_MAX_SAMPLES", "64"))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def model_file_version(path: str | None) -> str | None:
+    """Short content hash of a model file, or None when it is missing; hashed again only once the file changes."""
+    fingerprint = file_fingerprint(path)
+    if not path or fingerprint.endswith(":missing"):
+        return None
+    return _content_hash(path, fingerprint)
+
+
+@lru_cache(maxsize=16)
+def _content_hash(path: str, fingerprint: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def load_parity_samples(directory: str | None = MODEL_PARITY_DIR, limit: int = MODEL_PARITY_MAX_SAMPLES) -> list[bytes]:
+    """Encoded held-out images (first `limit` by name)."""
+    if not directory:
+        raise ValueError("Set MODEL_PARITY_DIR to a folder of held-out images to check parity")
+    paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)[:limit]
+    if not paths:
+        raise ValueError(f"No images in MODEL_PARITY_DIR ({directory})")
+    return [p.read_bytes() for p in paths]
+
+
+def _model_format(path: str) -> str:
+    """Runtime a model file's extension maps to (the extension itself when it maps to none)."""
+    ext = os.path.splitext(path)[1].lower()
+    return EXTENSION_BACKENDS.get(ext, ext)
+
+
+def parity_check(predict, samples: list[bytes], min_agreement: float = MODEL_PARITY_MIN_AGREEMENT):
+    """
+    check(old, new) for ModelLoader.swap: predict(model, image) -> (label, score) for every sample with
+    both models; raises ValueError when the labels agree on fewer than min_agreement of the samples.
+    """
+
+    def check(old, new) -> dict:
+        agree = 0
+        max_diff = 0.0
+        for image in samples:
+            old_label, old_score = predict(old, image)
+            new_label, new_score = predict(new, image)
+            agree += old_label == new_label
+            max_diff = max(max_diff, abs(float(old_score) - float(new_score)))
+        agreement = agree / len(samples)
+        if agreement < min_agreement:
+            raise ValueError(
+                f"Parity check failed: labels agree on {agree} of {len(samples)} held-out images "
+                f"({agreement:.0%}, minimum {min_agreement:.0%})"
+            )
+        return {
+            "samples": len(samples),
+            "agreement": round(agreement, 4),
+            "max_score_diff": round(max_diff, 4),
+            "min_agreement": min_agreement,
+        }
+
+    return check
+
+
+class ModelSwapper:
+    """
+    Swaps loader's model for the one in a file: load(path) loads it the way the service's own load
+    does; predict(model, image) -> (label, score) enables the parity check.
+    """
+
+    def __init__(self, loader: ModelLoader, path: str, load, predict=None):
+        self.loader = loader
+        # File of the active model (the configured one until a swap loads another)
+        self.path = path
+        self._load = load
+        self._predict = predict
+        self._seen = file_fingerprint(path)
+        self._watcher: threading.Thread | None = None
+
+    def swap(self, path: str | None = None, parity: bool = False) -> dict:
+        """Load path (default: the active model's file, e.g. replaced in place) and switch to it; see ModelLoader.swap."""
+        path = path or self.path
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Model not found: {path}")
+        # The service's backend (and what its cache keys and /health report) was resolved from the
+        # configured file at startup; another format needs a restart with the new model path
+        if _model_format(path) != _model_format(self.path):
+            raise ValueError(
+                f"{path} is not in the active model's format ({os.path.splitext(self.path)[1] or 'no extension'}); "
+                "restart the service with the new model path to change formats"
+            )
+        check = None
+        if parity:
+            if self._predict is None:
+                raise ValueError(f"{self.loader.name} has no parity check")
+            check = parity_check(self._predict, load_parity_samples())
+        fingerprint = file_fingerprint(path)
+        report = self.loader.swap(lambda: self._load(path), model_file_version(path), check, path=path)
+        self.path, self._seen = path, fingerprint
+        return report
+
+    def watch(self):
+        """Start polling the model file (call from the app lifespan); no-op unless MODEL_WATCH_SECONDS is set."""
+        if MODEL_WATCH_SECONDS > 0 and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name=f"watch-{self.loader.name}", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        pending = None
+        while True:
+            time.sleep(MODEL_WATCH_SECONDS)
+            current = file_fingerprint(self.path)
+            if current == self._seen or current.endswith(":missing") or not self.loader.ready or self.loader.swapping:
+                pending = None
+                continue
+            if current != pending:
+                # Changed since the last poll: give a copy in progress one more interval to finish
+                pending = current
+                continue
+            pending = None
+            try:
+                self.swap(parity=MODEL_PARITY_DIR is not None)
+            except Exception:  # noqa: BLE001 - reported under last_swap in /health
+                # Not retried until the file changes again
+                self._seen = current
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "version": self.loader.version,
+            "swapping": self.loader.swapping,
+            "swaps": self.loader.swaps,
+            "last_swap": self.loader.last_swap,
+        }
+
+
+def add_model_admin(app: FastAPI, swapper: ModelSwapper):
+    """Serve GET and POST /admin/model (only when MODEL_ADMIN_TOKEN is set)."""
+    if not MODEL_ADMIN_TOKEN:
+        return
+
+    def authorize(token: str | None):
+        if token is None or not hmac.compare_digest(token.encode(), MODEL_ADMIN_TOKEN.encode()):
+            raise HTTPException(status_code=401, detail="Missing or wrong X-Admin-Token")
+
+    async def model_status(x_admin_token: str | None = Header(None)) -> dict:
+        """Active model file and version, and the last swap."""
+        authorize(x_admin_token)
+        return swapper.stats()
+
+    async def swap_model(
+        path: str | None = Query(None, description="Model file to load (default: the active one, replaced in place)"),
+        parity: bool = Query(False, description="Compare labels with the active model on MODEL_PARITY_DIR first"),
+        x_admin_token: str | None = Header(None),
+    ) -> dict:
+        """
+        Load the model file beside the active model, warm it up, optionally check parity, then switch to it.
+        Returns the swap report (version, previous_version, load/warm-up seconds, parity). 404: no such file;
+        409: no model loaded yet or a swap already running; 422: another model format, rejected by the
+        parity check or not loadable.
+        The active model keeps serving throughout, and stays active when the swap fails.
+        """
+        authorize(x_admin_token)
+        if not swapper.loader.ready or swapper.loader.swapping:
+            raise HTTPException(status_code=409, detail="No model loaded yet, or a swap is already running")
+        try:
+            return await run_in_threadpool(swapper.swap, path, parity)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except RuntimeError as e:
+            # Another swap (e.g. the file watch) started after the check above
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except Exception as e:  # noqa: BLE001 - the old model is still active
+            raise HTTPException(status_code=422, detail=f"Model swap failed: {e}")
+
+    app.add_api_route("/admin/model", model_status, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/admin/model", swap_model, methods=["POST"], include_in_schema=False)
@@ -0,0 +1,258 @@
+"""
+Background model loading and liveness / readiness probes.
+
+A ModelLoader wraps a service's load function (framework import, weights, backend setup) and an
+optional warm-up (dummy inferences through the real code path at the real input shapes, so graph
+tracing, kernel selection and allocator growth happen before the first user request). preload()
+starts it on a background thread from the app lifespan, so the process binds its port at once.
+Requests that need the model before then wait for the load in progress; a failed load (e.g. the model
+file is not there yet) is retried by the next request, or by /readyz at most every MODEL_RETRY_SECONDS.
+
+A loaded model can be replaced without downtime with ModelLoader.swap() (see model_swap.py).
+
+add_probes(app, *loaders) serves /livez (the process answers; never touches the model) and /readyz
+(200 once every loader is warm, 503 with each loader's state until then; with partial=True, once one
+is warm and the others have at least failed once, for services that answer without some models).
+"""
+import gc
+import io
+import os
+import threading
+import time
+from functools import lru_cache
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from ml_common.metrics import model_load, quiet
+
+# Load and warm up models in the background at startup (0: on the first request, as before)
+MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "1") not in ("0", "false", "False", "")
+# Warm-up passes through the inference path once loaded (0 disables)
+MODEL_WARMUP_RUNS = int(os.environ.get("MODEL_WARMUP_RUNS", "1"))
+# Seconds between background retries of a failed load
+MODEL_RETRY_SECONDS = float(os.environ.get("MODEL_RETRY_SECONDS", "30"))
+
+
+@lru_cache(maxsize=1)
+def warmup_jpeg(width: int = 1280, height: int = 960) -> bytes:
+    """A small photo-like JPEG for warm-ups: large enough for draft decoding, cheap to decode."""
+    from PIL import Image
+
+    img = Image.merge("RGB", [
+        Image.linear_gradient("L").resize((width, height)),
+        Image.linear_gradient("L").rotate(90).resize((width, height)),
+        Image.new("L", (width, height), 128),
+    ])
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+class ModelLoader:
+    """
+    Loads a model once, thread-safely, then warms it up: state goes idle -> loading -> warming ->
+    ready, or failed (with the error; the next get() tries again).
+    warmup(model) may call get() itself (it runs on the loading thread, which gets the model back),
+    except for models replaced with swap(), where get() still returns the old one while the new one warms.
+    version() (optional) names the model load() is about to load, e.g. its file's content hash.
+    """
+
+    def __init__(self, name: str, load, warmup=None, warmup_runs: int = MODEL_WARMUP_RUNS, version=None):
+        self.name = name
+        self._load = load
+        self._warmup = warmup
+        self._version = version
+        self.warmup_runs = max(0, int(warmup_runs))
+        self.state = "idle"
+        self.error: str | None = None
+        self.model = None
+        self.version: str | None = None
+        # (model, version), replaced in one assignment by swap()
+        self._active: tuple | None = None
+        self.info: dict = {}
+        self.attempts = 0
+        self.swaps = 0
+        self.last_swap: dict | None = None
+        self._swap_lock = threading.Lock()
+        self._failed_at: float | None = None
+        # Reentrant, so warm-up code that goes through get() on the loading thread does not deadlock
+        self._lock = threading.RLock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def settled(self) -> bool:
+        """Warm, or failed at least once (possibly retrying now)."""
+        return self.ready or self.state == "failed" or self.attempts > 1
+
+    def get(self):
+        """The model; waits for a load in progress, or loads it now (retrying a failed load)."""
+        if self.state == "ready":
+            return self.model
+        with self._lock:
+            if self.model is None:
+                self._load_and_warm()
+            return self.model
+
+    def get_versioned(self) -> tuple:
+        """(model, version) of the active model, read together (a swap between two reads would mix them)."""
+        active = self._active
+        if active is None:
+            self.get()
+            active = self._active or (self.model, self.version)
+        return active
+
+    def start(self):
+        """Load on a background thread, unless loading, loaded, or failed within MODEL_RETRY_SECONDS."""
+        if self.state in ("ready", "loading", "warming") or (self._thread is not None and self._thread.is_alive()):
+            return
+        if self._failed_at is not None and time.monotonic() - self._failed_at < MODEL_RETRY_SECONDS:
+            return
+        self._thread = threading.Thread(target=self._background_load, name=f"load-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _background_load(self):
+        try:
+            self.get()
+        except Exception:  # noqa: BLE001 - kept in state / error, reported by /readyz and /health
+            pass
+
+    def _load_and_warm(self):
+        self.attempts += 1
+        self.state, self.error = "loading", None
+        try:
+            # Set before the load, so results cached for this version are served while it runs
+            self.version = self._version() if self._version is not None else None
+            start = time.perf_counter()
+            with model_load(self.name):
+                model = self._load()
+            self.info["load_seconds"] = round(time.perf_counter() - start, 3)
+            if self._warmup is not None and self.warmup_runs:
+                self.state = "warming"
+                # Visible to warm-up code calling get() on this thread; other callers wait on the lock
+                self.model = model
+                self.info["warmup_seconds"] = self._warm(model)
+        except Exception as e:
+            self.model = None
+            self.state, self.error = "failed", str(e) or type(e).__name__
+            self._failed_at = time.monotonic()
+            raise
+        self.model = model
+        self._active = (model, self.version)
+        self._failed_at = None
+        self.state = "ready"
+
+    def _warm(self, model) -> float:
+        start = time.perf_counter()
+        # Warm-up stages stay out of the latency histograms
+        with quiet():
+            for _ in range(self.warmup_runs):
+                self._warmup(model)
+        return round(time.perf_counter() - start, 3)
+
+    @property
+    def swapping(self) -> bool:
+        return self._swap_lock.locked()
+
+    def swap(self, load, version: str | None = None, check=None, **details) -> dict:
+        """
+        Replace the ready model without downtime: load() a new one beside it and warm it up, run
+        check(old, new) if given (it raises to reject the new model, or returns a report), then switch
+        to it in one assignment. Requests that already got the old model finish on it, and it is freed
+        once they drop it. Returns the swap's report (also kept as last_swap); raises RuntimeError when
+        no model is ready yet or another swap is running, and the load or check error otherwise (the
+        old model stays active). details (e.g. the file) are added to the report.
+        """
+        if not self.ready:
+            raise RuntimeError(f"{self.name} has no model loaded yet")
+        if not self._swap_lock.acquire(blocking=False):
+            raise RuntimeError(f"A {self.name} model swap is already running")
+        try:
+            old, old_version = self._active
+            report = {
+                "state": "loading",
+                "version": version,
+                "previous_version": old_version,
+                **details,
+                "started_at": time.time(),
+            }
+            self.last_swap = report
+            try:
+                start = time.perf_counter()
+                with model_load(self.name):
+                    new = load()
+                report["load_seconds"] = round(time.perf_counter() - start, 3)
+                if self._warmup is not None and self.warmup_runs:
+                    report["state"] = "warming"
+                    report["warmup_seconds"] = self._warm(new)
+                if check is not None:
+                    report["state"] = "checking"
+                    with quiet():
+                        report["parity"] = check(old, new)
+            except Exception as e:
+                report.update(state="failed", message=str(e) or type(e).__name__)
+                raise
+            self._active = (new, version)
+            self.model, self.version = new, version
+            self.swaps += 1
+            report["state"] = "done"
+        finally:
+            self._swap_lock.release()
+        # Free the old model now if no request holds it (models often have reference cycles)
+        del old, new
+        gc.collect()
+        return report
+
+    def stats(self) -> dict:
+        out = {"state": self.state, **self.info}
+        if self.version is not None:
+            out["version"] = self.version
+        if self.error:
+            out["message"] = self.error
+        if self.last_swap is not None:
+            out["swaps"] = self.swaps
+            out["last_swap"] = self.last_swap
+        return out
+
+
+def preload(*loaders: ModelLoader):
+    """Start every loader in the background (call from the app lifespan); no-op with MODEL_PRELOAD=0."""
+    if MODEL_PRELOAD:
+        for loader in loaders:
+            loader.start()
+
+
+def add_probes(app: FastAPI, *loaders: ModelLoader, partial: bool = False):
+    """Serve /livez and /readyz (both async: they never wait for the inference pool or the model)."""
+
+    def is_ready() -> bool:
+        # With MODEL_PRELOAD=0 the models load on first use, so not having started yet is ready
+        if all(loader.ready or (loader.state == "idle" and not MODEL_PRELOAD) for loader in loaders):
+            return True
+        return partial and any(loader.ready for loader in loaders) and all(loader.settled for loader in loaders)
+
+    async def livez() -> dict:
+        return {"status": "alive"}
+
+    async def readyz():
+        # Retries failed loads (at most every MODEL_RETRY_SECONDS), also while partially ready
+        for loader in loaders:
+            if loader.state == "failed" or (loader.state == "idle" and MODEL_PRELOAD):
+                loader.start()
+        if is_ready():
+            return {"status": "ready", "models": {loader.name: loader.state for loader in loaders}}
+        states = {loader.state for loader in loaders}
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "failed" if "failed" in states else "loading",
+                "models": {loader.name: loader.stats() for loader in loaders},
+            },
+        )
+
+    app.add_api_route("/livez", livez, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/readyz", readyz, methods=["GET"], include_in_schema=False)
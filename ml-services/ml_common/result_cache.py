@@ -0,0 +1,158 @@
+"""
+Content-addressed result cache for the image services.
+Results are keyed by a hash of the uploaded bytes plus a variant string (model file, thresholds, mode,
+...), so the same photo re-sent by the backend's fallback chain or by a donor editing a post is answered
+without touching the model. An in-memory LRU with a TTL sits in front of an optional SQLite file that
+survives restarts (and can be shared by several services, since keys include the service name).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ml_common.metrics import count_cache_lookup
+
+# Purge expired / excess rows from the SQLite tier every this many writes
+_DISK_PURGE_EVERY = 256
+
+
+def file_fingerprint(path: str | None) -> str:
+    """Cheap identity of a model or data file (name, size, mtime); changes when the file is replaced."""
+    if not path:
+        return "-"
+    try:
+        st = os.stat(path)
+    except OSError:
+        return f"{os.path.basename(path)}:missing"
+    return f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class ResultCache:
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        disk_path: str | None = None,
+        disk_max_entries: int = 100_000,
+    ):
+        self.name = name
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self.disk_path = disk_path or None
+        self.disk_max_entries = disk_max_entries
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.enabled and self.disk_path:
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @classmethod
+    def from_env(cls, name: str) -> "ResultCache":
+        """Configure from RESULT_CACHE_SIZE (0 disables), RESULT_CACHE_TTL_SECONDS and RESULT_CACHE_PATH (SQLite tier)."""
+        return cls(
+            name,
+            max_entries=int(os.environ.get("RESULT_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "3600")),
+            disk_path=os.environ.get("RESULT_CACHE_PATH") or None,
+            disk_max_entries=int(os.environ.get("RESULT_CACHE_DISK_MAX_ENTRIES", "100000")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, content: bytes | bytearray | memoryview, variant: str = "") -> str:
+        """Cache key for uploaded bytes under a variant (model version, thresholds, options)."""
+        digest = hashlib.blake2b(content, digest_size=20).hexdigest()
+        return f"{self.name}:{variant}:{digest}"
+
+    def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    count_cache_lookup(self.name, "hit")
+                    return entry[1]
+                del self._memory[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM results WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.disk_hits += 1
+                    count_cache_lookup(self.name, "disk_hit")
+                    return value
+            self.misses += 1
+            count_cache_lookup(self.name, "miss")
+            return None
+
+    def put(self, key: str, value: dict):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+                self._writes += 1
+                if self._writes % _DISK_PURGE_EVERY == 0:
+                    self._purge_disk()
+
+    def _remember(self, key: str, expires_at: float, value: dict):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _purge_disk(self):
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        # Oldest-expiring rows go first when the file holds too many
+        self._db.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,),
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk": self.disk_path is not None and self._db is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+        }
+
+
+def variant(**parts) -> str:
+    """Stable variant string from keyword parts (model fingerprint, thresholds, options)."""
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
@@ -0,0 +1,117 @@
+"""
+Model backends with a Keras-like predict(x, batch_size=None, verbose=0), so services can serve an
+exported .tflite or .onnx model (see export.py) without importing TensorFlow/Keras.
+
+Backends: "keras" (tensorflow.keras load_model), "tflite" (tflite_runtime / ai_edge_litert, falling
+back to tensorflow.lite), "onnx" (onnxruntime), or "auto" to pick from the file extension.
+"""
+import os
+import threading
+
+import numpy as np
+
+BACKENDS = ("auto", "keras", "tflite", "onnx")
+EXTENSION_BACKENDS = {
+    ".h5": "keras",
+    ".hdf5": "keras",
+    ".keras": "keras",
+    ".tflite": "tflite",
+    ".onnx": "onnx",
+}
+
+
+def resolve_backend(model_path: str, backend: str = "auto") -> str:
+    backend = (backend or "auto").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}; use one of {', '.join(BACKENDS)}")
+    if backend != "auto":
+        return backend
+    ext = os.path.splitext(model_path)[1].lower()
+    if ext not in EXTENSION_BACKENDS:
+        raise ValueError(f"Cannot infer the backend from {model_path!r}; set it explicitly")
+    return EXTENSION_BACKENDS[ext]
+
+
+def import_tflite_interpreter():
+    """The lightest available TFLite Interpreter class (full TensorFlow only as a last resort)."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter behind predict(). The input is resized to the batch size on demand
+    (exported Keras models keep a dynamic batch dimension); int8/uint8 inputs and outputs are
+    (de)quantized here, so callers always pass and get float32.
+    """
+
+    def __init__(self, model_path: str, num_threads: int | None = None):
+        Interpreter = import_tflite_interpreter()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = int(self._input["shape"][0])
+        # An interpreter is not thread-safe; calls are serialized
+        self._lock = threading.Lock()
+
+    def _resize(self, batch: int):
+        shape = list(self._input["shape"])
+        shape[0] = batch
+        self.interpreter.resize_tensor_input(self._input["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = batch
+
+    def predict(self, x: np.ndarray, batch_size: int | None = None, verbose: int = 0) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if x.shape[0] != self._batch:
+                self._resize(x.shape[0])
+            dtype = self._input["dtype"]
+            if dtype != np.float32:
+                scale, zero_point = self._input["quantization"]
+                info = np.iinfo(dtype)
+                x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+            self.interpreter.set_tensor(self._input["index"], x)
+            self.interpreter.invoke()
+            out = self.interpreter.get_tensor(self._output["index"])
+            if out.dtype != np.float32:
+                scale, zero_point = self._output["quantization"]
+                out = (out.astype(np.float32) - zero_point) * scale
+            return out.copy()
+
+
+class OnnxModel:
+    """onnxruntime session behind predict(); sessions are thread-safe."""
+
+    def __init__(self, model_path: str, num_threads: int | None = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, x: np.ndarray, batch_size: int | None = None, verbose: int = 0) -> np.ndarray:
+        return self.session.run(None, {self._input_name: np.asarray(x, dtype=np.float32)})[0]
+
+
+def load_runtime_model(model_path: str, backend: str = "auto", num_threads: int | None = None):
+    """Load a model for predict(); only the chosen backend's runtime is imported."""
+    backend = resolve_backend(model_path, backend)
+    if backend == "keras":
+        from tensorflow.keras.models import load_model
+
+        return load_model(model_path)
+    if backend == "tflite":
+        return TFLiteModel(model_path, num_threads)
+    return OnnxModel(model_path, num_threads)
@@ -0,0 +1,54 @@
+"""
+Import modules from another service folder under private names.
+Every service has its own evaluate.py (and some share other module names), and they import their
+siblings by plain name ("from evaluate import ..."). Loading them side by side in one process
+(the gateway, the export tool) needs each service's modules resolved against its own folder.
+"""
+import importlib
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+ML_SERVICES_DIR = Path(__file__).resolve().parent.parent
+
+# sys.path and the shadowed sys.modules entries are process-wide: one service loads at a time (models
+# load on background threads side by side, and other threads may import meanwhile)
+_lock = threading.RLock()
+
+
+def load_service_modules(service: str, *names: str) -> SimpleNamespace:
+    """
+    Import names (e.g. "evaluate", "interpreter_pool") from ml-services/<service>/ and return them as
+    attributes. While loading, the service folder comes first on sys.path and any same-named module
+    already imported (another service's evaluate) is set aside; afterwards the modules stay registered
+    only as "<service>.<name>" aliases, so the next service gets its own copies.
+    """
+    service_dir = ML_SERVICES_DIR / service
+    if not (service_dir / f"{names[0]}.py").is_file():
+        raise FileNotFoundError(f"{service_dir / names[0]}.py not found")
+    prefix = f"_service_{service.replace('-', '_')}"
+    with _lock:
+        saved = {name: sys.modules.pop(name) for name in list(sys.modules) if _is_local(name, service_dir, names)}
+        sys.path.insert(0, str(service_dir))
+        loaded = {}
+        try:
+            for name in names:
+                loaded[name] = importlib.import_module(name)
+        finally:
+            sys.path.remove(str(service_dir))
+            # Drop every module imported from this folder (including indirect ones like model_builder)
+            for name in [n for n, m in list(sys.modules.items()) if _from_dir(m, service_dir)]:
+                sys.modules[f"{prefix}.{name}"] = sys.modules.pop(name)
+            sys.modules.update(saved)
+    return SimpleNamespace(**loaded)
+
+
+def _from_dir(module, directory: Path) -> bool:
+    path = getattr(module, "__file__", None)
+    return bool(path) and Path(path).resolve().parent == directory
+
+
+def _is_local(name: str, service_dir: Path, names) -> bool:
+    """Modules that would shadow this service's: same top-level name as a service file, from elsewhere."""
+    return "." not in name and (name in names or (service_dir / f"{name}.py").is_file())
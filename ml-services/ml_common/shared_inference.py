@@ -0,0 +1,392 @@
+"""
+One inference process per host for services scaled with uvicorn --workers N.
+
+Each HTTP worker otherwise loads its own copy of the model and runtime (hundreds of MB for
+InceptionV3 + TensorFlow). With SHARED_INFERENCE=1, a service's load_model() returns a SharedModel
+instead: the worker still reads, decodes and preprocesses uploads, and predict(x) hands the tensor to
+an inference process that owns the only copy of the model. The first worker that needs it starts
+that process (one per SHARED_INFERENCE_PROCESSES index; workers are spread over them by pid), the
+others wait for it and connect; workers restarted by uvicorn reconnect to the running one. It exits
+once no worker has been connected for SHARED_INFERENCE_IDLE_SECONDS.
+
+Tensors never go through the socket: each worker owns a ring of SHARED_INFERENCE_SLOTS slots in one
+shared-memory segment, with one Unix socket connection per slot. predict() takes a free slot, writes
+the tensor into it and sends only its shape and dtype; the inference process runs the model on an
+ndarray view of the slot (no copy) and writes the output back into the same slot. When every slot is
+in flight, the worker's threads wait for one; batches larger than a slot are split.
+
+The inference process imports only the module holding the loader (the service's evaluate.py), not its
+main.py with the app, pools and background load. Errors raised by the model there come back to the
+worker as RuntimeError (500), so they are not mistaken for a bad upload; only a missing model file at
+start-up keeps its type (FileNotFoundError, 503 as with a local model).
+
+Run by the workers as: python -m ml_common.shared_inference <service folder> <module.loader> <socket path> [args]
+"""
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import queue
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, util
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ml_common.services import ML_SERVICES_DIR, load_service_modules
+
+# Serve the model from one inference process per host instead of loading it in every worker
+SHARED_INFERENCE = os.environ.get("SHARED_INFERENCE", "0") not in ("0", "false", "False", "")
+# Inference processes per model, each with one copy of it
+SHARED_INFERENCE_PROCESSES = int(os.environ.get("SHARED_INFERENCE_PROCESSES", "1"))
+# Model calls running at once in each inference process
+SHARED_INFERENCE_THREADS = int(os.environ.get("SHARED_INFERENCE_THREADS", "1"))
+# Slots in each worker's ring (requests in flight per worker) and the size of one slot
+SHARED_INFERENCE_SLOTS = int(os.environ.get("SHARED_INFERENCE_SLOTS", "4"))
+SHARED_INFERENCE_SLOT_MB = float(os.environ.get("SHARED_INFERENCE_SLOT_MB", "4"))
+# Unix sockets, lock and status files
+SHARED_INFERENCE_DIR = os.environ.get("SHARED_INFERENCE_DIR") or os.path.join(tempfile.gettempdir(), "resq-inference")
+# An inference process exits after this long without connected workers
+SHARED_INFERENCE_IDLE_SECONDS = float(os.environ.get("SHARED_INFERENCE_IDLE_SECONDS", "60"))
+# How long a worker waits for a new inference process to load its model
+SHARED_INFERENCE_START_TIMEOUT = float(os.environ.get("SHARED_INFERENCE_START_TIMEOUT", "600"))
+
+_HEADER = struct.Struct("!I")
+# Start-up errors passed through by type, so services map them to the same status as a local model. Any
+# other error in the inference process is a server error, whatever its type there: a ValueError from the
+# model is not a bad upload (uploads are validated in the worker, before the tensor is sent)
+_ERRORS = {"FileNotFoundError": FileNotFoundError}
+
+
+def _send(sock: socket.socket, message: dict):
+    data = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Inference connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def _recv(sock: socket.socket) -> dict:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+def _error(message: dict) -> Exception:
+    error_type = _ERRORS.get(message.get("type"))
+    if error_type is not None:
+        return error_type(message["error"])
+    return RuntimeError(f"Inference process: {message.get('type', 'Error')}: {message['error']}")
+
+
+def _attach(name: str) -> SharedMemory:
+    """Open a worker's ring without registering it for cleanup here (the worker unlinks it)."""
+    try:
+        return SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class InferenceHost:
+    """Runs one model for the slots of every connected worker's ring."""
+
+    def __init__(self, model, socket_path: str, threads: int = SHARED_INFERENCE_THREADS,
+                 idle_seconds: float = SHARED_INFERENCE_IDLE_SECONDS):
+        self.model = model
+        self.socket_path = socket_path
+        self.idle_seconds = idle_seconds
+        self._running = threading.BoundedSemaphore(max(1, threads))
+        self._lock = threading.Lock()
+        # Ring name -> [SharedMemory, connected slots]
+        self._rings: dict[str, list] = {}
+        self._connections = 0
+        self._idle_since = time.monotonic()
+
+    def serve(self):
+        """Accept slot connections until idle; the socket only appears once the model is loaded."""
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        pending = f"{self.socket_path}.{os.getpid()}"
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(pending)
+        listener.bind(pending)
+        listener.listen(64)
+        os.replace(pending, self.socket_path)
+        # Wakes up every second to check for idleness
+        listener.settimeout(1.0)
+        try:
+            while not self._idle():
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                with self._lock:
+                    self._connections += 1
+                threading.Thread(target=self._serve_slot, args=(conn,), name="slot", daemon=True).start()
+        finally:
+            listener.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.socket_path)
+
+    def _idle(self) -> bool:
+        with self._lock:
+            return not self._connections and time.monotonic() - self._idle_since > self.idle_seconds
+
+    def _serve_slot(self, conn: socket.socket):
+        """One slot of a worker's ring: run the model on each tensor written into it."""
+        ring_name = view = None
+        try:
+            hello = _recv(conn)
+            ring = self._open_ring(hello["ring"])
+            ring_name = hello["ring"]
+            view = ring.buf[hello["offset"]:hello["offset"] + hello["size"]]
+            _send(conn, {"pid": os.getpid()})
+            while True:
+                request = _recv(conn)
+                try:
+                    reply = self._predict(view, request)
+                except Exception as e:  # noqa: BLE001 - raised in the worker that sent the tensor
+                    reply = {"type": type(e).__name__, "error": str(e) or type(e).__name__}
+                _send(conn, reply)
+        except OSError:
+            # The worker closed its ring or exited
+            pass
+        finally:
+            conn.close()
+            if view is not None:
+                view.release()
+            if ring_name is not None:
+                self._close_ring(ring_name)
+            with self._lock:
+                self._connections -= 1
+                if not self._connections:
+                    self._idle_since = time.monotonic()
+
+    def _predict(self, view: memoryview, request: dict) -> dict:
+        x = np.ndarray(request["shape"], dtype=request["dtype"], buffer=view)
+        with self._running:
+            out = np.asarray(self.model.predict(x, verbose=0))
+        del x
+        if out.nbytes > len(view):
+            raise RuntimeError(f"Model output ({out.nbytes} bytes) does not fit in a {len(view)}-byte slot")
+        np.ndarray(out.shape, dtype=out.dtype, buffer=view)[...] = out
+        return {"shape": list(out.shape), "dtype": out.dtype.str}
+
+    def _open_ring(self, name: str) -> SharedMemory:
+        with self._lock:
+            entry = self._rings.get(name)
+            if entry is None:
+                entry = self._rings[name] = [_attach(name), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _close_ring(self, name: str):
+        with self._lock:
+            entry = self._rings[name]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._rings[name]
+                entry[0].close()
+
+
+class _Slot:
+    def __init__(self, index: int, offset: int, view: memoryview):
+        self.index = index
+        self.offset = offset
+        self.view = view
+        self.sock: socket.socket | None = None
+
+
+class SharedModel:
+    """
+    Keras-like predict(x, batch_size=None, verbose=0) served by an inference process (see the module
+    docstring). loader ("evaluate.load_local_model") names the module in the service folder and the
+    function in it that loads the model locally, called with args (strings); key (model version, ...)
+    keeps differently configured workers on separate processes.
+    """
+
+    def __init__(self, service: str, loader: str, key: str = "", args: tuple[str, ...] = (),
+                 slots: int = SHARED_INFERENCE_SLOTS, slot_mb: float = SHARED_INFERENCE_SLOT_MB):
+        self.service = service
+        self.loader = loader
+        self.args = tuple(args)
+        digest = hashlib.sha256(f"{service}:{loader}:{args}:{key}".encode()).hexdigest()[:12]
+        index = os.getpid() % max(1, SHARED_INFERENCE_PROCESSES)
+        self.socket_path = os.path.join(SHARED_INFERENCE_DIR, f"{service}-{digest}-{index}.sock")
+        self.slot_bytes = max(1, int(slot_mb * 1024 * 1024))
+        self.host_pid: int | None = None
+        self.reconnects = 0
+        self._ring = SharedMemory(create=True, size=max(1, slots) * self.slot_bytes)
+        self._all = [
+            _Slot(i, i * self.slot_bytes, self._ring.buf[i * self.slot_bytes:(i + 1) * self.slot_bytes])
+            for i in range(max(1, slots))
+        ]
+        self._free: queue.Queue[_Slot] = queue.Queue()
+        # When this model is garbage collected (e.g. replaced by a swap) or at exit, also in
+        # multiprocessing children; services close it from their lifespan too
+        self._finalizer = util.Finalize(self, _release, args=(self._ring, self._all), exitpriority=10)
+        try:
+            for slot in self._all:
+                self._connect(slot)
+                self._free.put(slot)
+        except BaseException:
+            self.close()
+            raise
+
+    def _connect(self, slot: _Slot):
+        sock = connect_host(self.socket_path, self.service, self.loader, self.args)
+        try:
+            _send(sock, {"ring": self._ring.name, "offset": slot.offset, "size": self.slot_bytes})
+            self.host_pid = _recv(sock)["pid"]
+        except OSError:
+            sock.close()
+            raise
+        slot.sock = sock
+
+    def predict(self, x, batch_size: int | None = None, verbose: int = 0) -> np.ndarray:
+        x = np.ascontiguousarray(x)
+        if x.nbytes > self.slot_bytes and x.ndim and len(x) > 1:
+            rows = max(1, self.slot_bytes // (x.nbytes // len(x)))
+            return np.concatenate([self.predict(x[i:i + rows]) for i in range(0, len(x), rows)])
+        if x.nbytes > self.slot_bytes:
+            raise RuntimeError(
+                f"Input of {x.nbytes} bytes does not fit in a {self.slot_bytes}-byte slot; raise SHARED_INFERENCE_SLOT_MB"
+            )
+        slot = self._free.get()
+        try:
+            return self._call(slot, x)
+        finally:
+            self._free.put(slot)
+
+    def _call(self, slot: _Slot, x: np.ndarray) -> np.ndarray:
+        np.ndarray(x.shape, dtype=x.dtype, buffer=slot.view)[...] = x
+        request = {"shape": list(x.shape), "dtype": x.dtype.str}
+        try:
+            _send(slot.sock, request)
+            reply = _recv(slot.sock)
+        except OSError:
+            # The inference process went away (crashed, or exited while idle): start or find another, once
+            slot.sock.close()
+            self._connect(slot)
+            self.reconnects += 1
+            _send(slot.sock, request)
+            reply = _recv(slot.sock)
+        if "error" in reply:
+            raise _error(reply)
+        return np.ndarray(reply["shape"], dtype=reply["dtype"], buffer=slot.view).copy()
+
+    def stats(self) -> dict:
+        return {
+            "host_pid": self.host_pid,
+            "socket": self.socket_path,
+            "slots": len(self._all),
+            "slots_free": self._free.qsize(),
+            "slot_mb": round(self.slot_bytes / (1024 * 1024), 2),
+            "reconnects": self.reconnects,
+        }
+
+    def close(self):
+        """Disconnect and unlink the ring (once; the inference process exits when no worker is left)."""
+        self._finalizer()
+
+
+def _release(ring: SharedMemory, slots: list[_Slot]):
+    for slot in slots:
+        if slot.sock is not None:
+            slot.sock.close()
+        slot.view.release()
+    ring.close()
+    with contextlib.suppress(FileNotFoundError):
+        ring.unlink()
+
+
+def _dial(socket_path: str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def connect_host(socket_path: str, service: str, loader: str, args: tuple[str, ...] = ()) -> socket.socket:
+    """Connect to the inference process, starting it if none is running (one worker starts it, the rest wait)."""
+    with contextlib.suppress(OSError):
+        return _dial(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    with open(f"{socket_path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Another worker may have started it while this one waited for the lock
+        with contextlib.suppress(OSError):
+            return _dial(socket_path)
+        return _start_host(socket_path, service, loader, args)
+
+
+def _start_host(socket_path: str, service: str, loader: str, args: tuple[str, ...]) -> socket.socket:
+    status_path = f"{socket_path}.failed"
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(status_path)
+    # Same interpreter and environment as the worker; logs go to the worker's stderr
+    process = subprocess.Popen(
+        [sys.executable, "-m", "ml_common.shared_inference", service, loader, socket_path, *args],
+        cwd=ML_SERVICES_DIR,
+    )
+    deadline = time.monotonic() + SHARED_INFERENCE_START_TIMEOUT
+    while True:
+        with contextlib.suppress(OSError):
+            return _dial(socket_path)
+        if process.poll() is not None:
+            try:
+                with open(status_path) as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                status = {"error": f"Inference process for {service} exited with code {process.returncode}"}
+            raise _error(status)
+        if time.monotonic() > deadline:
+            process.kill()
+            raise TimeoutError(f"Inference process for {service} not ready after {SHARED_INFERENCE_START_TIMEOUT:.0f}s")
+        time.sleep(0.05)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference process for SHARED_INFERENCE=1 (started by the workers)")
+    parser.add_argument("service", help="Service folder under ml-services/, e.g. food-image-recognition")
+    parser.add_argument("loader", help="module.function in the service folder that loads the model (evaluate.load_local_model)")
+    parser.add_argument("socket", help="Unix socket to serve on")
+    parser.add_argument("args", nargs="*", help="Arguments for the loader (e.g. the model path)")
+    args = parser.parse_args(argv)
+    # Stopped along with the workers (same process group): remove the socket on the way out
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        module, _, function = args.loader.rpartition(".")
+        load = getattr(getattr(load_service_modules(args.service, module), module), function)
+        model = load(*args.args)
+    except Exception as e:
+        # Read by the worker that started this process, so it raises the same error
+        with open(f"{args.socket}.failed", "w") as f:
+            json.dump({"type": type(e).__name__, "error": str(e) or type(e).__name__}, f)
+        raise
+    print(f"Serving {args.service} on {args.socket} (pid {os.getpid()})", file=sys.stderr, flush=True)
+    InferenceHost(model, args.socket).serve()
+
+
+if __name__ == "__main__":
+    main()
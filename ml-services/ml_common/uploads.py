@@ -0,0 +1,96 @@
+"""
+Bounded, in-memory reading of uploaded files.
+
+The multipart parser receives the whole request body before the endpoint runs, so the size limit is
+enforced in front of it: limit_uploads(app) adds an ASGI guard that answers 413 from the Content-Length
+header, or as soon as a body streamed without one goes past the limit, before any of it is spooled.
+It also raises the parser's in-memory spool to the limit, so an accepted photo never goes through a
+temp file. read_upload() then copies the file part into memory in chunks, rejecting it past the limit
+(the body limit allows for the multipart framing around the file), so the bytes are decoded straight
+from memory.
+"""
+import os
+
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+
+from ml_common.metrics import stage
+
+# Max upload size in bytes (default 10 MB); larger uploads get 413
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+# Multipart boundaries, part headers and small form fields around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large (max {max_bytes // 1024} KB)")
+
+
+async def read_upload(
+    file: UploadFile,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> bytearray:
+    """Read an upload into memory in chunks; raises 413 past max_bytes and 400 if empty."""
+    size = getattr(file, "size", None)
+    if size is not None and size > max_bytes:
+        raise _too_large(max_bytes)
+    data = bytearray()
+    with stage("upload"):
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            if len(data) + len(chunk) > max_bytes:
+                raise _too_large(max_bytes)
+            data += chunk
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty file")
+    return data
+
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI guard: 413 for request bodies past max_bytes (per path in path_limits, e.g. a video
+    endpoint), from Content-Length before the body is read, or while a body without one streams in.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, path_limits: dict[str, int] | None = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await JSONResponse({"detail": _too_large(max_bytes).detail}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Re-raised by FastAPI's body parsing and answered by its exception handler
+                    raise _too_large(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def limit_uploads(app: FastAPI, max_bytes: int = MAX_UPLOAD_BYTES, path_limits: dict[str, int] | None = None):
+    """
+    Reject oversized request bodies before they are parsed, and keep accepted uploads of up to
+    max_bytes in memory (Starlette spools file parts past 1 MB to a temp file by default).
+    """
+    app.add_middleware(UploadLimitMiddleware, max_bytes=max_bytes, path_limits=path_limits)
+    MultiPartParser.spool_max_size = max(MultiPartParser.spool_max_size, max_bytes + MULTIPART_OVERHEAD_BYTES)
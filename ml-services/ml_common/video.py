@@ -0,0 +1,262 @@
+"""
+Frame sampling and early exit for short-clip (/evaluate-video) endpoints.
+
+FrameSampler decodes an uploaded clip with PyAV straight from the spooled upload file, packet by
+packet, so the clip is never held in memory. Only the frames at the sampling times are converted to
+RGB, and they are scaled in the same swscale pass to about DRAFT_OVERSAMPLE times the model input,
+as draft decoding does for photos. Rotation metadata (portrait phone clips) is applied.
+
+Frames are scored a batch at a time, and each frame's verdict goes into a VerdictVote. Scoring stops
+once the leading verdict is a majority at the requested confidence (a one-sided Wilson lower bound
+above 1/2), so a clip where every frame agrees is settled after min_frames frames.
+"""
+import math
+import os
+from collections import Counter
+from statistics import NormalDist
+from typing import Awaitable, BinaryIO, Callable, Hashable
+
+from fastapi import HTTPException, UploadFile
+
+from ml_common.images import DRAFT_OVERSAMPLE
+from ml_common.inference import InferencePool, Ticket
+from ml_common.metrics import stage
+
+# Max video upload size in bytes (default 50 MB); larger uploads get 413
+MAX_VIDEO_UPLOAD_BYTES = int(os.environ.get("MAX_VIDEO_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Frames sampled per second of video, and at most this many per clip (long clips are sampled more sparsely)
+VIDEO_SAMPLE_FPS = float(os.environ.get("VIDEO_SAMPLE_FPS", "2"))
+VIDEO_MAX_FRAMES = int(os.environ.get("VIDEO_MAX_FRAMES", "32"))
+# Frames decoded and scored together
+VIDEO_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", "4"))
+# Early exit: frames scored before stopping is considered, and the confidence the majority verdict must reach
+VIDEO_MIN_FRAMES = int(os.environ.get("VIDEO_MIN_FRAMES", "4"))
+VIDEO_EARLY_EXIT_CONFIDENCE = float(os.environ.get("VIDEO_EARLY_EXIT_CONFIDENCE", "0.95"))
+
+# Display-matrix rotation (degrees counter-clockwise) -> PIL transpose method
+_ROTATION_TRANSPOSE = {90: 2, 180: 3, 270: 4}
+
+
+def check_video_upload(file: UploadFile, max_bytes: int = MAX_VIDEO_UPLOAD_BYTES) -> BinaryIO:
+    """The upload's spooled file, rewound; 400 unless it is a video, 413 past max_bytes."""
+    if not file.content_type or not file.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes // (1024 * 1024)} MB)")
+    if not file.size:
+        raise HTTPException(status_code=400, detail="Empty file")
+    file.file.seek(0)
+    return file.file
+
+
+class FrameSampler:
+    """
+    Sampled RGB frames (PIL images) from a video file or file-like object, decoded lazily.
+    min_size (width, height) is the model input; frames are scaled down towards it while converting.
+    Not thread-safe: take() may be called from different threads, but one at a time.
+    """
+
+    def __init__(
+        self,
+        source: BinaryIO | str,
+        sample_fps: float = VIDEO_SAMPLE_FPS,
+        max_frames: int = VIDEO_MAX_FRAMES,
+        min_size: tuple[int, int] | None = None,
+    ):
+        import av
+
+        try:
+            self.container = av.open(source, mode="r")
+        except av.FFmpegError as e:
+            raise ValueError(f"Could not read video: {e}") from e
+        if not self.container.streams.video:
+            self.container.close()
+            raise ValueError("Could not read video: no video stream")
+        self.stream = self.container.streams.video[0]
+        # Frame-level threading in the decoder; only sampled frames are converted, but all must be decoded
+        self.stream.thread_type = "AUTO"
+        self.max_frames = max(1, int(max_frames))
+        self.min_size = min_size
+        duration = self._duration()
+        interval = 1.0 / max(sample_fps, 1e-6)
+        if duration:
+            # Spread the samples over the whole clip when it is longer than max_frames allows
+            interval = max(interval, duration / self.max_frames)
+        self.interval = interval
+        self.duration = duration
+        self.sampled = 0
+        self.decoded = 0
+        # Set once the stream has ended (or broke off, for a truncated clip)
+        self.exhausted = False
+        self._next_time = 0.0
+        # A sampled frame decoded ahead by has_more(), returned by the next take()
+        self._pending = None
+        self._frames = self.container.decode(self.stream)
+
+    def _duration(self) -> float | None:
+        if self.stream.duration is not None and self.stream.time_base is not None:
+            return float(self.stream.duration * self.stream.time_base)
+        if self.container.duration is not None:
+            return self.container.duration / 1_000_000
+        return None
+
+    def _frame_time(self, frame) -> float:
+        if frame.time is not None:
+            return frame.time
+        rate = self.stream.average_rate
+        return self.decoded / float(rate) if rate else float(self.decoded)
+
+    def _to_image(self, frame):
+        width, height = frame.width, frame.height
+        if self.min_size:
+            # Leave DRAFT_OVERSAMPLE x the input so the model's own resize still averages pixels; the
+            # longer target side is used for both axes so it holds for rotated frames too
+            side = max(self.min_size) * DRAFT_OVERSAMPLE
+            scale = min(1.0, max(side / width, side / height))
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        img = frame.to_image(width=width, height=height)
+        transpose = _ROTATION_TRANSPOSE.get(round(getattr(frame, "rotation", 0) or 0) % 360)
+        return img.transpose(transpose) if transpose is not None else img
+
+    def _next_sample(self):
+        """Decode up to the next frame at a sampling time; None (and exhausted) at the end of the stream."""
+        while True:
+            frame = next(self._frames, None)
+            if frame is None:
+                self.exhausted = True
+                return None
+            self.decoded += 1
+            t = self._frame_time(frame)
+            if t + 1e-6 >= self._next_time:
+                self._next_time = t + self.interval
+                return self._to_image(frame)
+
+    def take(self, n: int) -> list:
+        """Decode up to n more sampled frames (fewer at the end of the clip or past max_frames)."""
+        import av
+
+        images = []
+        with stage("decode"):
+            try:
+                while len(images) < n and self.sampled < self.max_frames:
+                    image, self._pending = self._pending or self._next_sample(), None
+                    if image is None:
+                        break
+                    images.append(image)
+                    self.sampled += 1
+            except av.FFmpegError as e:
+                if not images and not self.sampled:
+                    raise ValueError(f"Could not read video: {e}") from e
+                # A truncated clip still yields the frames before the damage
+                self.exhausted = True
+                self.max_frames = self.sampled + len(images)
+        return images
+
+    def has_more(self) -> bool:
+        """
+        Whether take() would return another frame. Decodes ahead to the next sampled frame (kept for
+        that take()), since a clip whose last frame was just taken has not hit the end of the stream yet.
+        """
+        import av
+
+        if self.sampled >= self.max_frames:
+            return False
+        if self._pending is None and not self.exhausted:
+            with stage("decode"):
+                try:
+                    self._pending = self._next_sample()
+                except av.FFmpegError:
+                    self.exhausted = True
+        return self._pending is not None
+
+    def close(self):
+        self.container.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> dict:
+        return {
+            "frames_decoded": self.decoded,
+            "frames_sampled": self.sampled,
+            "sample_interval_seconds": round(self.interval, 3),
+            "duration_seconds": round(self.duration, 2) if self.duration else None,
+        }
+
+
+class VerdictVote:
+    """Per-frame verdicts; confident() once the leading one is a majority at the given confidence."""
+
+    def __init__(self, min_frames: int = VIDEO_MIN_FRAMES, confidence: float = VIDEO_EARLY_EXIT_CONFIDENCE):
+        self.min_frames = max(1, int(min_frames))
+        self.z = NormalDist().inv_cdf(confidence)
+        self.counts: Counter = Counter()
+
+    def add(self, verdict: Hashable):
+        self.counts[verdict] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def leader(self) -> Hashable | None:
+        return self.counts.most_common(1)[0][0] if self.counts else None
+
+    def lower_bound(self) -> float:
+        """One-sided Wilson score lower bound of the leading verdict's share of frames."""
+        n = self.total
+        if not n:
+            return 0.0
+        p = self.counts[self.leader] / n
+        z2 = self.z * self.z
+        centre = p + z2 / (2 * n)
+        margin = self.z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+        return (centre - margin) / (1 + z2 / n)
+
+    def confident(self) -> bool:
+        return self.total >= self.min_frames and self.lower_bound() > 0.5
+
+
+async def score_frames(
+    pool: InferencePool,
+    sampler: FrameSampler,
+    score_batch: Callable[[list], Awaitable[list]],
+    verdict: Callable[[object], Hashable],
+    ticket: Ticket | None = None,
+    batch_size: int = VIDEO_BATCH_SIZE,
+    vote: VerdictVote | None = None,
+) -> tuple[list, dict]:
+    """
+    Decode the clip a batch at a time on the pool and score each batch with score_batch(images) ->
+    one result per image, until the clip ends, max_frames is reached, or the vote is confident.
+    The clip is one admitted request (one ticket), so score_batch should run the batch in one pool call
+    rather than fan frames out over several workers.
+    Returns (per-frame results, summary with frame counts and whether it stopped early).
+    """
+    vote = vote or VerdictVote()
+    results = []
+    early_exit = False
+    while True:
+        images = await pool.run(sampler.take, max(1, batch_size), ticket=ticket)
+        if not images:
+            break
+        batch = await score_batch(images)
+        for result in batch:
+            vote.add(verdict(result))
+        results.extend(batch)
+        if vote.confident():
+            # Early only when the clip had frames left to score, not when the last batch ended it
+            early_exit = await pool.run(sampler.has_more, ticket=ticket)
+            break
+    if not results:
+        raise ValueError("Could not read video: no frames decoded")
+    return results, {
+        **sampler.stats(),
+        "frames_scored": len(results),
+        "early_exit": early_exit,
+        "agreement": round(vote.counts[vote.leader] / vote.total, 3),
+    }